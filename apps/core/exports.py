@@ -0,0 +1,38 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """ 'Arquivo' falso: o csv.writer escreve e nós devolvemos a linha direto para a resposta. """
+    def write(self, value):
+        return value
+
+
+def stream_csv(filename, header, rows):
+    """
+    Exportação em CSV via StreamingHttpResponse.
+    'rows' deve ser um iterável preguiçoso (Ex: queryset.values_list().iterator(chunk_size=...))
+    para que a memória fique constante independente da quantidade de linhas.
+
+    Usamos ';' e BOM UTF-8 para o Excel em português abrir com acentos e colunas corretas.
+    """
+    writer = csv.writer(_Echo(), delimiter=';')
+
+    def generate():
+        yield '\ufeff' + writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def money(value):
+    """ Formata Decimal no padrão brasileiro de planilha (vírgula decimal). """
+    if value is None:
+        return ''
+    return f"{value:.2f}".replace('.', ',')
@@ -0,0 +1,102 @@
+import base64
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class KeysetPage:
+    """
+    Uma "página" da paginação por cursor (keyset).
+    Não sabe quantas páginas existem (isso exigiria um COUNT(*) na tabela inteira),
+    apenas se existe uma próxima e qual é o cursor para buscá-la.
+    """
+    def __init__(self, object_list, next_cursor, next_url):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, size):
+    """ Devolve a lista de valores do cursor ou None se ele for inválido/adulterado. """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _resolve(obj, path):
+    # Suporta campos relacionados na ordenação (Ex: 'entidade__nome_razao_social')
+    for attr in path.split('__'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _after_cursor_q(ordering, values):
+    """
+    Monta o filtro "depois do cursor" para uma ordenação composta:
+    (a > va) OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc) ...
+    Com isso o banco usa o índice e pula direto para a próxima página,
+    sem o OFFSET que fica mais lento a cada página.
+    """
+    condition = Q()
+    equal_prefix = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+        equal_prefix &= Q(**{name: value})
+    return condition
+
+
+def paginate_keyset(request, queryset, ordering, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Pagina um queryset por cursor (keyset pagination).
+
+    - 'ordering' deve terminar em um campo único (normalmente 'id' ou '-id')
+      para que o cursor seja determinístico mesmo com valores repetidos.
+    - O cursor vem em ?cursor=... e os demais filtros da URL são preservados
+      no link da próxima página (usado pelo "scroll infinito" do HTMX).
+    """
+    queryset = queryset.order_by(*ordering)
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        values = _decode_cursor(cursor, len(ordering))
+        if values is not None:
+            queryset = queryset.filter(_after_cursor_q(ordering, values))
+
+    # Busca 1 registro a mais só para saber se existe próxima página
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = _encode_cursor([_resolve(last, f.lstrip('-')) for f in ordering])
+
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+
+    return KeysetPage(rows, next_cursor, next_url)
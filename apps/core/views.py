@@ -3,6 +3,9 @@ from django.db.models import Sum
 from vehicles.models import Vehicle
 from financial.models import Ledger
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.views.static import serve
+from vehicles.photos import THUMBNAIL_DIR
 
 @login_required
 def dashboard(request):
@@ -21,4 +24,17 @@ def dashboard(request):
         'carros_disponiveis': carros_disponiveis,
         'a_receber': a_receber,
     }
-    return render(request, 'core/dashboard.html', context)
\ No newline at end of file
+    return render(request, 'core/dashboard.html', context)
+
+
+@login_required
+def serve_media(request, path):
+    """
+    Entrega os arquivos de MEDIA_ROOT (com If-Modified-Since/304).
+    As miniaturas têm o hash do conteúdo no nome, então nunca mudam:
+    o navegador pode guardá-las por 1 ano sem revalidar.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(THUMBNAIL_DIR + '/'):
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
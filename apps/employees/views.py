@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from core.pagination import paginate_keyset
 from .models import Employee
 from .forms import EmployeeForm
 
@@ -8,9 +9,16 @@ from .forms import EmployeeForm
 def employee_list(request):
     employees = Employee.objects.select_related(
         'entidade', 'usuario_sistema'
-    ).order_by('entidade__nome_razao_social')
-    
-    return render(request, 'employees/employee_list.html', {'employees': employees})
+    )
+
+    page = paginate_keyset(request, employees, ordering=['entidade__nome_razao_social', 'id'])
+    context = {'employees': page, 'page': page}
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'employees/partials/employee_table_rows.html', context)
+
+    return render(request, 'employees/employee_list.html', context)
 
 @login_required
 def employee_create(request):
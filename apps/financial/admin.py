@@ -1,9 +1,26 @@
 from django.contrib import admin
-from .models import FinancialAccount, ChartOfAccounts, Ledger, Installment
+from .models import (
+    FinancialAccount, ChartOfAccounts, Ledger, Installment, AccountBalanceCheckpoint, BankStatementLine, MonthlyAccountTotal,
+    JournalEntry, JournalLine, JournalPeriod,
+)
 
 @admin.register(FinancialAccount)
 class FinancialAccountAdmin(admin.ModelAdmin):
-    list_display = ('name', 'account_type', 'balance')
+    list_display = ('name', 'account_type', 'opening_balance', 'balance')
+    # O saldo só muda pelas baixas (ver financial.services.apply_balance_delta)
+    readonly_fields = ('balance',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # Depois de criada, mudar o saldo inicial desconciliaria a conta
+        if obj:
+            return ('balance', 'opening_balance')
+        return self.readonly_fields
+
+@admin.register(AccountBalanceCheckpoint)
+class AccountBalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('account', 'date', 'balance', 'created_at')
+    list_filter = ('account',)
+    date_hierarchy = 'date'
 
 @admin.register(ChartOfAccounts)
 class ChartOfAccountsAdmin(admin.ModelAdmin):
@@ -14,9 +31,16 @@ class ChartOfAccountsAdmin(admin.ModelAdmin):
     search_fields = ('name', 'code')
 
 class InstallmentInline(admin.TabularInline):
+    # Só consulta: parcelas nascem/mudam pelos serviços (settle_ledger, generate_installments),
+    # que mantêm paid_total/installment_count, saldo da conta, DRE e diário na mesma transação
     model = Installment
-    extra = 1
-    fields = ('installment_number', 'due_date', 'value', 'pay_date', 'paid_value', 'financial_account')
+    fields = ('installment_number', 'due_date', 'value', 'interest', 'pay_date', 'paid_value', 'financial_account', 'payment_method')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Ledger)
 class LedgerAdmin(admin.ModelAdmin):
@@ -24,4 +48,60 @@ class LedgerAdmin(admin.ModelAdmin):
     list_filter = ('transaction_type', 'status', 'chart_of_accounts')
     search_fields = ('description', 'entity__nome_razao_social')
     autocomplete_fields = ['entity', 'vehicle', 'chart_of_accounts']
-    inlines = [InstallmentInline]
\ No newline at end of file
+    inlines = [InstallmentInline]
+
+@admin.register(BankStatementLine)
+class BankStatementLineAdmin(admin.ModelAdmin):
+    list_display = ('date', 'account', 'description', 'amount', 'status', 'ledger')
+    list_filter = ('account', 'status')
+    search_fields = ('description', 'document', 'fitid')
+    date_hierarchy = 'date'
+    # A baixa só acontece pela tela de conciliação (financial.bank_import.settle_bank_lines)
+    readonly_fields = ('account', 'fitid', 'date', 'amount', 'description', 'document', 'status', 'ledger', 'error')
+
+@admin.register(MonthlyAccountTotal)
+class MonthlyAccountTotalAdmin(admin.ModelAdmin):
+    list_display = ('month', 'chart_of_accounts', 'inflow', 'outflow', 'movements')
+    list_filter = ('month',)
+    # Mantido por financial.dre (baixas) e pelo comando rebuild_monthly_totals
+    readonly_fields = ('chart_of_accounts', 'month', 'inflow', 'outflow', 'movements')
+
+
+class JournalLineInline(admin.TabularInline):
+    model = JournalLine
+    fields = ('kind', 'chart_of_accounts', 'financial_account', 'entity', 'ledger', 'debit', 'credit')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(JournalEntry)
+class JournalEntryAdmin(admin.ModelAdmin):
+    # Diário só de inclusão: gravado por financial.journal, correções só por estorno
+    list_display = ('id', 'date', 'source', 'description', 'created_by')
+    list_filter = ('source',)
+    search_fields = ('description',)
+    date_hierarchy = 'date'
+    readonly_fields = ('date', 'source', 'description', 'loja_id', 'created_by')
+    inlines = [JournalLineInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(JournalPeriod)
+class JournalPeriodAdmin(admin.ModelAdmin):
+    list_display = ('month', 'end_date', 'created_by', 'created_at')
+    readonly_fields = ('month', 'end_date', 'created_by')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum, Count, Min, F, Q, Case, When, Value, DecimalField, FilteredRelation
+from django.db.models.functions import Coalesce
+
+from .models import Ledger
+
+MONEY = DecimalField(max_digits=15, decimal_places=2)
+OPEN_STATUSES = ['OPEN', 'PARTIAL']
+
+# (chave, rótulo, primeiro dia de atraso, último dia de atraso)
+AGING_BUCKETS = [
+    ('days_1_30', '1–30 dias', 1, 30),
+    ('days_31_60', '31–60 dias', 31, 60),
+    ('days_61_90', '61–90 dias', 61, 90),
+    ('days_90_plus', '+90 dias', 91, None),
+]
+
+
+def _bucket_q(today, first, last):
+    q = Q(aging_due__lte=today - timedelta(days=first))
+    if last is not None:
+        q &= Q(aging_due__gte=today - timedelta(days=last))
+    return q
+
+
+def bucket_label(days_overdue):
+    for _, label, first, last in AGING_BUCKETS:
+        if days_overdue >= first and (last is None or days_overdue <= last):
+            return label
+    return ''
+
+
+def open_titles(ledgers):
+    """
+    Um título em aberto por linha:
+    - lançamento parcelado (financial.schedule): cada parcela em aberto, pelo vencimento dela;
+    - lançamento sem parcelas previstas: o que falta pagar, pelo vencimento do lançamento.
+    Anota 'aging_due' e 'aging_value'. LEFT JOIN só com as parcelas em aberto
+    (FilteredRelation), sem ler o histórico pago. Também usado pela projeção de caixa
+    e pela conciliação bancária.
+    """
+    return (
+        ledgers.annotate(open_installment=FilteredRelation('parcelas', condition=Q(parcelas__pay_date__isnull=True)))
+        .annotate(
+            aging_due=Coalesce('open_installment__due_date', 'due_date'),
+            aging_value=Coalesce('open_installment__value', F('total_value') - F('paid_total'), output_field=MONEY),
+        )
+    )
+
+
+def overdue_titles(transaction_type, today):
+    """ Títulos vencidos e não pagos, um por linha (ver open_titles). """
+    return open_titles(
+        Ledger.objects.filter(transaction_type=transaction_type, status__in=OPEN_STATUSES)
+    ).filter(aging_due__lt=today)
+
+
+def aging_by_entity(transaction_type, today):
+    """
+    Aging por cliente/fornecedor: UMA query agrupada, com as faixas de atraso somadas
+    no banco (SUM(CASE WHEN ...)). O total geral sai da soma das linhas, sem outra query.
+    """
+    buckets = {
+        key: Sum(Case(When(_bucket_q(today, first, last), then='aging_value'), default=Value(0), output_field=MONEY))
+        for key, _, first, last in AGING_BUCKETS
+    }
+    rows = list(
+        overdue_titles(transaction_type, today)
+        .values('entity_id', 'entity__nome_razao_social')
+        .annotate(**buckets, total=Sum('aging_value'), titles=Count('id'), oldest_due=Min('aging_due'))
+        .order_by('-total', 'entity__nome_razao_social')
+    )
+
+    totals = {key: Decimal('0.00') for key, *_ in AGING_BUCKETS}
+    totals.update(total=Decimal('0.00'), titles=0)
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key]
+    return {'rows': rows, 'totals': totals}
+
+
+def aging_titles(transaction_type, today, entity_id=None):
+    """ Títulos vencidos (detalhe/exportação), do mais antigo para o mais recente, com os dias de atraso. """
+    titles = overdue_titles(transaction_type, today)
+    if entity_id:
+        titles = titles.filter(entity_id=entity_id)
+    rows = titles.values(
+        'id', 'description', 'aging_due', 'aging_value', 'open_installment__installment_number',
+        'entity__nome_razao_social', 'chart_of_accounts__name', 'vehicle__plate',
+    ).order_by('aging_due', 'id')
+
+    for row in rows.iterator(chunk_size=2000):
+        row['days_overdue'] = (today - row['aging_due']).days
+        row['bucket'] = bucket_label(row['days_overdue'])
+        yield row
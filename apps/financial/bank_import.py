@@ -0,0 +1,380 @@
+import csv
+import hashlib
+import html
+import io
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from vehicles.search import normalize
+from .models import Ledger, BankStatementLine
+from .aging import open_titles, OPEN_STATUSES
+from .services import settle_ledger
+
+# Tolerância (em dias) entre a data do banco e o vencimento do lançamento
+MATCH_DATE_WINDOW = 7
+IMPORT_BATCH_SIZE = 1000
+SETTLE_BATCH_SIZE = 200
+
+CENTS = Decimal('0.01')
+
+OFX_TAG_RE = re.compile(r'<(/?)([A-Za-z0-9_.]+)>([^<]*)')
+OFX_CHARSET_RE = re.compile(rb'CHARSET:\s*(1252|ISO-8859-1)', re.IGNORECASE)
+DOCUMENT_RE = re.compile(r'(?<!\d)(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}|\d{3}\.?\d{3}\.?\d{3}-?\d{2})(?!\d)')
+
+# Nomes de coluna aceitos no CSV (comparados em minúsculas e sem acentos)
+CSV_COLUMNS = {
+    'date': ('data', 'date', 'data lancamento', 'data movimento'),
+    'amount': ('valor', 'amount', 'valor (r$)'),
+    'description': ('descricao', 'historico', 'description', 'memo', 'lancamento'),
+    'document': ('documento', 'cpf/cnpj', 'cpf_cnpj', 'document'),
+    'fitid': ('id', 'fitid', 'identificador'),
+}
+
+
+def only_digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def find_document(text):
+    """ Primeiro CPF/CNPJ encontrado no histórico do banco (só dígitos) ou ''. """
+    match = DOCUMENT_RE.search(text or '')
+    return only_digits(match.group(1)) if match else ''
+
+
+def parse_amount(raw):
+    """ Aceita '1234.56', '-1.234,56' e 'R$ 1.234,56'. """
+    value = (raw or '').replace('R$', '').replace(' ', '').strip()
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    return Decimal(value).quantize(CENTS)
+
+
+def parse_date(raw):
+    """ OFX (AAAAMMDD[hhmmss...]), 'dd/mm/aaaa' ou 'aaaa-mm-dd'. """
+    raw = (raw or '').strip()
+    for fmt, size in (('%Y%m%d', 8), ('%d/%m/%Y', 10), ('%Y-%m-%d', 10)):
+        try:
+            return datetime.strptime(raw[:size], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: '{raw}'")
+
+
+# --- LEITURA DOS ARQUIVOS (streaming) ---
+
+def detect_format(name, head):
+    if name.lower().endswith('.ofx') or b'<OFX>' in head.upper():
+        return 'ofx'
+    return 'csv'
+
+
+def open_statement(binary, name=''):
+    """
+    Abre o arquivo enviado (binário) como texto, sem lê-lo inteiro.
+    Retorna (stream, formato). OFX de bancos brasileiros costuma vir em Windows-1252.
+    """
+    head = binary.read(1024)
+    binary.seek(0)
+    fmt = detect_format(name, head)
+    encoding = 'cp1252' if fmt == 'ofx' and OFX_CHARSET_RE.search(head) else 'utf-8-sig'
+    return io.TextIOWrapper(binary, encoding=encoding, errors='replace', newline=''), fmt
+
+
+def iter_ofx_transactions(stream):
+    """
+    Lê os blocos <STMTTRN> de um OFX (SGML ou XML) linha a linha.
+    Gera tuplas (nº da linha, dict) com os campos brutos da transação.
+    """
+    current = None
+    start_line = 0
+    for line_no, line in enumerate(stream, start=1):
+        for closing, tag, value in OFX_TAG_RE.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    text = ' '.join(filter(None, [current.get('NAME'), current.get('MEMO')]))
+                    yield start_line, {
+                        'fitid': current.get('FITID', ''),
+                        'date': current.get('DTPOSTED', ''),
+                        'amount': current.get('TRNAMT', ''),
+                        'description': text,
+                        'document': find_document(text),
+                    }
+                    current = None
+                elif not closing:
+                    current, start_line = {}, line_no
+            elif current is not None and not closing:
+                # No SGML os elementos não têm tag de fechamento: o valor vai até o próximo '<'
+                current[tag] = html.unescape(value.strip())
+
+
+def iter_csv_transactions(stream):
+    """
+    Lê um CSV de extrato (separador ';' ou ','), linha a linha.
+    As colunas são reconhecidas pelo nome (ver CSV_COLUMNS).
+    """
+    header = next(stream, '')
+    delimiter = ';' if header.count(';') >= header.count(',') else ','
+    reader = csv.reader(chain([header], stream), delimiter=delimiter)
+
+    names = [normalize(name) for name in next(reader, [])]
+    positions = {
+        field: next((names.index(alias) for alias in aliases if alias in names), None)
+        for field, aliases in CSV_COLUMNS.items()
+    }
+    if positions['date'] is None or positions['amount'] is None:
+        raise ValidationError("O CSV precisa das colunas 'Data' e 'Valor'.")
+
+    def column(row, field):
+        index = positions[field]
+        return row[index].strip() if index is not None and index < len(row) else ''
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        description = column(row, 'description')
+        yield reader.line_num, {
+            'fitid': column(row, 'fitid'),
+            'date': column(row, 'date'),
+            'amount': column(row, 'amount'),
+            'description': description,
+            'document': only_digits(column(row, 'document')) or find_document(description),
+        }
+
+
+def iter_statement_rows(stream, fmt):
+    if fmt == 'ofx':
+        return iter_ofx_transactions(stream)
+    return iter_csv_transactions(stream)
+
+
+# --- IMPORTAÇÃO ---
+
+class BankImportResult:
+    def __init__(self):
+        self.created = 0
+        self.duplicates = 0
+        self.matched = 0
+        self.errors = []  # [(linha, mensagem)]
+
+    def add_error(self, line_no, message):
+        self.errors.append((line_no, message))
+
+
+def _clean_row(data, seen):
+    """ Converte uma transação bruta. Retorna (dados, None) ou (None, erro). """
+    try:
+        date = parse_date(data['date'])
+    except ValueError as e:
+        return None, str(e)
+    try:
+        amount = parse_amount(data['amount'])
+    except InvalidOperation:
+        return None, f"Valor inválido: '{data['amount']}'"
+
+    cleaned = {
+        'date': date,
+        'amount': amount,
+        'description': data['description'][:255],
+        'document': data['document'][:14],
+    }
+
+    if not cleaned['amount']:
+        return None, "Transação com valor zerado."
+
+    fitid = data['fitid'][:64]
+    if not fitid:
+        # Sem ID do banco (comum no CSV): hash do conteúdo + nº da ocorrência no arquivo,
+        # para duas transações idênticas no mesmo dia não virarem uma só
+        key = (cleaned['date'], cleaned['amount'], cleaned['description'], cleaned['document'])
+        seen[key] += 1
+        raw = '|'.join(str(part) for part in key + (seen[key],))
+        fitid = 'sha256:' + hashlib.sha256(raw.encode()).hexdigest()[:57]
+    cleaned['fitid'] = fitid
+    return cleaned, None
+
+
+def _save_batch(batch, account, result):
+    # Reimportar o mesmo arquivo (ou um período sobreposto) não duplica linhas
+    by_fitid = {line.fitid: line for line in batch}
+    existing = set(
+        BankStatementLine.objects.filter(account=account, fitid__in=by_fitid).values_list('fitid', flat=True)
+    )
+    new_lines = [line for fitid, line in by_fitid.items() if fitid not in existing]
+    BankStatementLine.objects.bulk_create(new_lines)
+    result.created += len(new_lines)
+    result.duplicates += len(batch) - len(new_lines)
+
+
+def import_bank_statement(rows, account, user, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Grava as transações de (nº da linha, dict), como as geradas por iter_statement_rows(),
+    em lotes com bulk_create, e já roda a busca de correspondências da conta.
+    Linhas inválidas são reportadas no resultado sem abortar o arquivo.
+    """
+    result = BankImportResult()
+    seen = Counter()
+    batch = []
+
+    for line_no, data in rows:
+        cleaned, error = _clean_row(data, seen)
+        if error:
+            result.add_error(line_no, error)
+            continue
+        batch.append(BankStatementLine(account=account, loja_id=account.loja_id, created_by=user, **cleaned))
+        if len(batch) >= batch_size:
+            _save_batch(batch, account, result)
+            batch = []
+    if batch:
+        _save_batch(batch, account, result)
+
+    result.matched = match_bank_lines(account)
+    return result
+
+
+# --- CORRESPONDÊNCIA (MATCHING) ---
+
+def match_bank_lines(account, window=MATCH_DATE_WINDOW):
+    """
+    Sugere o lançamento em aberto de cada linha PENDING da conta.
+
+    Os candidatos são carregados com UMA query (títulos em aberto com vencimento
+    dentro da janela do extrato: cada parcela prevista de um lançamento parcelado, ou
+    o que falta pagar dos demais) e indexados num dicionário por (tipo, valor).
+    Cada linha consulta só o "balde" do seu valor, então o custo é linear no tamanho
+    do extrato (sem laço aninhado linhas x lançamentos).
+    Critério de desempate: mesmo CPF/CNPJ, depois a data mais próxima.
+    Retorna quantas linhas ganharam sugestão.
+    """
+    lines = list(BankStatementLine.objects.filter(account=account, status='PENDING').order_by('date', 'id'))
+    if not lines:
+        return 0
+
+    start = min(line.date for line in lines) - timedelta(days=window)
+    end = max(line.date for line in lines) + timedelta(days=window)
+
+    # Lançamentos já sugeridos para outras linhas ficam de fora
+    taken = BankStatementLine.objects.filter(status='MATCHED', ledger__isnull=False).values('ledger_id')
+    candidates = (
+        open_titles(Ledger.objects.filter(status__in=OPEN_STATUSES).exclude(id__in=taken))
+        .filter(aging_due__range=[start, end])
+        .values_list('id', 'transaction_type', 'aging_due', 'aging_value', 'entity__documento_principal')
+    )
+    index = defaultdict(list)
+    for ledger_id, transaction_type, due_date, value, document in candidates.iterator(chunk_size=2000):
+        index[(transaction_type, value.quantize(CENTS))].append((due_date, ledger_id, only_digits(document)))
+
+    matched = []
+    for line in lines:
+        transaction_type = 'RECEIVABLE' if line.amount > 0 else 'PAYABLE'
+        bucket = index.get((transaction_type, abs(line.amount)))
+        if not bucket:
+            continue
+
+        def rank(candidate):
+            due_date, ledger_id, document = candidate
+            return (bool(line.document) and document != line.document, abs((due_date - line.date).days), ledger_id)
+
+        in_window = [c for c in bucket if abs((c[0] - line.date).days) <= window]
+        if not in_window:
+            continue
+        best = min(in_window, key=rank)
+        bucket.remove(best)  # Um título só pode ser sugerido para uma linha
+
+        line.ledger_id = best[1]
+        line.status = 'MATCHED'
+        matched.append(line)
+
+    _save_matches(matched)
+    return len(matched)
+
+
+def _save_matches(lines):
+    # bulk_update montaria um CASE WHEN gigante (lento para milhares de linhas);
+    # executemany reaproveita o mesmo UPDATE por chave primária
+    table = connection.ops.quote_name(BankStatementLine._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET status = 'MATCHED', ledger_id = %s, updated_at = %s WHERE id = %s",
+            [(line.ledger_id, now, line.id) for line in lines],
+        )
+
+
+def unmatch_bank_lines(line_ids):
+    """ Descarta a sugestão (a linha volta a ficar sem correspondência). """
+    return BankStatementLine.objects.filter(id__in=line_ids, status='MATCHED').update(
+        status='PENDING', ledger=None, error='', updated_at=timezone.now()
+    )
+
+
+def ignore_bank_lines(line_ids):
+    """ Linhas que não viram baixa (Ex: tarifas já lançadas, transferências entre contas). """
+    return BankStatementLine.objects.filter(id__in=line_ids, status__in=['PENDING', 'MATCHED']).update(
+        status='IGNORED', ledger=None, error='', updated_at=timezone.now()
+    )
+
+
+# --- BAIXA DAS CORRESPONDÊNCIAS CONFIRMADAS ---
+
+def _still_matches(ledger, amount):
+    """
+    O valor da linha ainda é o que falta pagar do lançamento ou o de uma parcela em aberto dele.
+    'ledger' deve vir travado (select_for_update): linhas do mesmo lote podem ter baixado
+    outras parcelas do mesmo lançamento.
+    """
+    if amount > ledger.remaining_value:
+        return False
+    return amount == ledger.remaining_value or ledger.parcelas.filter(pay_date__isnull=True, value=amount).exists()
+
+
+def settle_bank_lines(line_ids, user, batch_size=SETTLE_BATCH_SIZE):
+    """
+    Baixa as linhas confirmadas pelo mesmo caminho da baixa manual (settle_ledger),
+    com a data do banco como data do pagamento.
+
+    Processa em lotes de 'batch_size', uma transação por lote; cada baixa roda num
+    savepoint (atomic aninhado), então uma linha com problema (Ex: saldo insuficiente,
+    lançamento que mudou depois da sugestão) fica com o erro anotado sem desfazer as demais.
+    O lançamento é relido travado antes da conferência do valor, dentro do savepoint.
+    Retorna (baixadas, com erro).
+    """
+    ids = list(
+        BankStatementLine.objects.filter(id__in=line_ids, status='MATCHED')
+        .order_by('date', 'id').values_list('id', flat=True)
+    )
+    settled = failed = 0
+
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            chunk = list(
+                BankStatementLine.objects.select_for_update(of=('self',))
+                .filter(id__in=ids[start:start + batch_size], status='MATCHED')
+                .order_by('date', 'id')
+            )
+            now = timezone.now()
+            for line in chunk:
+                line.updated_at = now
+                try:
+                    with transaction.atomic():
+                        ledger = Ledger.objects.select_for_update().filter(id=line.ledger_id).first()
+                        if ledger is None or not _still_matches(ledger, abs(line.amount)):
+                            raise ValidationError("O lançamento mudou depois da sugestão. Refaça a correspondência.")
+                        settle_ledger(ledger.id, abs(line.amount), line.account_id, user, pay_date=line.date)
+                except ValidationError as e:
+                    line.error = e.messages[0][:255]
+                    failed += 1
+                else:
+                    line.status = 'SETTLED'
+                    line.error = ''
+                    settled += 1
+            BankStatementLine.objects.bulk_update(chunk, ['status', 'error', 'updated_at'])
+
+    return settled, failed
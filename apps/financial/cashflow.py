@@ -0,0 +1,129 @@
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Q, Value, DateField
+from django.db.models.functions import Greatest, TruncWeek, TruncMonth
+from django.utils import timezone
+
+from .models import Ledger, FinancialAccount
+from .aging import open_titles, OPEN_STATUSES
+
+# Token da versão dos dados financeiros usados pela projeção.
+# Qualquer gravação em Ledger/Installment/saldo troca o token e as projeções antigas
+# deixam de ser encontradas (mesma ideia do catálogo de veículos).
+CASH_FLOW_VERSION_KEY = 'financial:cashflow:version'
+CASH_FLOW_TIMEOUT = 60 * 60 * 24
+
+GRANULARITIES = {
+    'day': 'Dia',
+    'week': 'Semana',
+    'month': 'Mês',
+}
+
+
+def cash_flow_version():
+    return cache.get_or_set(CASH_FLOW_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def _bump_version():
+    cache.set(CASH_FLOW_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_cash_flow():
+    """
+    Chamado pelos signals de Ledger/Installment e pelos serviços que gravam em lote
+    (bulk_create/update() não disparam signals). Só vale após o COMMIT.
+    """
+    transaction.on_commit(_bump_version)
+
+
+def _period(granularity, today):
+    # Vencidos entram no primeiro período (são dinheiro esperado para "já")
+    due = Greatest('aging_due', Value(today), output_field=DateField())
+    if granularity == 'week':
+        return TruncWeek(due, output_field=DateField())
+    if granularity == 'month':
+        return TruncMonth(due, output_field=DateField())
+    return due
+
+
+def _build_projection(days, granularity, today):
+    horizon = today + timedelta(days=days)
+    overdue = Q(aging_due__lt=today)
+
+    # Uma query agrupada sobre os títulos em aberto: lançamento parcelado entra parcela
+    # por parcela (no vencimento de cada uma), os demais pelo que falta pagar
+    # (o IN no tipo permite ao banco usar a primeira coluna do índice de lançamentos)
+    rows = (
+        open_titles(Ledger.objects.filter(transaction_type__in=['RECEIVABLE', 'PAYABLE'], status__in=OPEN_STATUSES))
+        .filter(aging_due__lte=horizon)
+        .annotate(period=_period(granularity, today))
+        .values('period')
+        .annotate(
+            receivable=Sum('aging_value', filter=Q(transaction_type='RECEIVABLE')),
+            payable=Sum('aging_value', filter=Q(transaction_type='PAYABLE')),
+            overdue_receivable=Sum('aging_value', filter=overdue & Q(transaction_type='RECEIVABLE')),
+            overdue_payable=Sum('aging_value', filter=overdue & Q(transaction_type='PAYABLE')),
+        )
+        .order_by('period')
+    )
+
+    opening_balance = FinancialAccount.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+
+    buckets = []
+    balance = opening_balance
+    total_in = total_out = overdue_in = overdue_out = Decimal('0.00')
+    for row in rows:
+        receivable = row['receivable'] or Decimal('0.00')
+        payable = row['payable'] or Decimal('0.00')
+        balance += receivable - payable
+        total_in += receivable
+        total_out += payable
+        overdue_in += row['overdue_receivable'] or 0
+        overdue_out += row['overdue_payable'] or 0
+        buckets.append({
+            'period': row['period'],
+            'receivable': receivable,
+            'payable': payable,
+            'net': receivable - payable,
+            'balance': balance,
+        })
+
+    return {
+        'today': today,
+        'horizon': horizon,
+        'granularity': granularity,
+        'opening_balance': opening_balance,
+        'total_in': total_in,
+        'total_out': total_out,
+        'overdue_in': overdue_in,
+        'overdue_out': overdue_out,
+        'closing_balance': balance,
+        'lowest_balance': min([opening_balance] + [b['balance'] for b in buckets]),
+        'buckets': buckets,
+    }
+
+
+def cash_flow_projection(days=90, granularity='week'):
+    """
+    Projeção de caixa: saldo atual das contas + o que falta receber/pagar
+    dos lançamentos em aberto (cada parcela prevista no seu vencimento; sem parcelas,
+    total_value - paid_total no vencimento do lançamento), agrupado por dia/semana/mês
+    até 'days' dias à frente.
+
+    O resultado fica no cache até a próxima gravação em lançamentos/parcelas/saldos
+    (ou até virar o dia, já que "hoje" define os vencidos e o horizonte).
+    """
+    if granularity not in GRANULARITIES:
+        granularity = 'week'
+    today = timezone.localdate()
+
+    key = f"financial:cashflow:{cash_flow_version()}:{today.isoformat()}:{days}:{granularity}"
+    projection = cache.get(key)
+    if projection is None:
+        projection = _build_projection(days, granularity, today)
+        cache.set(key, projection, timeout=CASH_FLOW_TIMEOUT)
+    return projection
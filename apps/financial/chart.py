@@ -0,0 +1,129 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import ChartOfAccounts, ChartOfAccountsClosure
+
+
+def closure_links(parents):
+    """
+    Gera (ancestral, descendente, distância) para todas as contas a partir de
+    {id: parent_id}. Usado na reconstrução completa (e na migração inicial).
+    """
+    for account_id in parents:
+        node, depth, seen = account_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            yield node, account_id, depth
+            node, depth = parents.get(node), depth + 1
+
+
+def rebuild_chart_tree():
+    """ Refaz a tabela de fechamento inteira a partir de ChartOfAccounts.parent. """
+    parents = dict(ChartOfAccounts.objects.values_list('id', 'parent_id'))
+    links = [
+        ChartOfAccountsClosure(ancestor_id=ancestor, descendant_id=descendant, depth=depth)
+        for ancestor, descendant, depth in closure_links(parents)
+    ]
+    with transaction.atomic():
+        ChartOfAccountsClosure.objects.all().delete()
+        ChartOfAccountsClosure.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def link_new_account(account):
+    """ Conta nova: ela mesma (distância 0) + os ancestrais do pai, um nível mais longe. """
+    links = [ChartOfAccountsClosure(ancestor_id=account.pk, descendant_id=account.pk, depth=0)]
+    if account.parent_id:
+        links += [
+            ChartOfAccountsClosure(ancestor_id=ancestor_id, descendant_id=account.pk, depth=depth + 1)
+            for ancestor_id, depth in ChartOfAccountsClosure.objects.filter(
+                descendant_id=account.parent_id
+            ).values_list('ancestor_id', 'depth')
+        ]
+    ChartOfAccountsClosure.objects.bulk_create(links)
+
+
+def move_account(account):
+    """
+    Troca de Conta Pai: a subárvore inteira muda de ancestrais.
+    1. Apaga os vínculos (ancestral de fora -> nó da subárvore);
+    2. Cria (novo ancestral -> nó da subárvore) somando as distâncias.
+    Roda dentro da transação do save(): um ciclo desfaz a gravação inteira.
+    """
+    subtree = list(
+        ChartOfAccountsClosure.objects.filter(ancestor_id=account.pk).values_list('descendant_id', 'depth')
+    )
+    subtree_ids = [descendant_id for descendant_id, _ in subtree]
+    if account.parent_id in subtree_ids:
+        raise ValidationError("A Conta Pai não pode ser a própria categoria nem uma de suas subcategorias.")
+
+    ChartOfAccountsClosure.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+    if account.parent_id:
+        new_ancestors = list(
+            ChartOfAccountsClosure.objects.filter(descendant_id=account.parent_id).values_list('ancestor_id', 'depth')
+        )
+        ChartOfAccountsClosure.objects.bulk_create([
+            ChartOfAccountsClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+            for ancestor_id, up in new_ancestors
+            for descendant_id, down in subtree
+        ])
+
+
+def chart_tree():
+    """
+    Plano de Contas em ordem de árvore (pai seguido dos filhos, irmãos por código),
+    com 'depth' e 'has_children' em cada conta. Uma query; o plano é pequeno.
+    """
+    accounts = list(ChartOfAccounts.objects.order_by('code'))
+    children = defaultdict(list)
+    for account in accounts:
+        children[account.parent_id].append(account)
+
+    ordered = []
+    stack = [(account, 0) for account in reversed(children[None])]
+    while stack:
+        account, depth = stack.pop()
+        account.depth = depth
+        account.has_children = bool(children[account.id])
+        ordered.append(account)
+        stack.extend((child, depth + 1) for child in reversed(children[account.id]))
+    return ordered
+
+
+def chart_rollup(start_date=None, end_date=None):
+    """
+    Totais de cada conta SOMANDO todas as subcategorias, uma query agrupada por medida
+    (JOIN ancestral -> descendente -> lançamentos, sem recursão):
+    - 'booked': valor dos lançamentos não cancelados, pelo vencimento/competência;
+    - 'realized': o que foi efetivamente pago/recebido (parcelas), pela data do pagamento.
+    Retorna {account_id: {'booked': Decimal, 'realized': Decimal}}.
+    """
+    # Todas as condições num único filter(): cada filter() em relação reversa faria outro JOIN
+    booked_q = Q(descendant__ledger__isnull=False) & ~Q(descendant__ledger__status='CANCELED')
+    realized_q = Q(descendant__ledger__parcelas__pay_date__isnull=False)
+    if start_date:
+        booked_q &= Q(descendant__ledger__due_date__gte=start_date)
+        realized_q &= Q(descendant__ledger__parcelas__pay_date__gte=start_date)
+    if end_date:
+        booked_q &= Q(descendant__ledger__due_date__lte=end_date)
+        realized_q &= Q(descendant__ledger__parcelas__pay_date__lte=end_date)
+
+    totals = defaultdict(lambda: {'booked': 0, 'realized': 0})
+    booked = (
+        ChartOfAccountsClosure.objects.filter(booked_q)
+        .values('ancestor_id').annotate(total=Sum('descendant__ledger__total_value')).order_by()
+    )
+    for row in booked:
+        totals[row['ancestor_id']]['booked'] = row['total']
+
+    realized = (
+        ChartOfAccountsClosure.objects.filter(realized_q)
+        .values('ancestor_id').annotate(total=Sum('descendant__ledger__parcelas__paid_value')).order_by()
+    )
+    for row in realized:
+        totals[row['ancestor_id']]['realized'] = row['total']
+    return totals
@@ -0,0 +1,193 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F, Q
+from django.db.models.functions import TruncMonth
+
+from .models import ChartOfAccounts, Installment, MonthlyAccountTotal
+
+# Grupos da DRE pelo primeiro nível do código contábil (1.x, 2.x, ...).
+# sign: +1 soma no resultado (receita), -1 subtrai (custo/despesa).
+DRE_GROUPS = [
+    ('1', 'Receita Bruta de Vendas', 1),
+    ('2', 'Custo de Aquisição dos Veículos', -1),
+    ('3', 'Manutenção e Preparação', -1),
+    ('4', 'Despesas Administrativas', -1),
+]
+# Subtotal "Lucro Bruto" depois destes grupos
+GROSS_PROFIT_AFTER = '2'
+OTHER_GROUP = ('9', 'Outras Receitas/Despesas', 1)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# --- MANUTENÇÃO INCREMENTAL ---
+
+def add_monthly_totals(deltas):
+    """
+    Soma movimentos no agregado mensal.
+    'deltas': {(chart_of_accounts_id, mês): (recebido, pago, qtd)}.
+    UPDATE atômico com F() na linha existente; se o mês ainda não existe, cria
+    (com savepoint: se outro processo criou junto, soma na linha dele).
+    """
+    for (account_id, month), (inflow, outflow, count) in deltas.items():
+        increment = {
+            'inflow': F('inflow') + inflow,
+            'outflow': F('outflow') + outflow,
+            'movements': F('movements') + count,
+        }
+        rows = MonthlyAccountTotal.objects.filter(chart_of_accounts_id=account_id, month=month)
+        if rows.update(**increment):
+            continue
+        try:
+            with transaction.atomic():
+                MonthlyAccountTotal.objects.create(
+                    chart_of_accounts_id=account_id, month=month, inflow=inflow, outflow=outflow, movements=count
+                )
+        except IntegrityError:
+            rows.update(**increment)
+
+
+def monthly_delta(ledger, pay_date, amount, deltas=None, movements=1):
+    """ Acumula o efeito de uma baixa ('movements' parcelas) em 'deltas' (formato de add_monthly_totals). """
+    deltas = {} if deltas is None else deltas
+    key = (ledger.chart_of_accounts_id, month_start(pay_date))
+    inflow, outflow, count = deltas.get(key, (Decimal('0.00'), Decimal('0.00'), 0))
+    if ledger.transaction_type == 'RECEIVABLE':
+        inflow += amount
+    else:
+        outflow += amount
+    deltas[key] = (inflow, outflow, count + movements)
+    return deltas
+
+
+def _monthly_rows():
+    """ Recalcula o agregado a partir das parcelas pagas: uma query agrupada. """
+    rows = (
+        Installment.objects.filter(pay_date__isnull=False)
+        .annotate(month=TruncMonth('pay_date'))
+        .values('ledger__chart_of_accounts_id', 'month')
+        .annotate(
+            inflow=Sum('paid_value', filter=Q(ledger__transaction_type='RECEIVABLE'), default=0),
+            outflow=Sum('paid_value', filter=Q(ledger__transaction_type='PAYABLE'), default=0),
+            movements=Count('id'),
+        )
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=2000):
+        yield MonthlyAccountTotal(
+            chart_of_accounts_id=row['ledger__chart_of_accounts_id'],
+            month=row['month'],
+            inflow=row['inflow'],
+            outflow=row['outflow'],
+            movements=row['movements'],
+        )
+
+
+def rebuild_monthly_totals(batch_size=1000):
+    """ Reconstrói a tabela inteira (correção de divergências). Retorna o nº de linhas. """
+    total = 0
+    with transaction.atomic():
+        MonthlyAccountTotal.objects.all().delete()
+        batch = []
+        for row in _monthly_rows():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                MonthlyAccountTotal.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        MonthlyAccountTotal.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+# --- RELATÓRIO ---
+
+def _period_key(month, granularity):
+    return date(month.year, 1, 1) if granularity == 'year' else month
+
+
+def build_dre(start_month, end_month, granularity='month'):
+    """
+    DRE por regime de caixa (o que foi efetivamente pago/recebido), lida só do agregado:
+    2 queries (categorias + totais do intervalo), independente do volume de parcelas.
+
+    Retorna {'periods': [...], 'lines': [...]} onde cada linha tem 'values' alinhados
+    com 'periods' e 'total'. Tipos de linha: 'group', 'account' e 'subtotal'.
+    """
+    periods = []
+    month = start_month
+    while month <= end_month:
+        key = _period_key(month, granularity)
+        if key not in periods:
+            periods.append(key)
+        month = add_months(month, 1)
+    position = {period: i for i, period in enumerate(periods)}
+
+    accounts = {a.id: a for a in ChartOfAccounts.objects.all()}
+    groups = {prefix: (label, sign) for prefix, label, sign in DRE_GROUPS}
+
+    # Valor com o sinal da DRE, por categoria e período
+    values = defaultdict(lambda: [Decimal('0.00')] * len(periods))
+    totals = MonthlyAccountTotal.objects.filter(month__range=[start_month, end_month]).values_list(
+        'chart_of_accounts_id', 'month', 'inflow', 'outflow'
+    )
+    for account_id, month, inflow, outflow in totals:
+        values[account_id][position[_period_key(month, granularity)]] += inflow - outflow
+
+    def group_of(account):
+        prefix = account.code.split('.')[0]
+        return prefix if prefix in groups else OTHER_GROUP[0]
+
+    by_group = defaultdict(list)
+    for account_id in values:
+        by_group[group_of(accounts[account_id])].append(accounts[account_id])
+
+    lines = []
+    result = [Decimal('0.00')] * len(periods)
+
+    def subtotal(label):
+        lines.append({'kind': 'subtotal', 'label': label, 'values': list(result), 'total': sum(result)})
+
+    for prefix, label, sign in DRE_GROUPS + [OTHER_GROUP]:
+        members = sorted(by_group.get(prefix, []), key=lambda a: a.code)
+        if not members and prefix == OTHER_GROUP[0]:
+            continue
+        group_values = [Decimal('0.00')] * len(periods)
+        account_lines = []
+        for account in members:
+            # Custos/despesas aparecem positivos na linha e são subtraídos no resultado
+            shown = [v * sign for v in values[account.id]]
+            group_values = [g + v for g, v in zip(group_values, shown)]
+            account_lines.append({
+                'kind': 'account', 'label': f"{account.code} - {account.name}",
+                'values': shown, 'total': sum(shown),
+            })
+        result = [r + v * sign for r, v in zip(result, group_values)]
+
+        lines.append({
+            'kind': 'group', 'label': f"({'+' if sign > 0 else '-'}) {label}",
+            'values': group_values, 'total': sum(group_values),
+        })
+        lines.extend(account_lines)
+        if prefix == GROSS_PROFIT_AFTER:
+            subtotal('(=) Lucro Bruto')
+
+    subtotal('(=) Resultado Líquido')
+
+    # Variação mês a mês (ou ano a ano) do resultado líquido
+    net = lines[-1]['values']
+    variation = [None] + [
+        ((current - previous) / abs(previous) * 100) if previous else None
+        for previous, current in zip(net, net[1:])
+    ]
+    return {'periods': periods, 'lines': lines, 'variation': variation}
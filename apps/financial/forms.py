@@ -1,5 +1,6 @@
 from django import forms
 from .models import Ledger, ChartOfAccounts, FinancialAccount
+from .schedule import METHODS as SCHEDULE_METHODS, MAX_INSTALLMENTS
 from vehicles.models import Vehicle
 from parties.models import Entity
 
@@ -67,9 +68,49 @@ class ChartOfAccountsForm(forms.ModelForm):
         # Permite selecionar a si mesmo como pai se estiver editando
         queryset = ChartOfAccounts.objects.all().order_by('code')
         if self.instance and self.instance.pk:
-            queryset = queryset.exclude(pk=self.instance.pk)
+            # Nem a própria conta nem suas subcategorias podem virar pai (ciclo)
+            queryset = queryset.exclude(ancestor_links__ancestor=self.instance)
         
         # Define o queryset para o campo parent (Conta Pai)
         self.fields['parent'].queryset = queryset
         # Torna o campo parent opcional na visualização do formulário
-        self.fields['parent'].required = False
\ No newline at end of file
+        self.fields['parent'].required = False
+
+# --- IMPORTAÇÃO DE EXTRATO BANCÁRIO (OFX/CSV) ---
+class BankStatementImportForm(forms.Form):
+    account = forms.ModelChoiceField(
+        queryset=FinancialAccount.objects.filter(account_type='BANK').order_by('name'),
+        label="Conta Bancária",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    file = forms.FileField(
+        label="Arquivo do Extrato (.ofx ou .csv)",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.ofx,.csv,.txt'}),
+    )
+
+# --- PARCELAMENTO (CRONOGRAMA) ---
+class InstallmentScheduleForm(forms.Form):
+    method = forms.ChoiceField(
+        choices=list(SCHEDULE_METHODS.items()),
+        label="Forma de Parcelamento",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    count = forms.IntegerField(
+        min_value=1, max_value=MAX_INSTALLMENTS, initial=12,
+        label="Nº de Parcelas",
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
+    monthly_rate = forms.DecimalField(
+        min_value=0, max_digits=7, decimal_places=4, required=False, initial=0,
+        label="Juros (% ao mês)",
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+    )
+    first_due_date = forms.DateField(
+        label="1º Vencimento",
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+    )
+    replace = forms.BooleanField(
+        required=False,
+        label="Substituir as parcelas em aberto (reparcelar)",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
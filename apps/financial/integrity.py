@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Sum, Count, Min, Max, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Ledger, Installment, FinancialAccount
+from .cashflow import invalidate_cash_flow
+from .dre import rebuild_monthly_totals
+from .journal import post_integrity_adjustments, post_accruals
+from .services import MONEY, paid_movements, signed_paid_value, fix_balance_drift, fix_ledger_totals
+
+# Lançamentos/OS conferidos por tarefa (cada faixa de ids vira UMA query agrupada)
+CHUNK_SIZE = 20000
+CENT = Decimal('0.01')
+
+
+def _in_worker(check):
+    """
+    Cada thread abre a própria conexão com o banco (conexões do Django são por thread);
+    fecha ao terminar a tarefa para não deixar conexões penduradas no pool.
+    """
+    def run(*args):
+        try:
+            return check(*args)
+        finally:
+            connections.close_all()
+    return run
+
+
+def _id_ranges(queryset, chunk_size):
+    bounds = queryset.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, start + chunk_size - 1)
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+    ]
+
+
+def _money(value):
+    # SUM no SQLite volta sem as casas decimais (10000 em vez de 10000.00)
+    return str(Decimal(value).quantize(CENT))
+
+
+# --- CONFERÊNCIAS (somente leitura) ---
+
+def check_account(account_id):
+    """
+    Uma conta bancária:
+    - saldo: saldo inicial + SUM das parcelas pagas nela (uma query agrupada);
+    - parcelas pagas inconsistentes (sem forma de pagamento ou com valor <= 0), lidas em streaming.
+    """
+    account = FinancialAccount.objects.values('id', 'name', 'opening_balance', 'balance').get(id=account_id)
+    movements = paid_movements(account_id).aggregate(
+        total=Coalesce(Sum(signed_paid_value()), Value(0), output_field=MONEY)
+    )['total']
+    expected = account['opening_balance'] + movements
+
+    result = {'account': None, 'installments': []}
+    # Comparação em Python (Decimal), imune a arredondamentos do SQLite
+    if account['balance'] != expected:
+        result['account'] = {
+            'id': account['id'],
+            'name': account['name'],
+            'balance': _money(account['balance']),
+            'expected': _money(expected),
+            'difference': _money(account['balance'] - expected),
+        }
+
+    suspicious = paid_movements(account_id).filter(
+        Q(payment_method__isnull=True) | Q(payment_method='') | Q(paid_value__lte=0)
+    ).values_list('id', 'ledger_id', 'paid_value', 'payment_method')
+    for installment_id, ledger_id, paid_value, payment_method in suspicious.iterator(chunk_size=2000):
+        result['installments'].append({
+            'id': installment_id,
+            'ledger_id': ledger_id,
+            'account_id': account_id,
+            'issue': 'valor pago <= 0' if paid_value <= 0 else 'sem forma de pagamento',
+        })
+    return result
+
+
+def check_orphan_payments():
+    """ Parcelas com data de pagamento mas sem conta: o valor não entra em saldo nenhum. """
+    orphans = Installment.objects.filter(pay_date__isnull=False, financial_account__isnull=True).values_list(
+        'id', 'ledger_id'
+    )
+    return [
+        {'id': installment_id, 'ledger_id': ledger_id, 'account_id': None, 'issue': 'pago sem conta financeira'}
+        for installment_id, ledger_id in orphans.iterator(chunk_size=2000)
+    ]
+
+
+def expected_status(status, total_value, paid):
+    """ Status que o lançamento deveria ter pelo que já foi pago (cancelado não muda). """
+    if status == 'CANCELED' or total_value <= 0:
+        return status
+    if paid >= total_value:
+        return 'PAID'
+    return 'PARTIAL' if paid > 0 else 'OPEN'
+
+
+def check_ledgers(first_id, last_id):
+    """
+    Lançamentos de uma faixa de ids: paid_total, installment_count e status
+    contra as parcelas (LEFT JOIN + SUM/COUNT numa query agrupada, lida em streaming).
+    """
+    rows = Ledger.objects.filter(id__range=[first_id, last_id]).annotate(
+        calc_paid=Coalesce(Sum('parcelas__paid_value'), Value(0), output_field=MONEY),
+        calc_count=Count('parcelas'),
+    ).values_list(
+        'id', 'status', 'total_value', 'paid_total', 'installment_count', 'calc_paid', 'calc_count'
+    ).order_by()
+
+    drift = []
+    for ledger_id, status, total_value, paid_total, installment_count, calc_paid, calc_count in rows.iterator(chunk_size=2000):
+        calc_status = expected_status(status, total_value, calc_paid)
+        if paid_total != calc_paid or installment_count != calc_count or status != calc_status:
+            drift.append({
+                'id': ledger_id,
+                'paid_total': _money(paid_total),
+                'expected_paid_total': _money(calc_paid),
+                'installment_count': installment_count,
+                'expected_installment_count': calc_count,
+                'status': status,
+                'expected_status': calc_status,
+            })
+    return drift
+
+
+def check_service_orders(first_id, last_id):
+    """ OS concluídas de uma faixa de ids: total_cost contra a soma dos itens (uma query agrupada). """
+    from maintenance.models import ServiceOrder
+
+    rows = ServiceOrder.objects.filter(id__range=[first_id, last_id], status='COMPLETED').annotate(
+        calc_cost=Coalesce(Sum('items__cost'), Value(0), output_field=MONEY),
+    ).values_list('id', 'vehicle_id', 'total_cost', 'calc_cost').order_by()
+
+    return [
+        {
+            'id': order_id,
+            'vehicle_id': vehicle_id,
+            'total_cost': _money(total_cost),
+            'expected_total_cost': _money(calc_cost),
+        }
+        for order_id, vehicle_id, total_cost, calc_cost in rows.iterator(chunk_size=2000)
+        if total_cost != calc_cost
+    ]
+
+
+def verify_ledgers(workers=4, chunk_size=CHUNK_SIZE):
+    """
+    Conferência completa, em paralelo:
+    - uma tarefa por conta bancária (saldo + parcelas inconsistentes);
+    - uma tarefa por faixa de ids de lançamentos e de OS (queries agrupadas).
+    Só lê; retorna o relatório (dict serializável em JSON).
+    """
+    from maintenance.models import ServiceOrder
+
+    account_ids = list(FinancialAccount.objects.order_by('id').values_list('id', flat=True))
+    ledger_ranges = _id_ranges(Ledger.objects.all(), chunk_size)
+    order_ranges = _id_ranges(ServiceOrder.objects.all(), chunk_size)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        account_jobs = [pool.submit(_in_worker(check_account), account_id) for account_id in account_ids]
+        ledger_jobs = [pool.submit(_in_worker(check_ledgers), *bounds) for bounds in ledger_ranges]
+        order_jobs = [pool.submit(_in_worker(check_service_orders), *bounds) for bounds in order_ranges]
+        orphan_job = pool.submit(_in_worker(check_orphan_payments))
+
+        accounts, installments = [], []
+        for job in account_jobs:
+            result = job.result()
+            if result['account']:
+                accounts.append(result['account'])
+            installments.extend(result['installments'])
+        installments.extend(orphan_job.result())
+        ledgers = [row for job in ledger_jobs for row in job.result()]
+        service_orders = [row for job in order_jobs for row in job.result()]
+
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'checked': {'accounts': len(account_ids)},
+        'accounts': accounts,
+        'ledgers': ledgers,
+        'service_orders': service_orders,
+        'installments': installments,
+    }
+
+
+def has_drift(report):
+    return any(report[key] for key in ('accounts', 'ledgers', 'service_orders', 'installments'))
+
+
+# --- CORREÇÃO ---
+
+def _service_order_payables(order_ids):
+    """
+    Contas a Pagar geradas por complete_service_order (histórico 'Ref. OS #<id> - ...'),
+    travados, por id da OS. Uma query; lançamentos cancelados ficam de fora.
+    """
+    prefixes = {f"Ref. OS #{order_id} -": order_id for order_id in order_ids}
+    if not prefixes:
+        return {}
+    match = Q()
+    for prefix in prefixes:
+        match |= Q(description__startswith=prefix)
+    ledgers = Ledger.objects.select_for_update().filter(match, transaction_type='PAYABLE').exclude(status='CANCELED')
+    payables = {}
+    for ledger in ledgers:
+        prefix = ledger.description[:ledger.description.find(' -') + 2]
+        if prefix in prefixes:
+            payables[prefixes[prefix]] = ledger
+    return payables
+
+
+def repair(report):
+    """
+    Grava os valores recalculados das divergências do relatório.
+    Saldos são refeitos com a conta travada (fix_balance_drift); lançamentos e OS
+    com bulk_update. O Contas a Pagar de cada OS corrigida passa a ter o novo custo
+    (com a diferença reconhecida no diário), para OS, ROI, lançamento e diário baterem.
+    Parcelas inconsistentes só são apontadas (exigem análise manual).
+    Depois, os agregados derivados acompanham os valores corrigidos: o agregado mensal
+    da DRE é reconstruído e o diário recebe uma partida de ajuste (Caixa/Banco e
+    Clientes/Fornecedores dos itens corrigidos).
+    Retorna a contagem do que foi corrigido.
+    """
+    from maintenance.models import ServiceOrder
+    from vehicles.services import refresh_vehicle_profitability
+
+    fix_balance_drift([FinancialAccount(id=row['id']) for row in report['accounts']], [])
+
+    totals = [
+        (row['id'], None, None, Decimal(row['expected_paid_total']), row['expected_installment_count'])
+        for row in report['ledgers']
+    ]
+    statuses = [
+        Ledger(id=row['id'], status=row['expected_status'])
+        for row in report['ledgers'] if row['status'] != row['expected_status']
+    ]
+    orders = [ServiceOrder(id=row['id'], total_cost=Decimal(row['expected_total_cost'])) for row in report['service_orders']]
+
+    with transaction.atomic():
+        if totals:
+            fix_ledger_totals(totals)
+        Ledger.objects.bulk_update(statuses, ['status'], batch_size=500)
+        ServiceOrder.objects.bulk_update(orders, ['total_cost'], batch_size=500)
+
+        payables = _service_order_payables([order.id for order in orders])
+        now = timezone.now()
+        adjusted = {}
+        for order in orders:
+            ledger = payables.get(order.id)
+            if ledger is None or ledger.total_value == order.total_cost:
+                continue
+            adjusted[ledger.id] = order.total_cost - ledger.total_value
+            ledger.total_value = order.total_cost
+            ledger.status = expected_status(ledger.status, ledger.total_value, ledger.paid_total)
+            ledger.updated_at = now
+        adjusted_ledgers = [ledger for ledger in payables.values() if ledger.id in adjusted]
+        Ledger.objects.bulk_update(adjusted_ledgers, ['total_value', 'status', 'updated_at'], batch_size=500)
+        if adjusted_ledgers:
+            post_accruals(
+                adjusted_ledgers, None, description=f"Ajuste do custo de {len(adjusted_ledgers)} OS (verify_ledgers --fix)",
+                amounts=adjusted,
+            )
+
+        # Custo de manutenção do ROI vem de total_cost
+        refresh_vehicle_profitability([row['vehicle_id'] for row in report['service_orders']])
+    if statuses or adjusted:
+        invalidate_cash_flow()
+
+    fixed = {
+        'accounts': len(report['accounts']),
+        'ledgers': len(totals),
+        'statuses': len(statuses),
+        'service_orders': len(orders),
+        'service_order_payables': len(adjusted),
+        'monthly_totals': None,
+        'journal_entry': None,
+    }
+    if report['accounts'] or report['ledgers'] or report['service_orders']:
+        fixed['monthly_totals'] = rebuild_monthly_totals()
+        entry = post_integrity_adjustments(
+            [row['id'] for row in report['accounts']], [row['id'] for row in report['ledgers']]
+        )
+        fixed['journal_entry'] = entry.id if entry else None
+    return fixed
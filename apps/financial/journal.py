@@ -0,0 +1,364 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum, Max
+from django.utils import timezone
+
+from .models import (
+    ChartOfAccounts, FinancialAccount, JournalEntry, JournalLine, JournalPeriod, JournalPeriodBalance,
+)
+from .dre import month_start, add_months
+
+ZERO = Decimal('0.00')
+# Conta do balancete: (tipo, categoria, conta financeira). Entidade só detalha clientes/fornecedores.
+ACCOUNT_FIELDS = ('kind', 'chart_of_accounts_id', 'financial_account_id')
+
+
+def debit(kind, amount, **refs):
+    return JournalLine(kind=kind, debit=amount, credit=ZERO, **refs)
+
+
+def credit(kind, amount, **refs):
+    return JournalLine(kind=kind, debit=ZERO, credit=amount, **refs)
+
+
+# --- LANÇAMENTO ---
+
+def check_open_date(date):
+    """ Partidas só entram depois do último mês fechado. """
+    closed_until = JournalPeriod.objects.aggregate(last=Max('end_date'))['last']
+    if closed_until and date <= closed_until:
+        raise ValidationError(
+            f"O período até {closed_until:%d/%m/%Y} está fechado. Lance com uma data posterior."
+        )
+
+
+def post_entry(date, source, description, lines, user=None, loja_id=1):
+    """
+    Grava uma partida (cabeçalho + linhas com bulk_create).
+    Confere que débitos = créditos e que a data não cai num período fechado.
+    Linhas de valor zero são descartadas (Ex: lançamento sem saldo a baixar).
+    """
+    lines = [line for line in lines if line.debit or line.credit]
+    if not lines:
+        return None
+    if any(line.debit < 0 or line.credit < 0 for line in lines):
+        raise ValidationError("Valores do diário não podem ser negativos (inverta débito/crédito).")
+    total_debit = sum((line.debit for line in lines), ZERO)
+    total_credit = sum((line.credit for line in lines), ZERO)
+    if total_debit != total_credit:
+        raise ValidationError(f"Partida desbalanceada: débitos R$ {total_debit} x créditos R$ {total_credit}.")
+    check_open_date(date)
+
+    with transaction.atomic():
+        entry = JournalEntry.objects.create(
+            date=date, source=source, description=description[:255], loja_id=loja_id, created_by=user,
+        )
+        for line in lines:
+            line.entry = entry
+            line.date = date
+        JournalLine.objects.bulk_create(lines)
+    return entry
+
+
+def _control_kind(ledger):
+    return 'RECEIVABLE' if ledger.transaction_type == 'RECEIVABLE' else 'PAYABLE'
+
+
+def accrual_lines(ledger, amount):
+    """
+    Reconhecimento de um Lançamento:
+    - A Receber: D Clientes a Receber / C Categoria (receita);
+    - A Pagar:   D Categoria (custo/despesa) / C Fornecedores a Pagar.
+    Valor negativo (Ex: estorno) inverte as pontas.
+    """
+    control = {'entity_id': ledger.entity_id, 'ledger': ledger}
+    category = {'chart_of_accounts_id': ledger.chart_of_accounts_id, 'ledger': ledger}
+    receivable = ledger.transaction_type == 'RECEIVABLE'
+    if amount < 0:
+        receivable, amount = not receivable, -amount
+    if receivable:
+        return [debit(_control_kind(ledger), amount, **control), credit('CATEGORY', amount, **category)]
+    return [debit('CATEGORY', amount, **category), credit(_control_kind(ledger), amount, **control)]
+
+
+def settlement_lines(ledger, account_id, amount):
+    """
+    Baixa de um Lançamento:
+    - A Receber: D Caixa/Banco / C Clientes a Receber;
+    - A Pagar:   D Fornecedores a Pagar / C Caixa/Banco.
+    """
+    control = {'entity_id': ledger.entity_id, 'ledger': ledger}
+    if ledger.transaction_type == 'RECEIVABLE':
+        return [debit('CASH', amount, financial_account_id=account_id), credit('RECEIVABLE', amount, **control)]
+    return [debit('PAYABLE', amount, **control), credit('CASH', amount, financial_account_id=account_id)]
+
+
+def post_accruals(ledgers, user, description=None, amounts=None, date=None):
+    """
+    Reconhece vários lançamentos numa partida só (Ex: importação em lote).
+    'amounts' ({ledger_id: valor}) permite reconhecer só uma diferença (Ex: juros do parcelamento).
+    """
+    lines = []
+    for ledger in ledgers:
+        amount = amounts[ledger.id] if amounts else ledger.total_value
+        if amount:
+            lines += accrual_lines(ledger, amount)
+    if not lines:
+        return None
+    if description is None:
+        description = ledgers[0].description if len(ledgers) == 1 else f"Reconhecimento de {len(ledgers)} lançamentos"
+    return post_entry(date or timezone.localdate(), 'ACCRUAL', description, lines, user, ledgers[0].loja_id)
+
+
+def post_ledger_accrual(ledger, user, amount=None):
+    return post_accruals([ledger], user, amounts={ledger.id: amount} if amount is not None else None)
+
+
+def post_settlements(settlements, account_id, date, user, description=None):
+    """ Baixa de um ou vários lançamentos pela mesma conta: 'settlements' = [(ledger, valor)]. """
+    lines = []
+    for ledger, amount in settlements:
+        if amount:
+            lines += settlement_lines(ledger, account_id, amount)
+    if not lines:
+        return None
+    if description is None:
+        ledger = settlements[0][0]
+        description = f"Baixa: {ledger.description}" if len(settlements) == 1 else f"Baixa em lote de {len(settlements)} lançamentos"
+    return post_entry(date, 'SETTLEMENT', description, lines, user, settlements[0][0].loja_id)
+
+
+def reverse_accruals(ledgers, user, description=None):
+    """
+    Cancelamento: estorna o que ainda está reconhecido dos lançamentos, numa partida só.
+    As linhas de categoria só vêm de reconhecimento/estorno (a baixa não mexe nelas),
+    então o saldo delas é o valor reconhecido (uma query agrupada por lançamento).
+    O que já foi baixado continua no diário.
+    """
+    if not ledgers:
+        return None
+    balances = {
+        row['ledger_id']: row['credit'] - row['debit']
+        for row in JournalLine.objects.filter(ledger__in=ledgers, kind='CATEGORY')
+        .values('ledger_id').annotate(debit=Sum('debit', default=ZERO), credit=Sum('credit', default=ZERO))
+        .order_by()
+    }
+
+    lines = []
+    for ledger in ledgers:
+        recognized = balances.get(ledger.id, ZERO)
+        if ledger.transaction_type == 'PAYABLE':
+            recognized = -recognized
+        if recognized:
+            lines += accrual_lines(ledger, -recognized)
+    if not lines:
+        return None
+    if description is None:
+        description = f"Estorno: {ledgers[0].description}" if len(ledgers) == 1 else f"Estorno de {len(ledgers)} lançamentos"
+    return post_entry(timezone.localdate(), 'REVERSAL', description, lines, user, ledgers[0].loja_id)
+
+
+def reverse_ledger_accrual(ledger, user):
+    return reverse_accruals([ledger], user)
+
+
+def post_opening_balance(account, amount, user=None, date=None):
+    """ Saldo inicial da conta financeira: D Caixa/Banco / C Patrimônio (ou o inverso, se negativo). """
+    if amount > 0:
+        lines = [debit('CASH', amount, financial_account_id=account.id), credit('EQUITY', amount)]
+    else:
+        lines = [debit('EQUITY', -amount), credit('CASH', -amount, financial_account_id=account.id)]
+    return post_entry(date or timezone.localdate(), 'OPENING', f"Saldo inicial: {account.name}", lines, user, account.loja_id)
+
+
+def post_integrity_adjustments(account_ids, ledger_ids, user=None):
+    """
+    Depois da correção do verify_ledgers (--fix), alinha o diário aos valores corrigidos,
+    numa partida só (duas queries agrupadas para ler o diário):
+    - Caixa/Banco de cada conta: saldo no diário x FinancialAccount.balance;
+    - Clientes/Fornecedores de cada lançamento: baixado no diário
+      (reconhecido - saldo de controle) x Ledger.paid_total.
+    As diferenças têm contrapartida em Patrimônio. Retorna a partida ou None.
+    """
+    from .models import Ledger
+
+    lines = []
+    cash = {
+        row['financial_account_id']: row['debit'] - row['credit']
+        for row in JournalLine.objects.filter(kind='CASH', financial_account_id__in=account_ids)
+        .values('financial_account_id').annotate(debit=Sum('debit', default=ZERO), credit=Sum('credit', default=ZERO))
+        .order_by()
+    }
+    for account_id, balance in FinancialAccount.objects.filter(id__in=account_ids).values_list('id', 'balance'):
+        difference = balance - cash.get(account_id, ZERO)
+        if difference > 0:
+            lines.append(debit('CASH', difference, financial_account_id=account_id))
+        elif difference < 0:
+            lines.append(credit('CASH', -difference, financial_account_id=account_id))
+
+    balances = defaultdict(lambda: ZERO)
+    for row in (
+        JournalLine.objects.filter(ledger_id__in=ledger_ids, kind__in=['CATEGORY', 'RECEIVABLE', 'PAYABLE'])
+        .values('ledger_id', 'kind').annotate(debit=Sum('debit', default=ZERO), credit=Sum('credit', default=ZERO))
+        .order_by()
+    ):
+        balances[row['ledger_id'], row['kind']] = row['debit'] - row['credit']
+    for ledger in Ledger.objects.filter(id__in=ledger_ids):
+        kind = _control_kind(ledger)
+        # Receber: reconhecido = crédito na categoria, baixa = crédito no controle (A Pagar: o inverso)
+        sign = -1 if kind == 'RECEIVABLE' else 1
+        recognized = sign * balances[ledger.id, 'CATEGORY']
+        control = -sign * balances[ledger.id, kind]
+        difference = ledger.paid_total - (recognized - control)
+        if not difference:
+            continue
+        control_refs = {'entity_id': ledger.entity_id, 'ledger': ledger}
+        if (difference > 0) == (kind == 'RECEIVABLE'):
+            lines.append(credit(kind, abs(difference), **control_refs))
+        else:
+            lines.append(debit(kind, abs(difference), **control_refs))
+
+    net = sum((line.debit - line.credit for line in lines), ZERO)
+    if net > 0:
+        lines.append(credit('EQUITY', net))
+    elif net < 0:
+        lines.append(debit('EQUITY', -net))
+    return post_entry(timezone.localdate(), 'ADJUSTMENT', "Ajuste da conferência (verify_ledgers --fix)", lines, user)
+
+
+def backfill_journal(batch_size=500):
+    """
+    Lança no diário o que foi gravado sem passar pelos serviços (dados antigos, scripts, admin):
+    - contas financeiras sem partida de saldo inicial;
+    - lançamentos não cancelados sem reconhecimento (pela data de vencimento);
+    - lançamentos com parcelas pagas e nenhuma baixa no diário (uma partida por conta e data).
+    Datas dentro de período fechado vão para o primeiro dia aberto.
+    Retorna a quantidade de partidas criadas.
+    """
+    from .models import Installment, Ledger
+
+    closed_until = JournalPeriod.objects.aggregate(last=Max('end_date'))['last']
+
+    def open_date(day):
+        return max(day, closed_until + timedelta(days=1)) if closed_until else day
+
+    created = 0
+    with_opening = JournalLine.objects.filter(entry__source='OPENING', kind='CASH').values('financial_account_id')
+    for account in FinancialAccount.objects.exclude(opening_balance=0).exclude(id__in=with_opening):
+        created += bool(post_opening_balance(account, account.opening_balance, date=open_date(timezone.localdate())))
+
+    accrued = JournalLine.objects.filter(kind='CATEGORY', ledger__isnull=False).values('ledger_id')
+    missing = Ledger.objects.exclude(status='CANCELED').exclude(id__in=accrued).order_by('due_date', 'id')
+    by_date = defaultdict(list)
+    for ledger in missing.iterator(chunk_size=batch_size):
+        by_date[open_date(ledger.due_date)].append(ledger)
+    for day, ledgers in sorted(by_date.items()):
+        for i in range(0, len(ledgers), batch_size):
+            chunk = ledgers[i:i + batch_size]
+            created += bool(post_accruals(chunk, None, f"Saldo anterior ao diário ({len(chunk)} lançamentos)", date=day))
+
+    settled = JournalLine.objects.filter(entry__source='SETTLEMENT', ledger__isnull=False).values('ledger_id')
+    paid = (
+        Installment.objects.filter(pay_date__isnull=False, financial_account__isnull=False)
+        .exclude(ledger_id__in=settled)
+        .values('ledger_id', 'financial_account_id', 'pay_date')
+        .annotate(total=Sum('paid_value'))
+        .order_by('pay_date', 'financial_account_id')
+    )
+    groups = defaultdict(list)
+    for row in paid:
+        groups[(open_date(row['pay_date']), row['financial_account_id'])].append((row['ledger_id'], row['total']))
+    ledgers = Ledger.objects.in_bulk({ledger_id for group in groups.values() for ledger_id, _ in group})
+    for (day, account_id), rows in sorted(groups.items()):
+        settlements = [(ledgers[ledger_id], total) for ledger_id, total in rows]
+        created += bool(post_settlements(settlements, account_id, day, None, "Baixas anteriores ao diário"))
+    return created
+
+
+# --- SALDOS / BALANCETE ---
+
+def _grouped(lines):
+    return lines.values(*ACCOUNT_FIELDS).annotate(debit=Sum('debit'), credit=Sum('credit')).order_by()
+
+
+def journal_balances(on_date):
+    """
+    Débitos/créditos acumulados de cada conta no fim de 'on_date':
+    saldos do último fechamento até a data (1 query) + linhas depois dele (1 query agrupada).
+    O custo não cresce com o histórico, só com o período ainda aberto.
+    Retorna {(kind, categoria, conta financeira): [débito, crédito]}.
+    """
+    balances = defaultdict(lambda: [ZERO, ZERO])
+    period = JournalPeriod.objects.filter(end_date__lte=on_date).order_by('-month').first()
+    lines = JournalLine.objects.filter(date__lte=on_date)
+    if period:
+        for row in period.balances.values(*ACCOUNT_FIELDS, 'debit', 'credit'):
+            balances[tuple(row[f] for f in ACCOUNT_FIELDS)] = [row['debit'], row['credit']]
+        lines = lines.filter(date__gt=period.end_date)
+
+    for row in _grouped(lines):
+        balance = balances[tuple(row[f] for f in ACCOUNT_FIELDS)]
+        balance[0] += row['debit']
+        balance[1] += row['credit']
+    return balances
+
+
+def trial_balance(on_date):
+    """ Balancete na data: uma linha por conta com débitos, créditos e saldo (D - C), mais os totais. """
+    balances = journal_balances(on_date)
+    categories = ChartOfAccounts.objects.in_bulk([key[1] for key in balances if key[1]])
+    accounts = FinancialAccount.objects.in_bulk([key[2] for key in balances if key[2]])
+    kinds = dict(JournalLine.KIND_CHOICES)
+
+    rows = []
+    for (kind, category_id, account_id), (total_debit, total_credit) in balances.items():
+        if kind == 'CATEGORY':
+            label = str(categories[category_id])
+        elif kind == 'CASH':
+            label = f"{kinds[kind]}: {accounts[account_id].name}"
+        else:
+            label = kinds[kind]
+        rows.append({
+            'kind': kind, 'label': label,
+            'debit': total_debit, 'credit': total_credit, 'balance': total_debit - total_credit,
+        })
+    order = [kind for kind, _ in JournalLine.KIND_CHOICES]
+    rows.sort(key=lambda r: (order.index(r['kind']), r['label']))
+
+    total_debit = sum((r['debit'] for r in rows), ZERO)
+    total_credit = sum((r['credit'] for r in rows), ZERO)
+    return {'rows': rows, 'debit': total_debit, 'credit': total_credit, 'balanced': total_debit == total_credit}
+
+
+# --- FECHAMENTO DE PERÍODO ---
+
+def close_period(month, user):
+    """
+    Fecha o mês (e, implicitamente, os anteriores ainda abertos):
+    saldo acumulado = fechamento anterior + linhas até o fim do mês, gravado por conta.
+    Depois disso nenhuma partida com data até o fim do mês é aceita.
+    """
+    month = month_start(month)
+    end_date = add_months(month, 1) - timedelta(days=1)
+    if end_date >= timezone.localdate():
+        raise ValidationError("Só é possível fechar meses que já terminaram.")
+
+    with transaction.atomic():
+        last = JournalPeriod.objects.select_for_update().order_by('-month').first()
+        if last and month <= last.month:
+            raise ValidationError(f"O período {last} já está fechado.")
+
+        balances = journal_balances(end_date)
+        period = JournalPeriod.objects.create(month=month, end_date=end_date, created_by=user)
+        JournalPeriodBalance.objects.bulk_create([
+            JournalPeriodBalance(
+                period=period, kind=kind, chart_of_accounts_id=category_id, financial_account_id=account_id,
+                debit=total_debit, credit=total_credit,
+            )
+            for (kind, category_id, account_id), (total_debit, total_credit) in balances.items()
+        ])
+    return period
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from financial.journal import backfill_journal
+
+
+class Command(BaseCommand):
+    help = 'Lança no diário contábil os saldos iniciais, lançamentos e baixas gravados fora dos serviços.'
+
+    def handle(self, *args, **options):
+        total = backfill_journal()
+        self.stdout.write(self.style.SUCCESS(f"{total} partida(s) lançada(s) no diário."))
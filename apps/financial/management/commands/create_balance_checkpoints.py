@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.services import create_balance_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Grava o saldo de fim de dia de cada conta financeira (rodar diariamente, Ex: cron às 00:05).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Dia do checkpoint (AAAA-MM-DD). Padrão: ontem.')
+
+    def handle(self, *args, **options):
+        on_date = None
+        if options['date']:
+            try:
+                on_date = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("Data inválida. Use o formato AAAA-MM-DD.")
+
+        for checkpoint in create_balance_checkpoints(on_date):
+            self.stdout.write(f"{checkpoint.account.name} em {checkpoint.date}: R$ {checkpoint.balance}")
+        self.stdout.write(self.style.SUCCESS("Checkpoints de saldo gravados."))
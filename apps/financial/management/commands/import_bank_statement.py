@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+
+from financial.models import FinancialAccount, BankStatementLine
+from financial.bank_import import open_statement, iter_statement_rows, import_bank_statement, settle_bank_lines
+
+
+class Command(BaseCommand):
+    help = 'Importa um extrato bancário (OFX ou CSV) e sugere a correspondência com as contas em aberto.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo .ofx ou .csv')
+        parser.add_argument('--account', type=int, required=True, help='ID da Conta Financeira')
+        parser.add_argument('--user', help='Username registrado como "Criado por"')
+        parser.add_argument('--settle', action='store_true', help='Baixa em seguida todas as correspondências sugeridas')
+
+    def handle(self, *args, **options):
+        try:
+            account = FinancialAccount.objects.get(id=options['account'])
+        except FinancialAccount.DoesNotExist:
+            raise CommandError(f"Conta {options['account']} não encontrada.")
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário '{options['user']}' não encontrado.")
+
+        try:
+            with open(options['path'], 'rb') as binary:
+                stream, fmt = open_statement(binary, options['path'])
+                result = import_bank_statement(iter_statement_rows(stream, fmt), account, user)
+        except OSError as e:
+            raise CommandError(f"Não foi possível ler o arquivo: {e}")
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"Linha {line_no}: {message}")
+
+        style = self.style.SUCCESS if not result.errors else self.style.WARNING
+        self.stdout.write(style(
+            f"{result.created} transações importadas ({result.duplicates} já existiam), "
+            f"{result.matched} com correspondência sugerida, {len(result.errors)} linhas com erro."
+        ))
+
+        if options['settle']:
+            matched = BankStatementLine.objects.filter(account=account, status='MATCHED').values_list('id', flat=True)
+            settled, failed = settle_bank_lines(list(matched), user)
+            self.stdout.write(f"{settled} lançamentos baixados, {failed} com erro.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from financial.chart import rebuild_chart_tree
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a hierarquia (tabela de fechamento) do Plano de Contas a partir das Contas Pai.'
+
+    def handle(self, *args, **options):
+        links = rebuild_chart_tree()
+        self.stdout.write(self.style.SUCCESS(f"Hierarquia reconstruída: {links} vínculos."))
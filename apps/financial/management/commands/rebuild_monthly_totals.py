@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from financial.dre import rebuild_monthly_totals
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o agregado mensal por categoria (base da DRE) a partir das parcelas pagas.'
+
+    def handle(self, *args, **options):
+        total = rebuild_monthly_totals()
+        self.stdout.write(self.style.SUCCESS(f"Agregado mensal recalculado: {total} linhas (categoria x mês)."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.services import find_balance_drift, fix_balance_drift
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os saldos das contas (saldo inicial + parcelas) e aponta divergências.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Quantos dias de checkpoints verificar.')
+        parser.add_argument('--fix', action='store_true', help='Corrige os saldos e descarta checkpoints divergentes.')
+
+    def handle(self, *args, **options):
+        accounts, checkpoints = find_balance_drift(checkpoint_days=options['days'])
+
+        for account in accounts:
+            self.stdout.write(self.style.WARNING(
+                f"Conta '{account.name}': saldo R$ {account.balance}, esperado R$ {account.expected} "
+                f"(diferença R$ {account.balance - account.expected})"
+            ))
+        for checkpoint in checkpoints:
+            self.stdout.write(self.style.WARNING(
+                f"Checkpoint '{checkpoint.account.name}' em {checkpoint.date}: "
+                f"R$ {checkpoint.balance}, esperado R$ {checkpoint.expected}"
+            ))
+
+        if not accounts and not checkpoints:
+            self.stdout.write(self.style.SUCCESS("Saldos conciliados. Nenhuma divergência."))
+            return
+
+        if not options['fix']:
+            raise CommandError(
+                f"{len(accounts)} conta(s) e {len(checkpoints)} checkpoint(s) divergentes. Rode com --fix para corrigir."
+            )
+
+        fix_balance_drift(accounts, checkpoints)
+        self.stdout.write(self.style.SUCCESS("Divergências corrigidas."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.services import find_ledger_total_drift, fix_ledger_totals
+
+
+class Command(BaseCommand):
+    help = 'Confere Ledger.paid_total / installment_count contra as parcelas (uma query agrupada).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Grava os valores recalculados.')
+
+    def handle(self, *args, **options):
+        drift = list(find_ledger_total_drift())
+
+        for ledger_id, paid_total, installment_count, calc_paid, calc_count in drift:
+            self.stdout.write(self.style.WARNING(
+                f"Lançamento #{ledger_id}: pago R$ {paid_total} ({installment_count} parcelas), "
+                f"esperado R$ {calc_paid} ({calc_count} parcelas)"
+            ))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Totais dos lançamentos conferidos. Nenhuma divergência."))
+            return
+
+        if not options['fix']:
+            raise CommandError(f"{len(drift)} lançamento(s) divergente(s). Rode com --fix para corrigir.")
+
+        fixed = fix_ledger_totals(drift)
+        self.stdout.write(self.style.SUCCESS(f"{fixed} lançamento(s) corrigido(s)."))
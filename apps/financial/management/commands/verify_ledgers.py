@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from financial.integrity import CHUNK_SIZE, verify_ledgers, has_drift, repair
+
+
+class Command(BaseCommand):
+    help = (
+        'Confere saldos das contas, totais/status dos lançamentos e custo das OS contra as parcelas '
+        'e itens (queries agrupadas, em paralelo). Relatório em JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Tarefas em paralelo (padrão: 4).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Lançamentos/OS por tarefa.')
+        parser.add_argument('--output', help='Grava o relatório JSON neste arquivo (padrão: saída padrão).')
+        parser.add_argument('--fix', action='store_true', help='Grava os valores recalculados.')
+
+    def handle(self, *args, **options):
+        report = verify_ledgers(workers=options['workers'], chunk_size=options['chunk_size'])
+        drift = has_drift(report)
+        if drift and options['fix']:
+            report['fixed'] = repair(report)
+
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(content)
+        else:
+            self.stdout.write(content)
+
+        if drift and not options['fix']:
+            raise CommandError("Divergências encontradas. Rode com --fix para corrigir.")
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_opening_balance(apps, schema_editor):
+    """ Saldo inicial = saldo atual - movimentos já registrados (a conta nasce conciliada). """
+    FinancialAccount = apps.get_model('financial', 'FinancialAccount')
+    Installment = apps.get_model('financial', 'Installment')
+
+    signed = models.Case(
+        models.When(ledger__transaction_type='RECEIVABLE', then=models.F('paid_value')),
+        default=-models.F('paid_value'),
+        output_field=models.DecimalField(max_digits=15, decimal_places=2),
+    )
+    totals = dict(
+        Installment.objects.filter(financial_account__isnull=False, pay_date__isnull=False)
+        .values('financial_account').annotate(total=models.Sum(signed))
+        .values_list('financial_account', 'total')
+    )
+    for account in FinancialAccount.objects.all():
+        account.opening_balance = account.balance - (totals.get(account.id) or 0)
+        account.save(update_fields=['opening_balance'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0002_ledger_negotiation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Saldo no Fim do Dia')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Saldo',
+                'verbose_name_plural': 'Checkpoints de Saldo',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='financialaccount',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=15, verbose_name='Saldo Inicial'),
+        ),
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(fields=['financial_account', 'pay_date'], name='financial_i_financi_b59cec_idx'),
+        ),
+        migrations.AddField(
+            model_name='accountbalancecheckpoint',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='financial.financialaccount', verbose_name='Conta'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountbalancecheckpoint',
+            unique_together={('account', 'date')},
+        ),
+        migrations.RunPython(backfill_opening_balance, migrations.RunPython.noop),
+    ]
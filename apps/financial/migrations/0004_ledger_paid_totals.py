@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:58
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_paid_totals(apps, schema_editor):
+    Ledger = apps.get_model('financial', 'Ledger')
+    Installment = apps.get_model('financial', 'Installment')
+
+    per_ledger = Installment.objects.filter(ledger=models.OuterRef('pk')).values('ledger')
+    Ledger.objects.update(
+        paid_total=Coalesce(
+            models.Subquery(per_ledger.annotate(total=models.Sum('paid_value')).values('total')),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        installment_count=Coalesce(
+            models.Subquery(per_ledger.annotate(total=models.Count('id')).values('total')),
+            models.Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0003_account_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledger',
+            name='installment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Qtd. Parcelas'),
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Pago'),
+        ),
+        migrations.RunPython(backfill_paid_totals, migrations.RunPython.noop),
+    ]
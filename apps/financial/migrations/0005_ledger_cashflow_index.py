@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0004_ledger_paid_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ledger',
+            name='financial_l_transac_4a9124_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['transaction_type', 'status', 'due_date', 'total_value', 'paid_total'], name='ledger_cashflow_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0005_ledger_cashflow_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('fitid', models.CharField(max_length=64, verbose_name='ID no Banco')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Valor')),
+                ('description', models.CharField(blank=True, default='', max_length=255, verbose_name='Histórico')),
+                ('document', models.CharField(blank=True, default='', max_length=14, verbose_name='CPF/CNPJ (só dígitos)')),
+                ('status', models.CharField(choices=[('PENDING', 'Sem Correspondência'), ('MATCHED', 'Correspondência Sugerida'), ('SETTLED', 'Conciliado'), ('IGNORED', 'Ignorado')], default='PENDING', max_length=10, verbose_name='Status')),
+                ('error', models.CharField(blank=True, default='', max_length=255, verbose_name='Erro na Baixa')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bank_lines', to='financial.financialaccount', verbose_name='Conta')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('ledger', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bank_lines', to='financial.ledger', verbose_name='Lançamento')),
+            ],
+            options={
+                'verbose_name': 'Linha de Extrato Bancário',
+                'verbose_name_plural': 'Extrato Bancário (Conciliação)',
+                'indexes': [models.Index(fields=['account', 'status', 'date'], name='financial_b_account_768706_idx')],
+                'unique_together': {('account', 'fitid')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    ChartOfAccounts = apps.get_model('financial', 'ChartOfAccounts')
+    ChartOfAccountsClosure = apps.get_model('financial', 'ChartOfAccountsClosure')
+
+    # Para cada conta, sobe pelos pais gravando (ancestral, conta, distância)
+    parents = dict(ChartOfAccounts.objects.values_list('id', 'parent_id'))
+    links = []
+    for account_id in parents:
+        node, depth, seen = account_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            links.append(ChartOfAccountsClosure(ancestor_id=node, descendant_id=account_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    ChartOfAccountsClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0006_bank_statement_line'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartOfAccountsClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='Distância')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='financial.chartofaccounts')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='financial.chartofaccounts')),
+            ],
+            options={
+                'verbose_name': 'Hierarquia do Plano de Contas',
+                'verbose_name_plural': 'Hierarquia do Plano de Contas',
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='financial_c_descend_a9229e_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_monthly_totals(apps, schema_editor):
+    Installment = apps.get_model('financial', 'Installment')
+    MonthlyAccountTotal = apps.get_model('financial', 'MonthlyAccountTotal')
+
+    # Uma query agrupada por (categoria, mês do pagamento)
+    rows = (
+        Installment.objects.filter(pay_date__isnull=False)
+        .annotate(month=TruncMonth('pay_date'))
+        .values('ledger__chart_of_accounts_id', 'month')
+        .annotate(
+            inflow=Sum('paid_value', filter=Q(ledger__transaction_type='RECEIVABLE'), default=0),
+            outflow=Sum('paid_value', filter=Q(ledger__transaction_type='PAYABLE'), default=0),
+            movements=Count('id'),
+        )
+        .order_by()
+    )
+    MonthlyAccountTotal.objects.bulk_create([
+        MonthlyAccountTotal(
+            chart_of_accounts_id=row['ledger__chart_of_accounts_id'], month=row['month'],
+            inflow=row['inflow'], outflow=row['outflow'], movements=row['movements'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0007_chart_of_accounts_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyAccountTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mês')),
+                ('inflow', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Recebido')),
+                ('outflow', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Pago')),
+                ('movements', models.PositiveIntegerField(default=0, verbose_name='Qtd. Movimentos')),
+                ('chart_of_accounts', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_totals', to='financial.chartofaccounts', verbose_name='Categoria')),
+            ],
+            options={
+                'verbose_name': 'Total Mensal por Categoria',
+                'verbose_name_plural': 'Totais Mensais por Categoria',
+                'indexes': [models.Index(fields=['month', 'chart_of_accounts'], name='financial_m_month_0c6f4a_idx')],
+                'unique_together': {('chart_of_accounts', 'month')},
+            },
+        ),
+        migrations.RunPython(build_monthly_totals, migrations.RunPython.noop),
+    ]
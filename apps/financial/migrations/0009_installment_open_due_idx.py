@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0008_monthly_account_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(condition=models.Q(('pay_date__isnull', True)), fields=['ledger', 'due_date'], name='installment_open_due_idx'),
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_journal(apps, schema_editor):
+    """ Histórico existente: saldos iniciais, reconhecimento de cada lançamento e cada parcela paga. """
+    FinancialAccount = apps.get_model('financial', 'FinancialAccount')
+    Ledger = apps.get_model('financial', 'Ledger')
+    Installment = apps.get_model('financial', 'Installment')
+    JournalEntry = apps.get_model('financial', 'JournalEntry')
+    JournalLine = apps.get_model('financial', 'JournalLine')
+
+    def post(date, source, description, lines, loja_id):
+        entry = JournalEntry.objects.create(date=date, source=source, description=description[:255], loja_id=loja_id)
+        JournalLine.objects.bulk_create([
+            JournalLine(entry=entry, date=date, debit=amount if side == 'D' else 0, credit=amount if side == 'C' else 0, **refs)
+            for side, amount, refs in lines
+        ])
+
+    for account in FinancialAccount.objects.exclude(opening_balance=0):
+        cash = {'kind': 'CASH', 'financial_account_id': account.id}
+        amount = abs(account.opening_balance)
+        lines = [('D', amount, cash), ('C', amount, {'kind': 'EQUITY'})]
+        if account.opening_balance < 0:
+            lines = [('D', amount, {'kind': 'EQUITY'}), ('C', amount, cash)]
+        post(timezone.localdate(), 'OPENING', f"Saldo inicial: {account.name}", lines, account.loja_id)
+
+    for ledger in Ledger.objects.exclude(status='CANCELED').iterator():
+        control = {'kind': ledger.transaction_type, 'entity_id': ledger.entity_id, 'ledger_id': ledger.id}
+        category = {'kind': 'CATEGORY', 'chart_of_accounts_id': ledger.chart_of_accounts_id, 'ledger_id': ledger.id}
+        if ledger.transaction_type == 'RECEIVABLE':
+            lines = [('D', ledger.total_value, control), ('C', ledger.total_value, category)]
+        else:
+            lines = [('D', ledger.total_value, category), ('C', ledger.total_value, control)]
+        post(ledger.due_date, 'ACCRUAL', ledger.description, lines, ledger.loja_id)
+
+    paid = Installment.objects.filter(pay_date__isnull=False, financial_account__isnull=False, paid_value__gt=0)
+    for installment in paid.select_related('ledger').iterator():
+        ledger = installment.ledger
+        control = {'kind': ledger.transaction_type, 'entity_id': ledger.entity_id, 'ledger_id': ledger.id}
+        cash = {'kind': 'CASH', 'financial_account_id': installment.financial_account_id}
+        amount = installment.paid_value
+        if ledger.transaction_type == 'RECEIVABLE':
+            lines = [('D', amount, cash), ('C', amount, control)]
+        else:
+            lines = [('D', amount, control), ('C', amount, cash)]
+        post(installment.pay_date, 'SETTLEMENT', f"Baixa: {ledger.description}", lines, ledger.loja_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0009_installment_open_due_idx'),
+        ('parties', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('source', models.CharField(choices=[('OPENING', 'Saldo Inicial'), ('ACCRUAL', 'Reconhecimento (Lançamento)'), ('SETTLEMENT', 'Baixa (Pagamento/Recebimento)'), ('REVERSAL', 'Estorno')], max_length=15, verbose_name='Origem')),
+                ('description', models.CharField(max_length=255, verbose_name='Histórico')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+            ],
+            options={
+                'verbose_name': 'Partida do Diário',
+                'verbose_name_plural': 'Diário Contábil',
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('month', models.DateField(unique=True, verbose_name='Mês')),
+                ('end_date', models.DateField(verbose_name='Último Dia')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+            ],
+            options={
+                'verbose_name': 'Período Fechado',
+                'verbose_name_plural': 'Períodos Fechados',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalPeriodBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('CATEGORY', 'Categoria (Plano de Contas)'), ('CASH', 'Caixa / Banco'), ('RECEIVABLE', 'Clientes a Receber'), ('PAYABLE', 'Fornecedores a Pagar'), ('EQUITY', 'Patrimônio (Saldos Iniciais)')], max_length=10, verbose_name='Conta')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Débitos')),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Créditos')),
+                ('chart_of_accounts', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='financial.chartofaccounts', verbose_name='Categoria')),
+                ('financial_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='financial.financialaccount', verbose_name='Conta Financeira')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='financial.journalperiod', verbose_name='Período')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Fechamento',
+                'verbose_name_plural': 'Saldos de Fechamento',
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Data')),
+                ('kind', models.CharField(choices=[('CATEGORY', 'Categoria (Plano de Contas)'), ('CASH', 'Caixa / Banco'), ('RECEIVABLE', 'Clientes a Receber'), ('PAYABLE', 'Fornecedores a Pagar'), ('EQUITY', 'Patrimônio (Saldos Iniciais)')], max_length=10, verbose_name='Conta')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Débito')),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Crédito')),
+                ('chart_of_accounts', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='financial.chartofaccounts', verbose_name='Categoria')),
+                ('entity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='parties.entity', verbose_name='Entidade')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lines', to='financial.journalentry', verbose_name='Partida')),
+                ('financial_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='financial.financialaccount', verbose_name='Conta Financeira')),
+                ('ledger', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='journal_lines', to='financial.ledger', verbose_name='Lançamento')),
+            ],
+            options={
+                'verbose_name': 'Linha do Diário',
+                'verbose_name_plural': 'Linhas do Diário',
+                'indexes': [models.Index(fields=['date', 'kind'], name='financial_j_date_66631b_idx'), models.Index(fields=['ledger', 'kind'], name='financial_j_ledger__4a03ca_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('credit', 0), ('debit__gt', 0)), models.Q(('credit__gt', 0), ('debit', 0)), _connector='OR'), name='journal_line_debit_xor_credit')],
+            },
+        ),
+        migrations.RunPython(backfill_journal, migrations.RunPython.noop),
+    ]
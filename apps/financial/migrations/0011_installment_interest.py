@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0010_double_entry_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='installment',
+            name='interest',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Juros'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financial', '0011_installment_interest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journalentry',
+            name='source',
+            field=models.CharField(choices=[('OPENING', 'Saldo Inicial'), ('ACCRUAL', 'Reconhecimento (Lançamento)'), ('SETTLEMENT', 'Baixa (Pagamento/Recebimento)'), ('REVERSAL', 'Estorno'), ('ADJUSTMENT', 'Ajuste (Conferência)')], max_length=15, verbose_name='Origem'),
+        ),
+    ]
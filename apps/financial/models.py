@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from core.models import TenantAwareModel
 from parties.models import Entity
@@ -13,9 +13,13 @@ class FinancialAccount(TenantAwareModel):
     name = models.CharField(max_length=100, verbose_name="Nome da Conta")
     account_type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='BANK')
     
-    # Este saldo deve ser recalculado a cada movimentação para garantir integridade
+    # Este saldo deve ser recalculado a cada movimentação para garantir integridade.
+    # Só muda por financial.services.apply_balance_delta() (UPDATE atômico com F()).
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00, verbose_name="Saldo Atual")
 
+    # Saldo antes da primeira movimentação: saldo = inicial + parcelas pagas/recebidas
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00, verbose_name="Saldo Inicial")
+
     class Meta:
         verbose_name = "Conta Financeira"
         verbose_name_plural = "Contas Financeiras"
@@ -23,6 +27,43 @@ class FinancialAccount(TenantAwareModel):
     def __str__(self):
         return f"{self.name} ({self.get_account_type_display()})"
 
+    def save(self, *args, **kwargs):
+        from .journal import post_opening_balance
+
+        # Na criação, saldo inicial e saldo atual partem do mesmo valor
+        creating = self._state.adding
+        if creating:
+            if self.opening_balance and not self.balance:
+                self.balance = self.opening_balance
+            elif self.balance and not self.opening_balance:
+                self.opening_balance = self.balance
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Saldo inicial entra no diário contra Patrimônio
+            if creating and self.opening_balance:
+                post_opening_balance(self, self.opening_balance, self.created_by)
+
+
+class AccountBalanceCheckpoint(models.Model):
+    """
+    Foto do saldo de uma conta no FIM de um dia (gerada pelo comando 'create_balance_checkpoints').
+    Saldo histórico = último checkpoint até a data + parcelas do intervalo seguinte.
+    Pagamentos com data retroativa apagam os checkpoints a partir daquela data.
+    """
+    account = models.ForeignKey(FinancialAccount, on_delete=models.CASCADE, related_name='checkpoints', verbose_name="Conta")
+    date = models.DateField(verbose_name="Data")
+    balance = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Saldo no Fim do Dia")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "Checkpoint de Saldo"
+        verbose_name_plural = "Checkpoints de Saldo"
+        unique_together = ('account', 'date')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.account.name} em {self.date}: R$ {self.balance}"
+
 
 class ChartOfAccounts(TenantAwareModel):
     OPERATION_CHOICES = [
@@ -45,6 +86,52 @@ class ChartOfAccounts(TenantAwareModel):
     def __str__(self):
         return f"{self.code} - {self.name}"
 
+    def clean(self):
+        # A conta pai não pode estar dentro da própria subárvore (criaria um ciclo)
+        if self.pk and self.parent_id and ChartOfAccountsClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id
+        ).exists():
+            raise ValidationError({'parent': "A Conta Pai não pode ser a própria categoria nem uma de suas subcategorias."})
+
+    def save(self, *args, **kwargs):
+        # A tabela de fechamento (ancestral -> descendente) acompanha cada criação/mudança de pai
+        from .chart import link_new_account, move_account
+
+        creating = self._state.adding
+        old_parent_id = None
+        if not creating:
+            old_parent_id = ChartOfAccounts.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if creating:
+                link_new_account(self)
+            elif old_parent_id != self.parent_id:
+                move_account(self)
+
+
+class ChartOfAccountsClosure(models.Model):
+    """
+    Tabela de fechamento (closure table) do Plano de Contas: uma linha para cada par
+    (ancestral, descendente), incluindo a própria conta com depth=0.
+    Subárvores e totais por grupo (Ex: tudo abaixo de 4.x) viram um JOIN simples e indexado,
+    sem recursão. Mantida por ChartOfAccounts.save() (ver financial.chart).
+    """
+    ancestor = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField(verbose_name="Distância")
+
+    class Meta:
+        verbose_name = "Hierarquia do Plano de Contas"
+        verbose_name_plural = "Hierarquia do Plano de Contas"
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
 
 class Ledger(TenantAwareModel):
     TRANS_TYPE_CHOICES = [
@@ -80,6 +167,11 @@ class Ledger(TenantAwareModel):
     due_date = models.DateField(db_index=True, verbose_name="Data de Competência/Vencimento")
     description = models.TextField(verbose_name="Histórico/Descrição")
 
+    # Totais das parcelas, mantidos junto com cada Installment pelos serviços de baixa
+    # (conferidos/corrigidos por 'manage.py verify_ledger_totals')
+    paid_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Total Pago")
+    installment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Qtd. Parcelas")
+
     # --- Link com Vendas (Futuro) ---
     # TODO: Descomentar no Passo 4 quando criarmos o app 'negotiations'
     negotiation = models.ForeignKey(
@@ -95,12 +187,22 @@ class Ledger(TenantAwareModel):
         verbose_name_plural = "Lançamentos"
         indexes = [
             models.Index(fields=['status', 'due_date']),
-            models.Index(fields=['transaction_type']),
+            # Projeção de caixa: cobre filtro + valores (o banco nem lê a tabela).
+            # Começa por transaction_type, então também atende os filtros só por tipo
+            # e o aging (tipo + status em aberto + vencimento, sem passar pelo histórico pago).
+            models.Index(
+                fields=['transaction_type', 'status', 'due_date', 'total_value', 'paid_total'],
+                name='ledger_cashflow_idx',
+            ),
         ]
 
     def __str__(self):
         return f"{self.get_transaction_type_display()} - {self.description} ({self.total_value})"
 
+    @property
+    def remaining_value(self):
+        return self.total_value - self.paid_total
+
 
 class Installment(TenantAwareModel):
     PAYMENT_METHODS = [
@@ -129,6 +231,9 @@ class Installment(TenantAwareModel):
     pay_date = models.DateField(null=True, blank=True, verbose_name="Data Pagamento")
     
     value = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Valor Parcela")
+    # Parte de 'value' que é juros do parcelamento (financial.schedule): o reparcelamento
+    # devolve estes juros antes de recalcular, para não cobrar juros sobre juros
+    interest = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name="Juros")
     paid_value = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, verbose_name="Valor Pago")
     
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS, null=True, blank=True, verbose_name="Forma Pagto")
@@ -137,6 +242,17 @@ class Installment(TenantAwareModel):
         verbose_name = "Parcela / Movimentação"
         verbose_name_plural = "Parcelas"
         unique_together = ('ledger', 'installment_number')
+        indexes = [
+            # Saldo histórico e conciliação: movimentos de uma conta num intervalo de datas
+            models.Index(fields=['financial_account', 'pay_date']),
+            # Parcelas previstas ainda não pagas (aging/parcelamento): índice parcial,
+            # as parcelas já pagas (quase todas) ficam de fora
+            models.Index(
+                fields=['ledger', 'due_date'],
+                condition=models.Q(pay_date__isnull=True),
+                name='installment_open_due_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Parc {self.installment_number} - {self.ledger}"
@@ -147,4 +263,202 @@ class Installment(TenantAwareModel):
              raise ValidationError("Para confirmar o pagamento, informe a Conta Financeira.")
         
         if self.pay_date and not self.payment_method:
-             raise ValidationError("Para confirmar o pagamento, informe a Forma de Pagamento.")
\ No newline at end of file
+             raise ValidationError("Para confirmar o pagamento, informe a Forma de Pagamento.")
+
+class BankStatementLine(TenantAwareModel):
+    """
+    Transação do extrato do banco (OFX/CSV) importada para conciliação.
+    A importação sugere o lançamento correspondente (mesmo valor, data próxima e,
+    quando o banco informa, o mesmo CPF/CNPJ); a baixa só acontece após confirmação.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Sem Correspondência'),
+        ('MATCHED', 'Correspondência Sugerida'),
+        ('SETTLED', 'Conciliado'),
+        ('IGNORED', 'Ignorado'),
+    ]
+
+    account = models.ForeignKey(FinancialAccount, on_delete=models.PROTECT, related_name='bank_lines', verbose_name="Conta")
+    # Identificador da transação no banco (FITID do OFX ou hash da linha do CSV): reimportar não duplica
+    fitid = models.CharField(max_length=64, verbose_name="ID no Banco")
+    date = models.DateField(verbose_name="Data")
+    # Crédito (+) / Débito (-)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Valor")
+    description = models.CharField(max_length=255, blank=True, default='', verbose_name="Histórico")
+    document = models.CharField(max_length=14, blank=True, default='', verbose_name="CPF/CNPJ (só dígitos)")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Status")
+    ledger = models.ForeignKey(
+        Ledger,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bank_lines',
+        verbose_name="Lançamento",
+    )
+    error = models.CharField(max_length=255, blank=True, default='', verbose_name="Erro na Baixa")
+
+    class Meta:
+        verbose_name = "Linha de Extrato Bancário"
+        verbose_name_plural = "Extrato Bancário (Conciliação)"
+        unique_together = ('account', 'fitid')
+        indexes = [
+            models.Index(fields=['account', 'status', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.description} ({self.amount})"
+
+
+class MonthlyAccountTotal(models.Model):
+    """
+    Tabela DERIVADA (agregado) do que foi pago/recebido por categoria e mês, lida pela DRE.
+    Não edite na mão: é somada pelas baixas (financial.dre.add_monthly_totals) e pode ser
+    reconstruída com 'manage.py rebuild_monthly_totals'.
+    """
+    chart_of_accounts = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE, related_name='monthly_totals', verbose_name="Categoria")
+    month = models.DateField(verbose_name="Mês")  # Sempre o dia 1
+    inflow = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Recebido")
+    outflow = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Pago")
+    movements = models.PositiveIntegerField(default=0, verbose_name="Qtd. Movimentos")
+
+    class Meta:
+        verbose_name = "Total Mensal por Categoria"
+        verbose_name_plural = "Totais Mensais por Categoria"
+        unique_together = ('chart_of_accounts', 'month')
+        indexes = [
+            # A DRE lê um intervalo de meses de todas as categorias
+            models.Index(fields=['month', 'chart_of_accounts']),
+        ]
+
+    def __str__(self):
+        return f"{self.chart_of_accounts_id} {self.month:%m/%Y}: +{self.inflow} -{self.outflow}"
+
+
+# --- DIÁRIO CONTÁBIL (PARTIDAS DOBRADAS) ---
+
+class ImmutableQuerySet(models.QuerySet):
+    """ Diário é só de inclusão: correções são feitas com lançamentos de estorno. """
+    def update(self, **kwargs):
+        raise ValidationError("Lançamentos do diário não podem ser alterados. Faça um estorno.")
+
+    def delete(self):
+        raise ValidationError("Lançamentos do diário não podem ser apagados. Faça um estorno.")
+
+
+class ImmutableModel(models.Model):
+    objects = ImmutableQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Lançamentos do diário não podem ser alterados. Faça um estorno.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Lançamentos do diário não podem ser apagados. Faça um estorno.")
+
+
+class JournalEntry(TenantAwareModel, ImmutableModel):
+    """
+    Partida do diário: um fato contábil com 2+ linhas de débito/crédito que se anulam.
+    Gravada pelos serviços (financial.journal), nunca editada.
+    """
+    SOURCE_CHOICES = [
+        ('OPENING', 'Saldo Inicial'),
+        ('ACCRUAL', 'Reconhecimento (Lançamento)'),
+        ('SETTLEMENT', 'Baixa (Pagamento/Recebimento)'),
+        ('REVERSAL', 'Estorno'),
+        ('ADJUSTMENT', 'Ajuste (Conferência)'),
+    ]
+
+    date = models.DateField(verbose_name="Data")
+    source = models.CharField(max_length=15, choices=SOURCE_CHOICES, verbose_name="Origem")
+    description = models.CharField(max_length=255, verbose_name="Histórico")
+
+    class Meta:
+        verbose_name = "Partida do Diário"
+        verbose_name_plural = "Diário Contábil"
+
+    def __str__(self):
+        return f"#{self.pk} {self.date} {self.description}"
+
+
+class JournalLine(ImmutableModel):
+    """
+    Linha de débito OU crédito. A "conta" é a combinação de 'kind' com a referência:
+    categoria do Plano de Contas, conta financeira (caixa/banco) ou as contas de controle
+    de clientes/fornecedores (detalhadas por entidade).
+    """
+    KIND_CHOICES = [
+        ('CATEGORY', 'Categoria (Plano de Contas)'),
+        ('CASH', 'Caixa / Banco'),
+        ('RECEIVABLE', 'Clientes a Receber'),
+        ('PAYABLE', 'Fornecedores a Pagar'),
+        ('EQUITY', 'Patrimônio (Saldos Iniciais)'),
+    ]
+
+    entry = models.ForeignKey(JournalEntry, on_delete=models.PROTECT, related_name='lines', verbose_name="Partida")
+    # Cópia da data da partida: balancetes filtram/agrupam só esta tabela
+    date = models.DateField(verbose_name="Data")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Conta")
+    chart_of_accounts = models.ForeignKey(ChartOfAccounts, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Categoria")
+    financial_account = models.ForeignKey(FinancialAccount, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Conta Financeira")
+    entity = models.ForeignKey(Entity, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Entidade")
+    ledger = models.ForeignKey(Ledger, on_delete=models.PROTECT, null=True, blank=True, related_name='journal_lines', verbose_name="Lançamento")
+    debit = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Débito")
+    credit = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Crédito")
+
+    class Meta:
+        verbose_name = "Linha do Diário"
+        verbose_name_plural = "Linhas do Diário"
+        indexes = [
+            # Balancete: linhas depois do último fechamento
+            models.Index(fields=['date', 'kind']),
+            models.Index(fields=['ledger', 'kind']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(models.Q(debit__gt=0, credit=0) | models.Q(debit=0, credit__gt=0)),
+                name='journal_line_debit_xor_credit',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} D {self.debit} C {self.credit}"
+
+
+class JournalPeriod(TenantAwareModel):
+    """
+    Mês fechado: nenhuma partida com data até o fim dele é aceita, e os saldos
+    ACUMULADOS de cada conta no fechamento ficam em JournalPeriodBalance.
+    """
+    month = models.DateField(unique=True, verbose_name="Mês")  # Sempre o dia 1
+    end_date = models.DateField(verbose_name="Último Dia")
+
+    class Meta:
+        verbose_name = "Período Fechado"
+        verbose_name_plural = "Períodos Fechados"
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.month:%m/%Y}"
+
+
+class JournalPeriodBalance(models.Model):
+    """ Saldo acumulado (débitos e créditos desde o início) de uma conta no fim de um período fechado. """
+    period = models.ForeignKey(JournalPeriod, on_delete=models.CASCADE, related_name='balances', verbose_name="Período")
+    kind = models.CharField(max_length=10, choices=JournalLine.KIND_CHOICES, verbose_name="Conta")
+    chart_of_accounts = models.ForeignKey(ChartOfAccounts, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Categoria")
+    financial_account = models.ForeignKey(FinancialAccount, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Conta Financeira")
+    debit = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Débitos")
+    credit = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Créditos")
+
+    class Meta:
+        verbose_name = "Saldo de Fechamento"
+        verbose_name_plural = "Saldos de Fechamento"
+
+    def __str__(self):
+        return f"{self.period} {self.kind}: D {self.debit} C {self.credit}"
@@ -0,0 +1,157 @@
+import calendar
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Ledger, Installment
+from .cashflow import invalidate_cash_flow
+from .journal import post_ledger_accrual
+from .services import next_installment_number
+
+CENT = Decimal('0.01')
+MAX_INSTALLMENTS = 480
+
+METHODS = {
+    'FIXED': 'Parcelas iguais (sem juros)',
+    'PRICE': 'Tabela Price (parcela fixa)',
+    'SAC': 'SAC (amortização constante)',
+}
+
+
+def _cents(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def add_months_keep_day(day, months):
+    """ Mesmo dia nos meses seguintes; em meses mais curtos cai no último dia (31/01 -> 28/02). """
+    index = day.year * 12 + day.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def build_schedule(principal, count, first_due_date, method='FIXED', monthly_rate=Decimal('0')):
+    """
+    Calcula o cronograma em Decimal, numa passada só e sem tocar no banco
+    (a pré-visualização usa direto). 'monthly_rate' em % ao mês.
+
+    - FIXED: principal / n, a diferença dos centavos vai na última parcela;
+    - PRICE: parcela fixa PMT = P·i / (1 - (1+i)^-n), juros sobre o saldo devedor;
+    - SAC: amortização fixa P / n, juros sobre o saldo (parcelas decrescentes).
+    Em todos, a última parcela zera o saldo (arredondamentos não sobram).
+
+    Retorna uma lista de dicts: number, due_date, value, interest, amortization, balance.
+    """
+    principal = _cents(Decimal(principal))
+    rate = Decimal(monthly_rate or 0) / 100
+    if method not in METHODS:
+        raise ValidationError("Forma de parcelamento inválida.")
+    if not 1 <= count <= MAX_INSTALLMENTS:
+        raise ValidationError(f"Informe de 1 a {MAX_INSTALLMENTS} parcelas.")
+    if principal <= 0:
+        raise ValidationError("Não há saldo a parcelar neste lançamento.")
+    if rate < 0:
+        raise ValidationError("A taxa de juros não pode ser negativa.")
+    if method == 'FIXED':
+        rate = Decimal('0')
+
+    if method == 'PRICE' and rate:
+        payment = _cents(principal * rate / (1 - (1 + rate) ** -count))
+    else:
+        payment = _cents(principal / count)
+    amortization = _cents(principal / count)
+
+    schedule = []
+    balance = principal
+    for number in range(1, count + 1):
+        interest = _cents(balance * rate)
+        if number == count:
+            amort = balance
+        elif method == 'PRICE':
+            amort = payment - interest
+        else:
+            amort = amortization
+        balance -= amort
+        schedule.append({
+            'number': number,
+            'due_date': add_months_keep_day(first_due_date, number - 1),
+            'value': amort + interest,
+            'interest': interest,
+            'amortization': amort,
+            'balance': balance,
+        })
+    return schedule
+
+
+def schedule_totals(schedule):
+    return {
+        'value': sum((row['value'] for row in schedule), Decimal('0.00')),
+        'interest': sum((row['interest'] for row in schedule), Decimal('0.00')),
+    }
+
+
+def outstanding_principal(ledger):
+    """
+    Base de um (re)parcelamento: o que falta pagar sem os juros ainda embutidos nas
+    parcelas em aberto. Reparcelar sobre remaining_value cobraria juros sobre juros.
+    """
+    interest = ledger.parcelas.filter(pay_date__isnull=True).aggregate(
+        total=Sum('interest', default=Decimal('0.00'))
+    )['total']
+    return ledger.remaining_value - interest
+
+
+def generate_installments(ledger_id, count, first_due_date, method, monthly_rate, user, replace=False):
+    """
+    Gera as parcelas em aberto (sem pagamento) de um lançamento sobre o que falta pagar.
+    1. Trava o lançamento; com 'replace', apaga as parcelas ainda não pagas (reparcelamento)
+       e recalcula sobre o principal que falta (sem os juros que estavam nelas).
+    2. Numeração continua depois da maior já usada (respeita (ledger, installment_number)).
+    3. UM bulk_create com o cronograma inteiro.
+    4. Juros do financiamento entram no total do lançamento (é o que será cobrado/pago);
+       no diário vai só a diferença (juros novos - juros retirados).
+    """
+    with transaction.atomic():
+        ledger = Ledger.objects.select_for_update().get(id=ledger_id)
+        if ledger.status in ['PAID', 'CANCELED']:
+            raise ValidationError("Este lançamento já está quitado ou cancelado.")
+
+        open_installments = ledger.parcelas.filter(pay_date__isnull=True)
+        if not replace and open_installments.exists():
+            raise ValidationError("Este lançamento já tem parcelas em aberto. Marque 'Substituir' para reparcelar.")
+
+        principal = outstanding_principal(ledger)
+        if replace:
+            removed = open_installments.delete()[1].get(Installment._meta.label, 0)
+            ledger.installment_count -= removed
+
+        schedule = build_schedule(principal, count, first_due_date, method, monthly_rate)
+        first_number = next_installment_number(ledger)
+
+        installments = Installment.objects.bulk_create([
+            Installment(
+                ledger=ledger,
+                installment_number=first_number + row['number'] - 1,
+                due_date=row['due_date'],
+                value=row['value'],
+                interest=row['interest'],
+                paid_value=Decimal('0.00'),
+                loja_id=ledger.loja_id,
+                created_by=user,
+            )
+            for row in schedule
+        ])
+
+        new_total = ledger.paid_total + schedule_totals(schedule)['value']
+        interest = new_total - ledger.total_value
+        ledger.total_value = new_total
+        ledger.installment_count += len(installments)
+        ledger.save(update_fields=['total_value', 'installment_count', 'updated_at'])
+        # Diferença do total (juros, ou a retirada deles num reparcelamento) entra no diário
+        post_ledger_accrual(ledger, user, amount=interest)
+        # bulk_create não passa pelos signals de Installment
+        invalidate_cash_flow()
+
+    return installments
@@ -1,62 +1,457 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.db import transaction
+from django.db.models import Sum, Count, Max, F, Q, Case, When, DecimalField, OuterRef, Subquery, Value, Window, RowRange
+from django.db.models.functions import RowNumber
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Ledger, Installment, FinancialAccount
+from .models import Ledger, Installment, FinancialAccount, AccountBalanceCheckpoint
+from .cashflow import invalidate_cash_flow
+from .dre import add_monthly_totals, monthly_delta
+from .journal import post_settlements
+
+MONEY = DecimalField(max_digits=15, decimal_places=2)
+
+
+def signed_paid_value():
+    """ Valor da parcela com sinal: recebimento entra (+), pagamento sai (-). """
+    return Case(
+        When(ledger__transaction_type='RECEIVABLE', then=F('paid_value')),
+        default=-F('paid_value'),
+        output_field=MONEY,
+    )
+
+
+def paid_movements(account_id):
+    """ Parcelas efetivamente pagas/recebidas numa conta (as que compõem o saldo). """
+    return Installment.objects.filter(financial_account_id=account_id, pay_date__isnull=False)
+
 
-def settle_ledger(ledger_id, amount, account_id, user, payment_method='TRANSFER'):
+def apply_balance_delta(account_id, delta, pay_date, require_funds=False):
+    """
+    Aplica uma variação no saldo com UPDATE atômico (balance = balance + delta),
+    sem SELECT ... FOR UPDATE na conta: o lock da linha dura só até o COMMIT.
+
+    Com require_funds=True, a própria UPDATE confere o saldo (WHERE balance >= valor)
+    e a função retorna False se não houver saldo suficiente.
+    """
+    accounts = FinancialAccount.objects.filter(id=account_id)
+    if require_funds and delta < 0:
+        accounts = accounts.filter(balance__gte=-delta)
+
+    if not accounts.update(balance=F('balance') + delta, updated_at=timezone.now()):
+        return False
+
+    # Movimento retroativo: os checkpoints a partir da data deixaram de valer
+    AccountBalanceCheckpoint.objects.filter(account_id=account_id, date__gte=pay_date).delete()
+    # update() não dispara signals: o saldo inicial da projeção de caixa mudou
+    invalidate_cash_flow()
+    return True
+
+
+def next_installment_number(ledger):
+    """
+    Próximo nº de parcela do lançamento: MAX(installment_number) + 1.
+    Chamar com o lançamento travado (select_for_update). Não usa installment_count,
+    que é só a contagem conferida: parcelas criadas fora dos serviços (Ex: inline do admin)
+    não passam por ele e a numeração não precisa ser contígua.
+    """
+    last = ledger.parcelas.aggregate(last=Max('installment_number'))['last']
+    return (last or 0) + 1
+
+
+def _settle_scheduled(ledger, amount, account, payment_method, pay_date):
+    """
+    Lançamento parcelado (financial.schedule): a baixa quita as parcelas em aberto
+    por ordem de vencimento, no próprio registro. Se sobrar um valor menor que a
+    próxima parcela, ele abate dessa parcela (o saldo das parcelas continua igual ao
+    que falta pagar; o abatimento paga primeiro os juros embutidos nela).
+    Retorna (parcelas quitadas, valor que sobrou).
+    """
+    settled = []
+    scheduled = ledger.parcelas.filter(pay_date__isnull=True).order_by('due_date', 'installment_number')
+    for installment in scheduled:
+        if amount < installment.value:
+            if amount > 0:
+                Installment.objects.filter(id=installment.id).update(
+                    value=F('value') - amount, interest=max(installment.interest - amount, Decimal('0.00')),
+                )
+            break
+        installment.pay_date = pay_date
+        installment.paid_value = installment.value
+        installment.financial_account = account
+        installment.payment_method = payment_method
+        amount -= installment.value
+        settled.append(installment)
+
+    Installment.objects.bulk_update(settled, ['pay_date', 'paid_value', 'financial_account', 'payment_method'])
+    return settled, amount
+
+
+def settle_ledger(ledger_id, amount, account_id, user, payment_method='TRANSFER', pay_date=None):
     """
     Realiza a baixa (pagamento/recebimento) de um lançamento.
-    1. Cria a Parcela (Installment) confirmando o fluxo.
-    2. Atualiza o Saldo da Conta Bancária.
-    3. Atualiza o Status do Lançamento (Ledger).
+    'pay_date' permite baixar com a data real do movimento (Ex: conciliação bancária); padrão: hoje.
+    1. Quita as parcelas previstas (se o lançamento foi parcelado) e cria a Parcela
+       (Installment) avulsa com o que sobrar, confirmando o fluxo.
+    2. Atualiza o Status do Lançamento (Ledger).
+    3. Atualiza o Saldo da Conta Bancária (delta atômico, por último para segurar o lock o mínimo possível).
     """
     with transaction.atomic():
-        # 1. Busca e Trava os registros
+        # 1. Busca e Trava o lançamento (a conta não é travada: o saldo é atualizado com F())
         ledger = Ledger.objects.select_for_update().get(id=ledger_id)
-        account = FinancialAccount.objects.select_for_update().get(id=account_id)
+        account = FinancialAccount.objects.get(id=account_id)
 
         if ledger.status in ['PAID', 'CANCELED']:
             raise ValidationError("Este lançamento já está quitado ou cancelado.")
 
-        # --- TRAVA DE SALDO (NOVO) ---
-        # Se for PAGAMENTO (Dinheiro saindo) e não tiver saldo...
-        if ledger.transaction_type == 'PAYABLE':
-            if account.balance < amount:
-                raise ValidationError(f"Saldo insuficiente em '{account.name}'. Disponível: R$ {account.balance}, Necessário: R$ {amount}")
-
-        # 2. Cria o registro do movimento financeiro (O Recibo)
-        # Calcula o número da parcela (se já tiver parciais, soma 1)
-        next_num = ledger.parcelas.count() + 1
-        
-        Installment.objects.create(
-            ledger=ledger,
-            financial_account=account,
-            installment_number=next_num,
-            due_date=timezone.now().date(),
-            pay_date=timezone.now().date(), # Data real do pagamento
-            value=amount,     # Valor original previsto (simplificado)
-            paid_value=amount, # Valor efetivamente pago
-            payment_method=payment_method,
-            loja_id=ledger.loja_id,
-            created_by=user
-        )
+        pay_date = pay_date or timezone.now().date()
 
-        # 3. Atualiza Saldo da Conta
-        if ledger.transaction_type == 'RECEIVABLE':
-            account.balance += amount # Dinheiro entra
-        else:
-            account.balance -= amount # Dinheiro sai
-        account.save()
+        # 2. Parcelas previstas primeiro; o restante vira o registro do movimento (O Recibo)
+        settled, leftover = _settle_scheduled(ledger, amount, account, payment_method, pay_date)
+        movements = len(settled)
+
+        if leftover > 0:
+            ledger.installment_count += 1
+            Installment.objects.create(
+                ledger=ledger,
+                financial_account=account,
+                installment_number=next_installment_number(ledger),
+                due_date=pay_date,
+                pay_date=pay_date, # Data real do pagamento
+                value=leftover,     # Valor original previsto (simplificado)
+                paid_value=leftover, # Valor efetivamente pago
+                payment_method=payment_method,
+                loja_id=ledger.loja_id,
+                created_by=user
+            )
+            movements += 1
+
+        # 3. Atualiza Totais e Status do Lançamento Pai (travado acima, então é seguro somar aqui)
+        ledger.paid_total += amount
 
-        # 4. Atualiza Status do Lançamento Pai
         # Verifica se quitou tudo (Total - Pago)
-        total_pago = sum(p.paid_value for p in ledger.parcelas.all())
-        
-        if total_pago >= ledger.total_value:
+        if ledger.paid_total >= ledger.total_value:
             ledger.status = 'PAID'
         else:
             ledger.status = 'PARTIAL'
-        
-        ledger.save()
 
-    return ledger
\ No newline at end of file
+        ledger.save(update_fields=['paid_total', 'installment_count', 'status', 'updated_at'])
+
+        # Agregado mensal da DRE e diário contábil (mesma transação: somem juntos num rollback)
+        add_monthly_totals(monthly_delta(ledger, pay_date, amount, movements=movements))
+        post_settlements([(ledger, amount)], account.id, pay_date, user)
+
+        # 4. Atualiza Saldo da Conta
+        # --- TRAVA DE SALDO ---
+        # Se for PAGAMENTO (Dinheiro saindo), a UPDATE só acontece se houver saldo
+        if ledger.transaction_type == 'RECEIVABLE':
+            delta = amount # Dinheiro entra
+        else:
+            delta = -amount # Dinheiro sai
+
+        if not apply_balance_delta(account.id, delta, pay_date, require_funds=ledger.transaction_type == 'PAYABLE'):
+            account.refresh_from_db(fields=['balance'])
+            raise ValidationError(f"Saldo insuficiente em '{account.name}'. Disponível: R$ {account.balance}, Necessário: R$ {amount}")
+
+    return ledger
+
+
+def settle_ledgers_bulk(ledger_ids, account_id, user, payment_method='TRANSFER'):
+    """
+    Quita de uma vez vários lançamentos (Ex: fechamento do mês) pela mesma conta,
+    cada um pelo valor que falta pagar/receber. Tudo ou nada, numa única transação:
+    1. Trava os lançamentos em ordem de ID (ordem fixa evita deadlock entre lotes concorrentes).
+    2. O que falta de cada um vem de Ledger.paid_total (sem somar parcelas).
+    3. Parcelas previstas (parcelamento) quitadas com UM update(); bulk_create das
+       parcelas avulsas com o restante e bulk_update de status/totais dos lançamentos.
+    4. Agregado mensal da DRE somado por categoria (não por lançamento) e uma partida no diário.
+    5. UM delta líquido no saldo da conta, conferindo o saldo uma única vez.
+    """
+    try:
+        ids = sorted({int(i) for i in ledger_ids})
+    except (TypeError, ValueError):
+        raise ValidationError("Seleção de lançamentos inválida.")
+    if not ids:
+        raise ValidationError("Selecione ao menos um lançamento.")
+    if payment_method not in dict(Installment.PAYMENT_METHODS):
+        raise ValidationError("Forma de pagamento inválida.")
+
+    with transaction.atomic():
+        ledgers = list(Ledger.objects.select_for_update().filter(id__in=ids).order_by('id'))
+        if len(ledgers) != len(ids):
+            raise ValidationError("Alguns lançamentos selecionados não existem mais.")
+
+        try:
+            account = FinancialAccount.objects.get(id=account_id)
+        except (FinancialAccount.DoesNotExist, ValueError, TypeError):
+            raise ValidationError("Selecione a conta financeira.")
+
+        closed = [l for l in ledgers if l.status in ['PAID', 'CANCELED']]
+        if closed:
+            raise ValidationError(f"O lançamento '{closed[0].description}' já está quitado ou cancelado.")
+
+        today = timezone.now().date()
+        now = timezone.now()
+
+        # Parcelas previstas em aberto: soma/quantidade por lançamento numa query agrupada
+        scheduled_rows = Installment.objects.filter(ledger_id__in=ids, pay_date__isnull=True)
+        scheduled = {
+            row['ledger_id']: (row['total'], row['count'])
+            for row in scheduled_rows.values('ledger_id').annotate(total=Sum('value'), count=Count('id')).order_by()
+        }
+        # Último nº de parcela de cada lançamento (também agrupado), para numerar as avulsas
+        last_numbers = dict(
+            Installment.objects.filter(ledger_id__in=ids)
+            .values('ledger_id').annotate(last=Max('installment_number')).order_by()
+            .values_list('ledger_id', 'last')
+        )
+        scheduled_rows.update(
+            pay_date=today, paid_value=F('value'), financial_account=account, payment_method=payment_method
+        )
+
+        installments = []
+        deltas = {}
+        settlements = []
+        total_in = Decimal('0.00')
+        total_out = Decimal('0.00')
+        for ledger in ledgers:
+            scheduled_total, scheduled_count = scheduled.get(ledger.id, (Decimal('0.00'), 0))
+            leftover = ledger.remaining_value - scheduled_total
+            ledger.status = 'PAID'
+            ledger.updated_at = now
+
+            if leftover > 0:
+                ledger.installment_count += 1
+                installments.append(Installment(
+                    ledger=ledger,
+                    financial_account=account,
+                    installment_number=last_numbers.get(ledger.id, 0) + 1,
+                    due_date=today,
+                    pay_date=today,
+                    value=leftover,
+                    paid_value=leftover,
+                    payment_method=payment_method,
+                    loja_id=ledger.loja_id,
+                    created_by=user,
+                ))
+            paid = scheduled_total + max(leftover, Decimal('0.00'))
+            if not paid:
+                continue
+
+            ledger.paid_total += paid
+            monthly_delta(ledger, today, paid, deltas, movements=scheduled_count + (leftover > 0))
+            settlements.append((ledger, paid))
+            if ledger.transaction_type == 'RECEIVABLE':
+                total_in += paid
+            else:
+                total_out += paid
+
+        Installment.objects.bulk_create(installments)
+        Ledger.objects.bulk_update(ledgers, ['status', 'paid_total', 'installment_count', 'updated_at'])
+        invalidate_cash_flow()
+        add_monthly_totals(deltas)
+        # Uma partida para o lote inteiro (linhas por lançamento)
+        post_settlements(settlements, account.id, today, user)
+
+        net = total_in - total_out
+        if net and not apply_balance_delta(account.id, net, today, require_funds=net < 0):
+            account.refresh_from_db(fields=['balance'])
+            raise ValidationError(
+                f"Saldo insuficiente em '{account.name}'. Disponível: R$ {account.balance}, Necessário: R$ {-net}"
+            )
+
+    return {
+        'settled': len(ledgers),
+        'received': total_in,
+        'paid': total_out,
+        'net': net,
+    }
+
+
+# --- SALDOS HISTÓRICOS E CONCILIAÇÃO ---
+
+def account_balance_at(account, on_date):
+    """
+    Saldo da conta no fim do dia 'on_date'.
+    Custa 2 queries: o último checkpoint até a data e a soma das parcelas depois dele.
+    """
+    checkpoint = account.checkpoints.filter(date__lte=on_date).order_by('-date').first()
+    movements = paid_movements(account.id).filter(pay_date__lte=on_date)
+
+    if checkpoint:
+        start = checkpoint.balance
+        movements = movements.filter(pay_date__gt=checkpoint.date)
+    else:
+        start = account.opening_balance
+
+    return start + (movements.aggregate(total=Sum(signed_paid_value()))['total'] or 0)
+
+
+def create_balance_checkpoints(on_date=None):
+    """
+    Grava (ou regrava) o checkpoint do fim do dia para todas as contas.
+    Padrão: ontem, pois o dia de hoje ainda pode receber movimentos.
+    """
+    on_date = on_date or timezone.now().date() - timedelta(days=1)
+    checkpoints = [
+        AccountBalanceCheckpoint(account=account, date=on_date, balance=account_balance_at(account, on_date))
+        for account in FinancialAccount.objects.all()
+    ]
+    AccountBalanceCheckpoint.objects.bulk_create(
+        checkpoints,
+        update_conflicts=True,
+        unique_fields=['account', 'date'],
+        update_fields=['balance'],
+    )
+    return checkpoints
+
+
+def _movements_total(filters):
+    subquery = (
+        Installment.objects.filter(pay_date__isnull=False, **filters)
+        .values('financial_account')
+        .annotate(total=Sum(signed_paid_value()))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery, output_field=MONEY), Value(0), output_field=MONEY)
+
+
+def find_balance_drift(checkpoint_days=30):
+    """
+    Recalcula os saldos a partir das parcelas e aponta divergências.
+    - Contas: saldo inicial + soma das parcelas (uma query para todas as contas).
+    - Checkpoints dos últimos 'checkpoint_days' dias (uma query para todos).
+    Retorna (contas, checkpoints), cada item com 'expected' anotado.
+    """
+    accounts = FinancialAccount.objects.annotate(
+        expected=F('opening_balance') + _movements_total({'financial_account': OuterRef('pk')})
+    ).order_by('id')
+
+    since = timezone.now().date() - timedelta(days=checkpoint_days)
+    checkpoints = AccountBalanceCheckpoint.objects.filter(date__gte=since).annotate(
+        expected=F('account__opening_balance') + _movements_total({
+            'financial_account': OuterRef('account'),
+            'pay_date__lte': OuterRef('date'),
+        })
+    ).select_related('account').order_by('account_id', 'date')
+
+    # Comparação em Python (Decimal), imune a arredondamentos do SQLite
+    return (
+        [a for a in accounts if a.balance != a.expected],
+        [c for c in checkpoints if c.balance != c.expected],
+    )
+
+
+def fix_balance_drift(accounts, checkpoints):
+    """
+    Corrige as divergências encontradas por find_balance_drift().
+    O saldo é recalculado com a conta travada (pagamentos concorrentes esperam) e
+    os checkpoints divergentes são apagados (o próximo create_balance_checkpoints regrava).
+    """
+    for account in accounts:
+        with transaction.atomic():
+            account = FinancialAccount.objects.select_for_update().get(id=account.id)
+            movements = paid_movements(account.id).aggregate(total=Sum(signed_paid_value()))['total'] or 0
+            FinancialAccount.objects.filter(id=account.id).update(
+                balance=account.opening_balance + movements, updated_at=timezone.now()
+            )
+
+    AccountBalanceCheckpoint.objects.filter(id__in=[c.id for c in checkpoints]).delete()
+    if accounts:
+        invalidate_cash_flow()
+
+
+# --- EXTRATO COM SALDO CORRIDO ---
+
+def statement_movements(start_date, end_date, account_id=None):
+    """ Movimentos do extrato: parcelas pagas numa conta bancária dentro do período. """
+    movements = Installment.objects.filter(
+        pay_date__range=[start_date, end_date],
+        financial_account__isnull=False,
+        paid_value__gt=0,
+    )
+    if account_id:
+        movements = movements.filter(financial_account_id=account_id)
+    return movements
+
+
+def statement_opening_balance(start_date, account=None):
+    """
+    Saldo no início do período (fim do dia anterior a 'start_date').
+    Uma conta: usa o checkpoint mais próximo (account_balance_at).
+    Todas as contas: saldos iniciais + movimentos anteriores, 2 queries no total.
+    """
+    day_before = start_date - timedelta(days=1)
+    if account is not None:
+        return account_balance_at(account, day_before)
+
+    opening = FinancialAccount.objects.aggregate(total=Sum('opening_balance'))['total'] or 0
+    movements = Installment.objects.filter(
+        financial_account__isnull=False, pay_date__lte=day_before
+    ).aggregate(total=Sum(signed_paid_value()))['total'] or 0
+    return opening + movements
+
+
+def statement_totals(movements):
+    """ Entradas e saídas do período numa única passada (SUM condicional). """
+    totals = movements.aggregate(
+        total_in=Sum('paid_value', filter=Q(ledger__transaction_type='RECEIVABLE')),
+        total_out=Sum('paid_value', filter=Q(ledger__transaction_type='PAYABLE')),
+    )
+    return totals['total_in'] or Decimal('0.00'), totals['total_out'] or Decimal('0.00')
+
+
+def with_running_balance(movements, opening_balance):
+    """
+    Anota cada movimento com:
+    - signed_value: valor com sinal (+ entrada, - saída);
+    - running_balance: saldo após o movimento, via SUM() OVER (ORDER BY pay_date, id)
+      somado ao saldo de abertura;
+    - line: posição no extrato (ROW_NUMBER), usada como cursor da paginação.
+
+    A paginação deve filtrar por 'line' (e não por data/id): filtros sobre uma
+    window function vão para uma query externa, então a janela continua
+    enxergando o período inteiro e o saldo de cada página sai correto.
+    """
+    order = [F('pay_date').asc(), F('id').asc()]
+    return movements.annotate(
+        signed_value=signed_paid_value(),
+        running_balance=Value(opening_balance, output_field=MONEY) + Window(
+            Sum(signed_paid_value()), order_by=order, frame=RowRange(start=None, end=0)
+        ),
+        line=Window(RowNumber(), order_by=order),
+    )
+
+
+# --- TOTAIS DOS LANÇAMENTOS (paid_total / installment_count) ---
+
+def find_ledger_total_drift():
+    """
+    Recalcula paid_total e installment_count de TODOS os lançamentos com uma única
+    query agrupada (LEFT JOIN nas parcelas + SUM/COUNT), lida em streaming.
+    Gera (id, paid_total, installment_count, calc_paid, calc_count) dos divergentes.
+    """
+    rows = Ledger.objects.annotate(
+        calc_paid=Coalesce(Sum('parcelas__paid_value'), Value(0), output_field=MONEY),
+        calc_count=Count('parcelas'),
+    ).values_list('id', 'paid_total', 'installment_count', 'calc_paid', 'calc_count').order_by()
+
+    for row in rows.iterator(chunk_size=2000):
+        ledger_id, paid_total, installment_count, calc_paid, calc_count = row
+        # Comparação em Python (Decimal), imune a arredondamentos do SQLite
+        if paid_total != calc_paid or installment_count != calc_count:
+            yield row
+
+
+def fix_ledger_totals(rows):
+    """ Grava os totais recalculados (lista de tuplas de find_ledger_total_drift). """
+    ledgers = [
+        Ledger(id=ledger_id, paid_total=calc_paid, installment_count=calc_count)
+        for ledger_id, _, _, calc_paid, calc_count in rows
+    ]
+    Ledger.objects.bulk_update(ledgers, ['paid_total', 'installment_count'], batch_size=500)
+    invalidate_cash_flow()
+    return len(ledgers)
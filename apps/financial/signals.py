@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Ledger, Installment
+from .cashflow import invalidate_cash_flow
+
+
+# Qualquer gravação em lançamentos/parcelas invalida a projeção de caixa em cache
+# (gravações em lote chamam invalidate_cash_flow() diretamente)
+@receiver(post_save, sender=Ledger)
+@receiver(post_delete, sender=Ledger)
+@receiver(post_save, sender=Installment)
+@receiver(post_delete, sender=Installment)
+def ledger_changed(sender, **kwargs):
+    invalidate_cash_flow()
@@ -1,3 +1,87 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
 from django.test import TestCase
 
-# Create your tests here.
+from parties.models import Entity
+from financial.models import (
+    ChartOfAccounts, FinancialAccount, Installment, JournalEntry, JournalLine, Ledger, MonthlyAccountTotal,
+)
+from financial.journal import post_ledger_accrual
+from financial.schedule import generate_installments
+from financial.services import settle_ledgers_bulk
+
+
+class RescheduleTests(TestCase):
+    def setUp(self):
+        entity = Entity.objects.create(nome_razao_social="Cliente Teste", documento_principal="00000000191")
+        category = ChartOfAccounts.objects.create(name="Venda de Veículos", code="9.01", operation_type='REVENUE')
+        self.ledger = Ledger.objects.create(
+            entity=entity,
+            chart_of_accounts=category,
+            total_value=Decimal('1000.00'),
+            transaction_type='RECEIVABLE',
+            due_date=date(2026, 1, 10),
+            description="Financiamento teste",
+        )
+        post_ledger_accrual(self.ledger, None)
+
+    def recognized(self):
+        totals = JournalLine.objects.filter(ledger=self.ledger, kind='CATEGORY').aggregate(
+            debit=Sum('debit'), credit=Sum('credit')
+        )
+        return totals['credit'] - totals['debit']
+
+    def test_reschedule_does_not_charge_interest_on_interest(self):
+        generate_installments(self.ledger.id, 10, date(2026, 2, 10), 'PRICE', Decimal('2'), None)
+        self.ledger.refresh_from_db()
+        self.assertEqual(self.ledger.total_value, Decimal('1113.25'))
+
+        # Mesmos parâmetros: o total não muda e o diário não reconhece juros a mais
+        generate_installments(self.ledger.id, 10, date(2026, 2, 10), 'PRICE', Decimal('2'), None, replace=True)
+        self.ledger.refresh_from_db()
+        self.assertEqual(self.ledger.total_value, Decimal('1113.25'))
+        self.assertEqual(self.ledger.installment_count, 10)
+        self.assertEqual(self.recognized(), Decimal('1113.25'))
+
+        # Sem juros: volta ao principal e o diário estorna os juros
+        generate_installments(self.ledger.id, 5, date(2026, 2, 10), 'FIXED', Decimal('0'), None, replace=True)
+        self.ledger.refresh_from_db()
+        self.assertEqual(self.ledger.total_value, Decimal('1000.00'))
+        self.assertEqual(self.recognized(), Decimal('1000.00'))
+
+
+class BulkSettleTests(TestCase):
+    def setUp(self):
+        entity = Entity.objects.create(nome_razao_social="Fornecedor Teste", documento_principal="00000000191")
+        self.account = FinancialAccount.objects.create(name="Caixa", account_type='CASH', opening_balance=Decimal('100.00'))
+        revenue = ChartOfAccounts.objects.create(name="Venda de Veículos", code="9.01", operation_type='REVENUE')
+        expense = ChartOfAccounts.objects.create(name="Compra de Veículos", code="9.02", operation_type='EXPENSE')
+        self.ledgers = [
+            Ledger.objects.create(
+                entity=entity, chart_of_accounts=category, total_value=value, transaction_type=transaction_type,
+                due_date=date(2026, 1, 10), description=description,
+            )
+            for category, value, transaction_type, description in [
+                (revenue, Decimal('300.00'), 'RECEIVABLE', "Venda teste"),
+                (expense, Decimal('500.00'), 'PAYABLE', "Compra teste"),
+            ]
+        ]
+
+    def test_overdraft_rolls_back_the_whole_batch(self):
+        # Líquido do lote: +300 - 500 = -200, com R$ 100 na conta
+        with self.assertRaisesMessage(ValidationError, "Saldo insuficiente"):
+            settle_ledgers_bulk([ledger.id for ledger in self.ledgers], self.account.id, None)
+
+        for ledger in self.ledgers:
+            ledger.refresh_from_db()
+            self.assertEqual(ledger.status, 'OPEN')
+            self.assertEqual(ledger.paid_total, Decimal('0.00'))
+            self.assertEqual(ledger.installment_count, 0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertFalse(Installment.objects.exists())
+        self.assertFalse(JournalEntry.objects.filter(source='SETTLEMENT').exists())
+        self.assertFalse(MonthlyAccountTotal.objects.exists())
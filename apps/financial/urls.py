@@ -3,10 +3,21 @@ from . import views
 
 urlpatterns = [
     path('', views.financial_list, name='financial_list'),
+    path('settle-bulk/', views.financial_settle_bulk, name='financial_settle_bulk'),
     path('statement/', views.financial_statement, name='financial_statement'),
+    path('export/', views.financial_export, name='financial_export'),
+    path('statement/export/', views.financial_statement_export, name='financial_statement_export'),
+    path('cash-flow/', views.cash_flow_report, name='cash_flow_report'),
+    path('dre/', views.dre_report, name='dre_report'),
+    path('aging/', views.aging_report, name='aging_report'),
+    path('aging/export/', views.aging_report_export, name='aging_report_export'),
+    path('trial-balance/', views.trial_balance_report, name='trial_balance_report'),
+    path('bank/import/', views.bank_statement_import, name='bank_statement_import'),
+    path('bank/reconciliation/', views.bank_reconciliation, name='bank_reconciliation'),
 
     # Rota para o Lançamento Manual
     path('new-manual/', views.ledger_manual_create, name='ledger_manual_create'),
+    path('<int:pk>/schedule/', views.ledger_schedule, name='ledger_schedule'),
 
     # --- NOVAS ROTAS DE PLANO DE CONTAS ---
     path('chart-of-accounts/', views.chart_of_accounts_list, name='chart_of_accounts_list'),
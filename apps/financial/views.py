@@ -1,17 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from core.pagination import paginate_keyset
+from core.exports import stream_csv, money, EXPORT_CHUNK_SIZE
+import json
+from django.http import JsonResponse, Http404
+from django.views.decorators.http import require_POST
 from .models import Ledger, FinancialAccount
 from decimal import Decimal
-from .services import settle_ledger
+from .services import (
+    settle_ledger, settle_ledgers_bulk, statement_movements, statement_opening_balance,
+    statement_totals, with_running_balance,
+)
+from vehicles.services import refresh_vehicle_profitability
 from django.core.exceptions import ValidationError
 
-from django.db.models import Sum
+from django.utils.dateparse import parse_date
 from datetime import date, timedelta
 from .models import Installment
 
 # ... (imports anteriores: render, redirect, messages, etc.) ...
-from .forms import ManualLedgerForm
+from .forms import ManualLedgerForm, BankStatementImportForm, InstallmentScheduleForm
+from .cashflow import cash_flow_projection, GRANULARITIES
+from .dre import build_dre, add_months, month_start
+from .schedule import build_schedule, schedule_totals, generate_installments, outstanding_principal
+from .aging import AGING_BUCKETS, aging_by_entity, aging_titles
+from .journal import post_ledger_accrual, trial_balance, close_period
+from .models import JournalPeriod
+from django.db import transaction
+from .bank_import import (
+    open_statement, iter_statement_rows, import_bank_statement, match_bank_lines,
+    settle_bank_lines, unmatch_bank_lines, ignore_bank_lines,
+)
+from .models import BankStatementLine
+from .chart import chart_tree, chart_rollup
 
 # ... (imports anteriores: render, redirect, messages, etc.) ...
 from django.db.models import ProtectedError # Importar para a lógica de exclusão
@@ -21,7 +44,7 @@ from .forms import ChartOfAccountsForm # Importar o formulário
 @login_required
 def financial_list(request):
     # Lista apenas o que está pendente
-    ledgers = Ledger.objects.filter(status__in=['OPEN', 'PARTIAL']).order_by('due_date')
+    ledgers = Ledger.objects.filter(status__in=['OPEN', 'PARTIAL']).select_related('entity', 'chart_of_accounts')
     accounts = FinancialAccount.objects.all()
 
     if request.method == 'POST':
@@ -57,52 +80,393 @@ def financial_list(request):
             # Se for um erro técnico (código quebrado), mostra o erro genérico
             messages.error(request, f"Erro técnico ao processar: {str(e)}")
 
-    return render(request, 'financial/financial_list.html', {
-        'ledgers': ledgers,
+    page = paginate_keyset(request, ledgers, ordering=['due_date', 'id'])
+    context = {
+        'ledgers': page,
+        'page': page,
         'accounts': accounts
-    })
+    }
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'financial/partials/ledger_table_rows.html', context)
 
+    return render(request, 'financial/financial_list.html', context)
 
 
 @login_required
-def financial_statement(request):
+@require_POST
+def financial_settle_bulk(request):
+    """
+    Baixa em lote dos lançamentos marcados na lista.
+    Aceita o formulário da tela ou JSON ({"ledger_ids": [...], "account_id": 1})
+    para integrações; no JSON a resposta também é JSON.
+    """
+    is_json = request.content_type == 'application/json'
+    try:
+        if is_json:
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                raise ValidationError("JSON inválido.")
+            if not isinstance(data, dict):
+                raise ValidationError("Envie um objeto JSON com 'ledger_ids' e 'account_id'.")
+            ledger_ids = data.get('ledger_ids') or []
+            if not isinstance(ledger_ids, list):
+                raise ValidationError("'ledger_ids' deve ser uma lista.")
+            account_id = data.get('account_id')
+            payment_method = data.get('payment_method') or 'TRANSFER'
+        else:
+            ledger_ids = request.POST.getlist('ledger_ids')
+            account_id = request.POST.get('account_id')
+            payment_method = request.POST.get('payment_method') or 'TRANSFER'
+
+        result = settle_ledgers_bulk(ledger_ids, account_id, request.user, payment_method=payment_method)
+
+    except ValidationError as e:
+        msg_erro = e.messages[0] if hasattr(e, 'messages') else str(e)
+        if is_json:
+            return JsonResponse({'error': msg_erro}, status=400)
+        messages.error(request, msg_erro)
+        return redirect('financial_list')
+
+    if is_json:
+        return JsonResponse({key: str(value) if isinstance(value, Decimal) else value for key, value in result.items()})
+
+    messages.success(
+        request,
+        f"{result['settled']} lançamento(s) baixado(s). Recebido: R$ {result['received']} | Pago: R$ {result['paid']}."
+    )
+    return redirect('financial_list')
+
+
+
+@login_required
+def financial_export(request):
+    """ Exporta as contas em aberto (A Pagar/A Receber) em CSV, via streaming. """
+    ledgers = Ledger.objects.filter(status__in=['OPEN', 'PARTIAL']).order_by('due_date', 'id')
+    type_labels = dict(Ledger.TRANS_TYPE_CHOICES)
+    status_labels = dict(Ledger.STATUS_CHOICES)
+
+    def rows():
+        for row in ledgers.values(
+            'due_date', 'transaction_type', 'status', 'description', 'chart_of_accounts__code',
+            'chart_of_accounts__name', 'entity__nome_razao_social', 'entity__documento_principal',
+            'vehicle__plate', 'total_value', 'paid_total',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                row['due_date'].strftime('%d/%m/%Y'), type_labels[row['transaction_type']], status_labels[row['status']],
+                row['description'], row['chart_of_accounts__code'], row['chart_of_accounts__name'],
+                row['entity__nome_razao_social'], row['entity__documento_principal'], row['vehicle__plate'] or '',
+                money(row['total_value']), money(row['paid_total']), money(row['total_value'] - row['paid_total']),
+            ]
+
+    header = [
+        'Vencimento', 'Tipo', 'Status', 'Descrição', 'Cód. Categoria', 'Categoria',
+        'Entidade', 'CPF/CNPJ', 'Placa (Centro de Custo)', 'Valor Total', 'Valor Pago', 'Saldo a Quitar',
+    ]
+    return stream_csv('contas_em_aberto.csv', header, rows())
+
+
+def _date_param(request, name, default):
+    """ Data do GET (AAAA-MM-DD); valor vazio ou inválido cai no padrão. """
+    try:
+        return parse_date(request.GET.get(name) or '') or default
+    except ValueError:
+        return default
+
+
+def _statement_filters(request):
+    """ Filtros do extrato (período e conta), compartilhados com a exportação. """
     # Filtros Padrão: Mês Atual
     today = date.today()
     first_day = today.replace(day=1)
-    
-    start_date = request.GET.get('start_date', first_day.isoformat())
-    end_date = request.GET.get('end_date', today.isoformat())
+
+    start_date = _date_param(request, 'start_date', first_day)
+    end_date = _date_param(request, 'end_date', today)
     account_id = request.GET.get('account_id', '')
+    account = FinancialAccount.objects.filter(id=account_id).first() if account_id.isdigit() else None
 
-    # Base: Apenas parcelas PAGAS
-    movements = Installment.objects.filter(
-        pay_date__range=[start_date, end_date],
-        paid_value__gt=0
-    ).select_related('ledger', 'ledger__entity', 'financial_account').order_by('-pay_date', '-id')
+    # Base: Apenas parcelas PAGAS, com o saldo corrido a partir do saldo de abertura do período
+    movements = statement_movements(start_date, end_date, account.id if account else None)
+    opening_balance = statement_opening_balance(start_date, account)
 
-    if account_id:
-        movements = movements.filter(financial_account_id=account_id)
+    return movements, opening_balance, start_date, end_date, account
 
-    # Totais do Período
-    total_in = movements.filter(ledger__transaction_type='RECEIVABLE').aggregate(Sum('paid_value'))['paid_value__sum'] or 0
-    total_out = movements.filter(ledger__transaction_type='PAYABLE').aggregate(Sum('paid_value'))['paid_value__sum'] or 0
+
+@login_required
+def financial_statement(request):
+    movements, opening_balance, start_date, end_date, account = _statement_filters(request)
+
+    # Totais do Período (uma única query com SUM condicional)
+    total_in, total_out = statement_totals(movements)
     balance_period = total_in - total_out
 
-    accounts = FinancialAccount.objects.all()
+    lines = with_running_balance(movements, opening_balance).select_related(
+        'ledger', 'ledger__entity', 'financial_account'
+    )
+    page = paginate_keyset(request, lines, ordering=['line'])
 
-    return render(request, 'financial/financial_statement.html', {
-        'movements': movements,
-        'accounts': accounts,
+    context = {
+        'movements': page,
+        'page': page,
+        'opening_balance': opening_balance,
+        'closing_balance': opening_balance + balance_period,
         'total_in': total_in,
         'total_out': total_out,
         'balance_period': balance_period,
+        'accounts': FinancialAccount.objects.all(),
         # Devolvemos os filtros para o template manter preenchido
-        'filter_start': start_date,
-        'filter_end': end_date,
-        'filter_account': int(account_id) if account_id else '',
+        'filter_start': start_date.isoformat(),
+        'filter_end': end_date.isoformat(),
+        'filter_account': account.id if account else '',
+    }
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'financial/partials/statement_rows.html', context)
+
+    return render(request, 'financial/financial_statement.html', context)
+
+
+@login_required
+def financial_statement_export(request):
+    """ Exporta as movimentações do extrato (mesmos filtros da tela) em CSV, via streaming. """
+    movements, opening_balance = _statement_filters(request)[:2]
+    lines = with_running_balance(movements, opening_balance).order_by('line')
+    method_labels = dict(Installment.PAYMENT_METHODS)
+
+    def rows():
+        for m in lines.values(
+            'pay_date', 'ledger__description', 'financial_account__name',
+            'ledger__entity__nome_razao_social', 'payment_method', 'signed_value', 'running_balance',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            # Entradas positivas, saídas negativas (facilita somar na planilha)
+            yield [
+                m['pay_date'].strftime('%d/%m/%Y'), m['ledger__description'], m['financial_account__name'] or '',
+                m['ledger__entity__nome_razao_social'], method_labels.get(m['payment_method'], ''),
+                money(m['signed_value']), money(m['running_balance']),
+            ]
+
+    header = ['Data Pagto', 'Descrição', 'Conta', 'Entidade', 'Forma Pagto', 'Valor', 'Saldo']
+    return stream_csv('extrato.csv', header, rows())
+
+
+CASH_FLOW_HORIZONS = [30, 60, 90, 180, 365]
+
+
+@login_required
+def cash_flow_report(request):
+    """ Projeção de caixa: saldo atual + contas em aberto nos próximos N dias. """
+    try:
+        days = int(request.GET.get('days', 90))
+    except ValueError:
+        days = 90
+    days = min(max(days, 1), max(CASH_FLOW_HORIZONS))
+    granularity = request.GET.get('granularity', 'week')
+
+    projection = cash_flow_projection(days, granularity)
+    return render(request, 'financial/cash_flow.html', {
+        **projection,
+        'days': days,
+        'horizons': CASH_FLOW_HORIZONS,
+        'granularities': GRANULARITIES,
+        'granularity_label': GRANULARITIES[projection['granularity']],
     })
 
 
+def _month_param(request, name, default):
+    """ Lê 'AAAA-MM' (input type=month); valor inválido cai no padrão. """
+    try:
+        return parse_date(f"{request.GET[name]}-01") or default
+    except (KeyError, ValueError):
+        return default
+
+
+@login_required
+def dre_report(request):
+    """ DRE (regime de caixa) por mês ou por ano, lida do agregado mensal por categoria. """
+    current = month_start(date.today())
+    start = _month_param(request, 'start', add_months(current, -11))
+    end = _month_param(request, 'end', current)
+    if start > end:
+        start, end = end, start
+    granularity = 'year' if request.GET.get('granularity') == 'year' else 'month'
+
+    dre = build_dre(start, end, granularity)
+    return render(request, 'financial/dre_report.html', {
+        **dre,
+        'start': start,
+        'end': end,
+        'granularity': granularity,
+    })
+
+
+def _aging_type(request):
+    transaction_type = request.GET.get('type')
+    return transaction_type if transaction_type in dict(Ledger.TRANS_TYPE_CHOICES) else 'RECEIVABLE'
+
+
+def _aging_entity(request):
+    """ ?entity=ID do drill-down: None se ausente, 404 se não for um id. """
+    entity_id = request.GET.get('entity', '')
+    if not entity_id:
+        return None
+    if not entity_id.isdigit():
+        raise Http404("Entidade inválida.")
+    return int(entity_id)
+
+
+@login_required
+def aging_report(request):
+    """
+    Aging (inadimplência) por cliente/fornecedor, nas faixas de 1–30, 31–60, 61–90 e +90 dias.
+    Com HTMX + ?entity=ID devolve só os títulos vencidos daquela entidade (drill-down).
+    """
+    transaction_type = _aging_type(request)
+    today = date.today()
+
+    entity_id = _aging_entity(request)
+
+    if request.headers.get('HX-Request') and entity_id:
+        return render(request, 'financial/partials/aging_titles.html', {
+            'titles': aging_titles(transaction_type, today, entity_id=entity_id),
+        })
+
+    aging = aging_by_entity(transaction_type, today)
+    return render(request, 'financial/aging_report.html', {
+        **aging,
+        'bucket_totals': [(label, aging['totals'][key]) for key, label, *_ in AGING_BUCKETS],
+        'transaction_type': transaction_type,
+        'type_choices': Ledger.TRANS_TYPE_CHOICES,
+        'today': today,
+    })
+
+
+@login_required
+def aging_report_export(request):
+    """ Todos os títulos vencidos (com faixa e dias de atraso), em streaming. """
+    transaction_type = _aging_type(request)
+    entity_id = _aging_entity(request)
+
+    def rows():
+        for t in aging_titles(transaction_type, date.today(), entity_id=entity_id):
+            yield [
+                t['entity__nome_razao_social'], t['description'], t['open_installment__installment_number'] or '',
+                t['chart_of_accounts__name'], t['vehicle__plate'] or '', t['aging_due'].strftime('%d/%m/%Y'),
+                t['days_overdue'], t['bucket'], money(t['aging_value']),
+            ]
+
+    header = ['Entidade', 'Descrição', 'Parcela', 'Categoria', 'Placa', 'Vencimento', 'Dias em Atraso', 'Faixa', 'Valor']
+    return stream_csv(f"aging_{transaction_type.lower()}.csv", header, rows())
+
+
+@login_required
+def trial_balance_report(request):
+    """
+    Balancete do diário contábil numa data (saldos do último fechamento + período aberto)
+    e fechamento de mês (POST).
+    """
+    if request.method == 'POST':
+        try:
+            month = parse_date(f"{request.POST.get('month', '')}-01")
+            if not month:
+                raise ValidationError("Informe o mês a fechar.")
+            period = close_period(month, request.user)
+        except (ValidationError, ValueError) as e:
+            messages.error(request, e.messages[0] if hasattr(e, 'messages') else "Mês inválido.")
+        else:
+            messages.success(request, f"Período {period} fechado.")
+        return redirect('trial_balance_report')
+
+    on_date = _date_param(request, 'date', date.today())
+    return render(request, 'financial/trial_balance.html', {
+        **trial_balance(on_date),
+        'on_date': on_date,
+        'periods': JournalPeriod.objects.select_related('created_by')[:12],
+        'suggested_month': add_months(month_start(date.today()), -1),
+    })
+
+
+# --- CONCILIAÇÃO BANCÁRIA (OFX/CSV) ---
+
+@login_required
+def bank_statement_import(request):
+    """ Importa o extrato do banco e já sugere as correspondências com as contas em aberto. """
+    if request.method == 'POST':
+        form = BankStatementImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            account = form.cleaned_data['account']
+            upload = form.cleaned_data['file']
+            try:
+                stream, fmt = open_statement(upload.file, upload.name)
+                result = import_bank_statement(iter_statement_rows(stream, fmt), account, request.user)
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
+            else:
+                for line_no, message in result.errors[:10]:
+                    messages.warning(request, f"Linha {line_no}: {message}")
+                messages.success(
+                    request,
+                    f"{result.created} transações importadas ({result.duplicates} já existiam), "
+                    f"{result.matched} com correspondência sugerida."
+                )
+                return redirect(f"{reverse('bank_reconciliation')}?account_id={account.id}")
+    else:
+        form = BankStatementImportForm()
+
+    return render(request, 'financial/bank_import.html', {'form': form})
+
+
+@login_required
+def bank_reconciliation(request):
+    """
+    Linhas do extrato aguardando conciliação.
+    POST: 'settle' baixa as sugestões marcadas; 'unmatch'/'ignore' descartam;
+    'rematch' roda de novo a busca (Ex: depois de lançar contas que faltavam).
+    """
+    accounts = FinancialAccount.objects.filter(account_type='BANK').order_by('name')
+    account_id = request.GET.get('account_id') or request.POST.get('account_id') or ''
+    account = accounts.filter(id=account_id).first() if str(account_id).isdigit() else None
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        line_ids = [i for i in request.POST.getlist('line_ids') if i.isdigit()]
+        if action == 'settle':
+            settled, failed = settle_bank_lines(line_ids, request.user)
+            messages.success(request, f"{settled} lançamento(s) baixado(s) pelo extrato.")
+            if failed:
+                messages.warning(request, f"{failed} linha(s) não puderam ser baixadas (veja o motivo na lista).")
+        elif action == 'unmatch':
+            messages.info(request, f"{unmatch_bank_lines(line_ids)} sugestão(ões) descartada(s).")
+        elif action == 'ignore':
+            messages.info(request, f"{ignore_bank_lines(line_ids)} linha(s) ignorada(s).")
+        elif action == 'rematch' and account:
+            messages.info(request, f"{match_bank_lines(account)} nova(s) correspondência(s) encontrada(s).")
+        url = reverse('bank_reconciliation')
+        return redirect(f"{url}?account_id={account.id}" if account else url)
+
+    lines = BankStatementLine.objects.filter(status__in=['MATCHED', 'PENDING']).select_related(
+        'account', 'ledger', 'ledger__entity'
+    )
+    if account:
+        lines = lines.filter(account=account)
+
+    page = paginate_keyset(request, lines, ordering=['date', 'id'], page_size=100)
+    context = {
+        'lines': page,
+        'page': page,
+        'accounts': accounts,
+        'account': account,
+    }
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'financial/partials/bank_line_rows.html', context)
+
+    return render(request, 'financial/bank_reconciliation.html', context)
+
+
 # ... (Mantenha 'financial_list' e 'financial_statement') ...
 
 @login_required
@@ -113,7 +477,11 @@ def ledger_manual_create(request):
             ledger = form.save(commit=False)
             ledger.created_by = request.user
             ledger.status = 'OPEN' # Nasce em aberto
-            ledger.save()
+            with transaction.atomic():
+                ledger.save()
+                post_ledger_accrual(ledger, request.user)
+            # Lançamento com centro de custo altera o ROI do carro
+            refresh_vehicle_profitability([ledger.vehicle_id])
             messages.success(request, "Lançamento manual criado com sucesso.")
             return redirect('financial_list')
     else:
@@ -121,15 +489,85 @@ def ledger_manual_create(request):
 
     return render(request, 'financial/ledger_manual_form.html', {'form': form})
 
+@login_required
+def ledger_schedule(request, pk):
+    """
+    Parcelamento de um lançamento (financiamento do cliente, fornecedor em N vezes).
+    A pré-visualização (HTMX, a cada alteração do formulário) só calcula, sem gravar;
+    o POST grava o cronograma inteiro de uma vez.
+    """
+    ledger = get_object_or_404(Ledger.objects.select_related('entity', 'chart_of_accounts'), pk=pk)
+
+    if request.method == 'POST':
+        form = InstallmentScheduleForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            try:
+                installments = generate_installments(
+                    ledger.id, data['count'], data['first_due_date'], data['method'],
+                    data['monthly_rate'], request.user, replace=data['replace'],
+                )
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
+            else:
+                # Juros mudam o total do lançamento (e o ROI do veículo, se houver centro de custo)
+                refresh_vehicle_profitability([ledger.vehicle_id])
+                messages.success(request, f"{len(installments)} parcelas geradas para '{ledger.description}'.")
+                return redirect('financial_list')
+    elif request.headers.get('HX-Request'):
+        form = InstallmentScheduleForm(request.GET)
+        context = {'ledger': ledger}
+        if form.is_valid():
+            data = form.cleaned_data
+            try:
+                context['schedule'] = build_schedule(
+                    outstanding_principal(ledger), data['count'], data['first_due_date'], data['method'], data['monthly_rate']
+                )
+                context['totals'] = schedule_totals(context['schedule'])
+            except ValidationError as e:
+                context['error'] = e.messages[0]
+        else:
+            context['error'] = next(iter(form.errors.values()))[0]
+        return render(request, 'financial/partials/schedule_preview.html', context)
+    else:
+        form = InstallmentScheduleForm(initial={
+            'method': 'FIXED',
+            'first_due_date': max(ledger.due_date, date.today()),
+        })
+
+    return render(request, 'financial/ledger_schedule.html', {
+        'form': form,
+        'ledger': ledger,
+        'principal': outstanding_principal(ledger),
+        'open_installments': ledger.parcelas.filter(pay_date__isnull=True).count(),
+    })
+
+
 # ... (Mantenha todas as views anteriores: financial_list, ledger_manual_create, etc.) ...
 
 # --- CRUD DE PLANO DE CONTAS ---
 
 @login_required
 def chart_of_accounts_list(request):
-    # Usa select_related para otimizar o carregamento da Conta Pai
-    accounts = ChartOfAccounts.objects.select_related('parent').all().order_by('code')
-    return render(request, 'financial/chart_of_accounts_list.html', {'accounts': accounts})
+    """
+    Plano de Contas em árvore, com os totais de cada grupo somando as subcategorias
+    (Lançado por vencimento e Realizado por data de pagamento). Padrão: ano atual.
+    """
+    today = date.today()
+    start_date = _date_param(request, 'start_date', today.replace(month=1, day=1))
+    end_date = _date_param(request, 'end_date', today.replace(month=12, day=31))
+
+    accounts = chart_tree()
+    totals = chart_rollup(start_date, end_date)
+    for account in accounts:
+        account.booked = totals[account.id]['booked']
+        account.realized = totals[account.id]['realized']
+
+    return render(request, 'financial/chart_of_accounts_list.html', {
+        'accounts': accounts,
+        'filter_start': start_date.isoformat(),
+        'filter_end': end_date.isoformat(),
+    })
 
 @login_required
 def chart_of_accounts_create(request):
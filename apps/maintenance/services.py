@@ -5,6 +5,8 @@ from decimal import Decimal
 
 from .models import ServiceOrder
 from financial.models import Ledger, ChartOfAccounts
+from financial.journal import post_ledger_accrual
+from vehicles.services import refresh_vehicle_profitability
 
 def complete_service_order(service_order_id, user):
     """
@@ -39,7 +41,7 @@ def complete_service_order(service_order_id, user):
             raise ValidationError("Plano de contas '3.01 - Manutenção' não encontrado.")
 
         # Cria o Passivo (Dívida com o Mecânico)
-        Ledger.objects.create(
+        ledger = Ledger.objects.create(
             entity=os.supplier, # Devemos para o Mecânico Zé
             chart_of_accounts=categoria,
             total_value=total_val,
@@ -51,5 +53,9 @@ def complete_service_order(service_order_id, user):
             loja_id=os.loja_id,
             created_by=user
         )
+        post_ledger_accrual(ledger, user)
+
+        # Custo da OS entra no ROI do carro
+        refresh_vehicle_profitability([os.vehicle_id])
 
     return os
\ No newline at end of file
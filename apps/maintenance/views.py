@@ -2,6 +2,9 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum
+from django.db import transaction
+from core.pagination import paginate_keyset
+from vehicles.services import change_vehicle_status
 
 from .models import ServiceOrder, ServiceOrderItem
 from .forms import ServiceOrderCreateForm, ServiceOrderItemForm
@@ -10,8 +13,16 @@ from .services import complete_service_order
 @login_required
 def maintenance_list(request):
     # Lista OS ordenadas pela mais recente
-    orders = ServiceOrder.objects.select_related('vehicle', 'supplier').order_by('-issue_date')
-    return render(request, 'maintenance/maintenance_list.html', {'orders': orders})
+    orders = ServiceOrder.objects.select_related('vehicle', 'vehicle__model__brand', 'supplier')
+
+    page = paginate_keyset(request, orders, ordering=['-issue_date', '-id'])
+    context = {'orders': page, 'page': page}
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'maintenance/partials/maintenance_table_rows.html', context)
+
+    return render(request, 'maintenance/maintenance_list.html', context)
 
 @login_required
 def maintenance_create(request):
@@ -21,11 +32,11 @@ def maintenance_create(request):
             os = form.save(commit=False)
             os.created_by = request.user
             os.status = 'APPROVED' # Já nasce aprovada/em execução
-            os.save()
-            
-            # Atualiza status do carro para OFICINA
-            os.vehicle.status = 'MAINTENANCE'
-            os.vehicle.save()
+            with transaction.atomic():
+                os.save()
+
+                # Atualiza status do carro para OFICINA
+                change_vehicle_status(os.vehicle, 'MAINTENANCE', request.user, source='MAINTENANCE')
             
             messages.success(request, f"OS #{os.id} aberta com sucesso! Agora adicione os itens.")
             return redirect('maintenance_detail', pk=os.id)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Negotiation, NegotiationItem
+from .models import Negotiation, NegotiationItem, Commission, SalesFact
 
 from django.contrib import messages
 from django.core.exceptions import ValidationError
@@ -36,4 +36,32 @@ class NegotiationAdmin(admin.ModelAdmin):
             except ValidationError as e:
                 self.message_user(request, f"Erro na #{negotiation.id}: {e.message}", messages.ERROR)
             except Exception as e:
-                self.message_user(request, f"Erro sistêmico na #{negotiation.id}: {str(e)}", messages.ERROR)
\ No newline at end of file
+                self.message_user(request, f"Erro sistêmico na #{negotiation.id}: {str(e)}", messages.ERROR)
+
+
+@admin.register(Commission)
+class CommissionAdmin(admin.ModelAdmin):
+    """ Somente leitura: gerada pela rodada de comissões (Vendas > Comissões). """
+    list_display = ('month', 'seller', 'sales_count', 'sales_total', 'percentage', 'value', 'ledger')
+    list_filter = ('month',)
+    search_fields = ('seller__entidade__nome_razao_social',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(SalesFact)
+class SalesFactAdmin(admin.ModelAdmin):
+    """ Somente leitura: mantida pela aprovação/cancelamento (rebuild_sales_facts refaz). """
+    list_display = ('month', 'seller', 'brand', 'model', 'vehicles', 'revenue', 'cost')
+    list_filter = ('month', 'brand')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,196 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F, DateField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import NegotiationItem, SalesFact
+from financial.dre import month_start
+
+# Recortes do relatório: colunas agrupadas e rótulo de cada linha.
+# 'drill' é o próximo nível ao clicar numa linha (o valor clicado vira filtro).
+DIMENSIONS = {
+    'seller': {
+        'label': 'Vendedor',
+        'fields': ['seller_id', 'seller__entidade__nome_razao_social'],
+        'key': 'seller_id',
+        'name': lambda row: row['seller__entidade__nome_razao_social'],
+        'drill': 'brand',
+    },
+    'brand': {
+        'label': 'Marca',
+        'fields': ['brand_id', 'brand__name'],
+        'key': 'brand_id',
+        'name': lambda row: row['brand__name'],
+        'drill': 'model',
+    },
+    'model': {
+        'label': 'Modelo',
+        'fields': ['model_id', 'brand__name', 'model__name'],
+        'key': 'model_id',
+        'name': lambda row: f"{row['brand__name']} {row['model__name']}",
+        'drill': None,
+    },
+    'month': {
+        'label': 'Mês',
+        'fields': ['month'],
+        'key': 'month',
+        'name': lambda row: row['month'].strftime('%m/%Y'),
+        'drill': None,
+    },
+}
+
+
+# --- MANUTENÇÃO INCREMENTAL ---
+
+def add_sales_facts(deltas):
+    """
+    Soma (ou subtrai) vendas no cubo.
+    'deltas': {(vendedor_id, modelo_id, mês): (marca_id, veículos, receita, custo)}.
+    Mesmo esquema do agregado da DRE: UPDATE com F() na linha existente; se ainda não
+    existe, cria (com savepoint: se outro processo criou junto, soma na linha dele).
+    """
+    for (seller_id, model_id, month), (brand_id, vehicles, revenue, cost) in deltas.items():
+        increment = {
+            'vehicles': F('vehicles') + vehicles,
+            'revenue': F('revenue') + revenue,
+            'cost': F('cost') + cost,
+        }
+        rows = SalesFact.objects.filter(seller_id=seller_id, model_id=model_id, month=month)
+        if rows.update(**increment):
+            continue
+        try:
+            with transaction.atomic():
+                SalesFact.objects.create(
+                    seller_id=seller_id, model_id=model_id, brand_id=brand_id, month=month,
+                    vehicles=vehicles, revenue=revenue, cost=cost,
+                )
+        except IntegrityError:
+            rows.update(**increment)
+
+
+def _sale_month(negotiation):
+    return month_start(timezone.localtime(negotiation.negotiation_date).date())
+
+
+def record_sale(negotiation):
+    """
+    Venda aprovada entra no cubo (mês do fechamento).
+    Uma query agrupada pelos carros vendidos (saídas), por modelo.
+    """
+    if negotiation.negotiation_type != 'SALE' or not negotiation.negotiation_date:
+        return
+    month = _sale_month(negotiation)
+    rows = (
+        NegotiationItem.objects.filter(negotiation=negotiation, flow='OUT')
+        .values('vehicle__model_id', 'vehicle__model__brand_id')
+        .annotate(vehicles=Count('id'), revenue=Sum('agreed_value'), cost=Sum('vehicle__acquisition_cost'))
+        .order_by()
+    )
+    add_sales_facts({
+        (negotiation.seller_id, row['vehicle__model_id'], month): (
+            row['vehicle__model__brand_id'], row['vehicles'], row['revenue'], row['cost'],
+        )
+        for row in rows
+    })
+
+
+def unrecord_sale(negotiation):
+    """
+    Venda cancelada sai do cubo. Chamar depois de a negociação ficar CANCELED.
+    Em vez de subtrair o modelo/custo ATUAIS dos carros (que podem ter mudado depois
+    da venda e cair noutra célula), refaz as células do vendedor naquele mês a partir
+    das vendas aprovadas que restaram: um delete e uma query agrupada.
+    """
+    if negotiation.negotiation_type != 'SALE' or not negotiation.negotiation_date:
+        return
+    month = _sale_month(negotiation)
+    with transaction.atomic():
+        SalesFact.objects.filter(seller_id=negotiation.seller_id, month=month).delete()
+        SalesFact.objects.bulk_create(_fact_rows(seller_id=negotiation.seller_id, month=month))
+
+
+def _fact_rows(seller_id=None, month=None):
+    """ Recalcula o cubo (ou só as células de um vendedor num mês) a partir das vendas aprovadas: uma query agrupada. """
+    rows = (
+        NegotiationItem.objects.filter(
+            flow='OUT', negotiation__negotiation_type='SALE', negotiation__status='APPROVED',
+            negotiation__negotiation_date__isnull=False,
+        )
+        .annotate(month=TruncMonth('negotiation__negotiation_date', output_field=DateField()))
+    )
+    if seller_id is not None:
+        rows = rows.filter(negotiation__seller_id=seller_id, month=month)
+    rows = (
+        rows.values('negotiation__seller_id', 'vehicle__model_id', 'vehicle__model__brand_id', 'month')
+        .annotate(vehicles=Count('id'), revenue=Sum('agreed_value'), cost=Sum('vehicle__acquisition_cost'))
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=2000):
+        yield SalesFact(
+            seller_id=row['negotiation__seller_id'],
+            model_id=row['vehicle__model_id'],
+            brand_id=row['vehicle__model__brand_id'],
+            month=row['month'],
+            vehicles=row['vehicles'],
+            revenue=row['revenue'],
+            cost=row['cost'],
+        )
+
+
+def rebuild_sales_facts(batch_size=1000):
+    """ Reconstrói o cubo inteiro (correção de divergências). Retorna o nº de linhas. """
+    total = 0
+    with transaction.atomic():
+        SalesFact.objects.all().delete()
+        batch = []
+        for row in _fact_rows():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                SalesFact.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SalesFact.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+# --- RELATÓRIO ---
+
+def _with_margin(row):
+    row['margin'] = row['revenue'] - row['cost']
+    row['margin_pct'] = row['margin'] / row['revenue'] * 100 if row['revenue'] else None
+    return row
+
+
+def sales_cube(start_month, end_month, dimension='seller', seller_id=None, brand_id=None):
+    """
+    Vendas do intervalo agrupadas por um recorte (vendedor, marca, modelo ou mês),
+    lidas só do cubo: UMA query agrupada (índices por mês + marca/vendedor).
+    Margem = receita - custo de aquisição dos carros vendidos.
+    Retorna {'rows': [...], 'totals': {...}}; cada linha tem 'key' e 'name' do recorte.
+    """
+    spec = DIMENSIONS[dimension]
+    facts = SalesFact.objects.filter(month__range=[start_month, end_month])
+    if seller_id:
+        facts = facts.filter(seller_id=seller_id)
+    if brand_id:
+        facts = facts.filter(brand_id=brand_id)
+
+    rows = (
+        facts.values(*spec['fields'])
+        .annotate(vehicles=Sum('vehicles'), revenue=Sum('revenue'), cost=Sum('cost'))
+        .filter(vehicles__gt=0) # Linhas zeradas por cancelamentos
+        .order_by('month' if dimension == 'month' else '-revenue')
+    )
+
+    totals = {'vehicles': 0, 'revenue': Decimal('0.00'), 'cost': Decimal('0.00')}
+    result = []
+    for row in rows:
+        row['key'] = row[spec['key']]
+        row['name'] = spec['name'](row)
+        result.append(_with_margin(row))
+        for field in totals:
+            totals[field] += row[field]
+    return {'rows': result, 'totals': _with_margin(totals)}
@@ -0,0 +1,146 @@
+from datetime import datetime, time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F
+from django.utils import timezone
+
+from .models import Negotiation, NegotiationItem, Commission
+from financial.models import Ledger, ChartOfAccounts
+from financial.cashflow import invalidate_cash_flow
+from financial.dre import add_months
+from financial.journal import post_accruals
+
+CENT = Decimal('0.01')
+COMMISSION_ACCOUNT = '4.02' # Despesas com Bônus/Comissões
+
+# Base de cálculo da comissão
+BASIS = {
+    'items': 'Valor dos carros vendidos (saídas)',
+    'balance': 'Saldo da negociação (descontada a troca)',
+}
+
+
+def _period(month):
+    """ [1º dia do mês, 1º dia do mês seguinte) em datetimes da timezone do projeto (negotiation_date é DateTime). """
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.combine(month, time.min, tzinfo=tz),
+        datetime.combine(add_months(month, 1), time.min, tzinfo=tz),
+    )
+
+
+def sales_by_seller(month, basis='items'):
+    """
+    Vendas aprovadas no mês por vendedor: UMA query agrupada, já com o % de comissão
+    e a entidade do vendedor (sem buscar colaborador por colaborador).
+    """
+    if basis not in BASIS:
+        raise ValidationError("Base de cálculo da comissão inválida.")
+    start, end = _period(month)
+
+    if basis == 'items':
+        rows = NegotiationItem.objects.filter(
+            flow='OUT',
+            negotiation__negotiation_type='SALE',
+            negotiation__status='APPROVED',
+            negotiation__negotiation_date__gte=start,
+            negotiation__negotiation_date__lt=end,
+        ).values(
+            seller_id=F('negotiation__seller_id'),
+            percentage=F('negotiation__seller__comissao_base_percentual'),
+            entity_id=F('negotiation__seller__entidade_id'),
+            name=F('negotiation__seller__entidade__nome_razao_social'),
+        ).annotate(sales_total=Sum('agreed_value'), sales_count=Count('negotiation_id', distinct=True))
+    else:
+        rows = Negotiation.objects.filter(
+            negotiation_type='SALE',
+            status='APPROVED',
+            negotiation_date__gte=start,
+            negotiation_date__lt=end,
+        ).values(
+            'seller_id',
+            percentage=F('seller__comissao_base_percentual'),
+            entity_id=F('seller__entidade_id'),
+            name=F('seller__entidade__nome_razao_social'),
+        ).annotate(sales_total=Sum('total_value'), sales_count=Count('id'))
+
+    result = []
+    for row in rows.order_by('name'):
+        # Percentual aplicado em Decimal, arredondado no centavo
+        row['value'] = (row['sales_total'] * row['percentage'] / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+        result.append(row)
+    return result
+
+
+def commission_preview(month, basis='items'):
+    """ Vendas do mês por vendedor, marcando quem já teve a comissão gerada (e por quanto). """
+    generated = {c.seller_id: c for c in Commission.objects.filter(month=month).select_related('ledger')}
+    rows = sales_by_seller(month, basis)
+    for row in rows:
+        row['commission'] = generated.get(row['seller_id'])
+    return rows
+
+
+def run_commissions(month, user, basis='items', due_date=None, loja_id=1):
+    """
+    Rodada de comissões do mês, idempotente:
+    1. Vendas agrupadas por vendedor (uma query) e o % de cada um;
+    2. Pula quem já tem comissão no mês (ou valor zerado);
+    3. Um bulk_create dos Contas a Pagar (conta 4.02) e um dos registros de Comissão;
+    4. Reconhece as despesas no diário numa partida só.
+    Duas rodadas simultâneas do mesmo mês esbarram na restrição (vendedor, mês):
+    a segunda é desfeita inteira, sem duplicar lançamentos.
+    """
+    if month >= timezone.localdate().replace(day=1):
+        raise ValidationError("Só é possível gerar comissões de meses já encerrados.")
+    due_date = due_date or add_months(month, 1)
+
+    try:
+        categoria_id = ChartOfAccounts.objects.values_list('id', flat=True).get(code=COMMISSION_ACCOUNT)
+    except ChartOfAccounts.DoesNotExist:
+        raise ValidationError(f"Plano de contas '{COMMISSION_ACCOUNT}' (Comissões) não configurado.")
+
+    try:
+        with transaction.atomic():
+            done = set(Commission.objects.filter(month=month).values_list('seller_id', flat=True))
+            rows = [row for row in sales_by_seller(month, basis) if row['seller_id'] not in done and row['value'] > 0]
+            if not rows:
+                return []
+
+            ledgers = Ledger.objects.bulk_create([
+                Ledger(
+                    entity_id=row['entity_id'],
+                    chart_of_accounts_id=categoria_id,
+                    total_value=row['value'],
+                    transaction_type='PAYABLE',
+                    status='OPEN',
+                    due_date=due_date,
+                    description=f"Comissão {month:%m/%Y} - {row['name']}",
+                    loja_id=loja_id,
+                    created_by=user,
+                )
+                for row in rows
+            ])
+            commissions = Commission.objects.bulk_create([
+                Commission(
+                    seller_id=row['seller_id'],
+                    month=month,
+                    sales_count=row['sales_count'],
+                    sales_total=row['sales_total'],
+                    percentage=row['percentage'],
+                    value=row['value'],
+                    ledger=ledger,
+                    loja_id=loja_id,
+                    created_by=user,
+                )
+                for row, ledger in zip(rows, ledgers)
+            ])
+            # bulk_create não passa pelos signals de Ledger
+            invalidate_cash_flow()
+            post_accruals(ledgers, user, description=f"Comissões {month:%m/%Y} ({len(ledgers)} vendedores)")
+    except IntegrityError:
+        raise ValidationError("As comissões deste mês estão sendo geradas por outro usuário. Tente novamente.")
+
+    return commissions
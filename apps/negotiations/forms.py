@@ -1,117 +1,180 @@
 from django import forms
+from django.db.models import Q
 from .models import Negotiation
 from vehicles.models import Vehicle
 from employees.models import Employee
 
+# Limite de carros de cada lado de uma negociação (venda de frota)
+MAX_VEHICLES = 50
+
 class SaleForm(forms.ModelForm):
-    # --- LADO A: SAÍDA (O que a loja vende) ---
-    vehicle = forms.ModelChoiceField(
-        queryset=Vehicle.objects.filter(status='AVAILABLE'),
+    """ Cabeçalho da negociação; os carros vêm nos formsets (SaleItemFormSet / TradeInFormSet). """
+
+    class Meta:
+        model = Negotiation
+        fields = ['customer', 'seller']
+        widgets = {
+            'customer': forms.Select(attrs={'class': 'form-select'}),
+            'seller': forms.Select(attrs={'class': 'form-select'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['seller'].queryset = Employee.objects.filter(ativo=True)
+
+
+# --- LADO A: SAÍDA (O que a loja vende) ---
+
+class SaleItemForm(forms.Form):
+    vehicle = forms.TypedChoiceField(
+        coerce=int,
         label="Veículo Vendido (Saída)",
         widget=forms.Select(attrs={'class': 'form-select'})
     )
     sale_value = forms.DecimalField(
         label="Valor de Venda (R$)",
         decimal_places=2,
+        min_value=0,
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
 
-    # --- LADO B: ENTRADA (O que o cliente dá na troca) ---
-    has_trade_in = forms.BooleanField(
-        required=False, 
-        label="Aceitar veículo na troca?",
-        widget=forms.CheckboxInput(attrs={'class': 'form-check-input', 'onchange': 'toggleTradeIn(this)'})
-    )
-    
+    def __init__(self, *args, vehicle_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['vehicle'].choices = vehicle_choices
+
+
+class LineFormSetMixin:
+    def line_form(self, index):
+        """ Linha nova do editor (pedida pelo HTMX), já com o prefixo da posição 'index'. """
+        return self.form(
+            auto_id=self.auto_id,
+            prefix=self.add_prefix(index),
+            empty_permitted=True,
+            use_required_attribute=False,
+            **self.get_form_kwargs(index),
+        )
+
+
+class BaseSaleItemFormSet(LineFormSetMixin, forms.BaseFormSet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Apenas carros disponíveis: UMA query, compartilhada por todas as linhas
+        self.vehicle_choices = [('', '---------')] + [
+            (vehicle.id, str(vehicle))
+            for vehicle in Vehicle.objects.filter(status='AVAILABLE').select_related('model__brand').order_by(
+                'model__brand__name', 'model__name', 'plate'
+            )
+        ]
+
+    def get_form_kwargs(self, index):
+        return {'vehicle_choices': self.vehicle_choices}
+
+    def clean(self):
+        """ Ao menos um carro, sem repetir; os objetos ficam em self.items como (veículo, valor). """
+        if any(self.errors):
+            return
+        rows = [(form.cleaned_data['vehicle'], form.cleaned_data['sale_value']) for form in self.forms if form.cleaned_data]
+        if not rows:
+            raise forms.ValidationError("Informe ao menos um veículo vendido.")
+
+        vehicle_ids = [vehicle_id for vehicle_id, _ in rows]
+        if len(set(vehicle_ids)) != len(vehicle_ids):
+            raise forms.ValidationError("O mesmo veículo foi informado mais de uma vez.")
+
+        vehicles = Vehicle.objects.in_bulk(vehicle_ids)
+        self.items = [(vehicles[vehicle_id], value) for vehicle_id, value in rows]
+
+
+SaleItemFormSet = forms.formset_factory(
+    SaleItemForm, formset=BaseSaleItemFormSet, extra=1, max_num=MAX_VEHICLES, validate_max=True
+)
+
+
+# --- LADO B: ENTRADA (O que o cliente dá na troca) ---
+
+class TradeInForm(forms.Form):
     # Modelo
-    trade_in_brand_name = forms.CharField(
-        required=False,
-        label="Marca (Troca)",
+    brand_name = forms.CharField(
+        label="Marca",
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: VW'})
     )
-    trade_in_model_name = forms.CharField(
-        required=False,
-        label="Modelo (Troca)",
+    model_name = forms.CharField(
+        label="Modelo",
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: Gol'})
     )
     # Documentos
-    trade_in_plate = forms.CharField(
-        required=False,
+    plate = forms.CharField(
+        max_length=10,
         label="Placa",
         widget=forms.TextInput(attrs={'class': 'form-control text-uppercase', 'placeholder': 'ABC-1234'})
     )
-    trade_in_chassi = forms.CharField(
-        required=False,
+    chassi = forms.CharField(
+        max_length=50,
         label="Chassi",
         widget=forms.TextInput(attrs={'class': 'form-control text-uppercase'})
     )
-    trade_in_renavam = forms.CharField(
+    renavam = forms.CharField(
         required=False,
+        max_length=20,
         label="Renavam",
         widget=forms.TextInput(attrs={'class': 'form-control'})
     )
     # Características
-    trade_in_year_fab = forms.IntegerField(
-        required=False,
+    year_fab = forms.IntegerField(
         label="Ano Fab.",
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
-    trade_in_year_model = forms.IntegerField(
-        required=False,
+    year_model = forms.IntegerField(
         label="Ano Mod.",
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
-    trade_in_color = forms.CharField(
-        required=False,
+    color = forms.CharField(
         label="Cor",
         widget=forms.TextInput(attrs={'class': 'form-control'})
     )
-    trade_in_fuel_type = forms.ChoiceField(
-        required=False,
+    fuel_type = forms.ChoiceField(
         label="Combustível",
         choices=Vehicle.FUEL_CHOICES, # Puxa as escolhas do modelo
         widget=forms.Select(attrs={'class': 'form-select'})
     )
-    trade_in_mileage = forms.IntegerField(
-        required=False,
+    mileage = forms.IntegerField(
+        min_value=0,
         label="KM Atual",
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
     # Valor
-    trade_in_value = forms.DecimalField(
-        required=False,
+    value = forms.DecimalField(
         label="Valor Acordado na Troca (R$)",
         decimal_places=2,
+        min_value=0,
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
 
-    class Meta:
-        model = Negotiation
-        fields = ['customer', 'seller']
-        widgets = {
-            'customer': forms.Select(attrs={'class': 'form-select'}),
-            'seller': forms.Select(attrs={'class': 'form-select'}),
-        }
+    def clean_plate(self):
+        return self.cleaned_data['plate'].strip().upper()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['seller'].queryset = Employee.objects.filter(ativo=True)
-        
+    def clean_chassi(self):
+        return self.cleaned_data['chassi'].strip().upper()
+
+
+class BaseTradeInFormSet(LineFormSetMixin, forms.BaseFormSet):
     def clean(self):
-        cleaned_data = super().clean()
-        has_trade_in = cleaned_data.get('has_trade_in')
-        
-        # Se marcou que tem troca, obriga a preencher os dados essenciais
-        if has_trade_in:
-            required_fields = [
-                'trade_in_brand_name', 'trade_in_model_name', 'trade_in_plate', 
-                'trade_in_chassi', 'trade_in_year_fab', 'trade_in_year_model', 
-                'trade_in_color', 'trade_in_fuel_type', 'trade_in_mileage', 'trade_in_value'
-            ]
-            for field in required_fields:
-                if not cleaned_data.get(field):
-                    # Pega o 'label' do campo para a mensagem de erro
-                    label = self.fields[field].label
-                    self.add_error(field, f"Campo '{label}' é obrigatório para a troca.")
-        
-        return cleaned_data
\ No newline at end of file
+        """ Placa/chassi únicos entre as linhas e no estoque (uma query para todas as linhas). """
+        if any(self.errors):
+            return
+        self.items = [form.cleaned_data for form in self.forms if form.cleaned_data]
+        plates = [item['plate'] for item in self.items]
+        chassis = [item['chassi'] for item in self.items]
+        if len(set(plates)) != len(plates) or len(set(chassis)) != len(chassis):
+            raise forms.ValidationError("Há placas ou chassis repetidos entre os veículos da troca.")
+
+        taken = Vehicle.objects.filter(Q(plate__in=plates) | Q(chassi__in=chassis)).values_list('plate', 'chassi')
+        if taken:
+            raise forms.ValidationError(
+                "Veículo(s) já cadastrado(s): " + ', '.join(plate or chassi for plate, chassi in taken) + "."
+            )
+
+
+TradeInFormSet = forms.formset_factory(
+    TradeInForm, formset=BaseTradeInFormSet, extra=0, max_num=MAX_VEHICLES, validate_max=True
+)
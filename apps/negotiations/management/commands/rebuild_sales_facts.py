@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from negotiations.analytics import rebuild_sales_facts
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o cubo de vendas (vendedor x modelo x mês) a partir das negociações aprovadas.'
+
+    def handle(self, *args, **options):
+        total = rebuild_sales_facts()
+        self.stdout.write(self.style.SUCCESS(f"Cubo de vendas recalculado: {total} linhas (vendedor x modelo x mês)."))
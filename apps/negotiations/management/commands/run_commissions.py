@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from financial.dre import add_months
+from negotiations.commissions import BASIS, run_commissions
+
+
+class Command(BaseCommand):
+    help = 'Gera as comissões do mês (um Contas a Pagar por vendedor). Rodar de novo não duplica.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='AAAA-MM (padrão: mês anterior)')
+        parser.add_argument('--basis', choices=list(BASIS), default='items', help='Base de cálculo (padrão: items)')
+        parser.add_argument('--user', help='Username registrado como "Criado por"')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = parse_date(f"{options['month']}-01")
+            except ValueError:
+                month = None
+            if not month:
+                raise CommandError("Mês inválido. Use AAAA-MM.")
+        else:
+            month = add_months(timezone.localdate().replace(day=1), -1)
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário '{options['user']}' não encontrado.")
+
+        try:
+            commissions = run_commissions(month, user, options['basis'])
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        for commission in commissions:
+            self.stdout.write(
+                f"{commission.seller_id}: {commission.sales_count} venda(s), base R$ {commission.sales_total} "
+                f"x {commission.percentage}% = R$ {commission.value}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(commissions)} comissão(ões) gerada(s) para {month:%m/%Y}."))
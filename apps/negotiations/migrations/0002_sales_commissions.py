@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+        ('financial', '0010_double_entry_journal'),
+        ('negotiations', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Commission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('month', models.DateField(verbose_name='Competência')),
+                ('sales_count', models.PositiveIntegerField(default=0, verbose_name='Vendas')),
+                ('sales_total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Base de Cálculo')),
+                ('percentage', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Comissão (%)')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Valor da Comissão')),
+            ],
+            options={
+                'verbose_name': 'Comissão',
+                'verbose_name_plural': 'Comissões',
+                'ordering': ['-month', 'seller'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='negotiation',
+            index=models.Index(fields=['status', 'negotiation_date'], name='negotiation_status_0186f5_idx'),
+        ),
+        migrations.AddField(
+            model_name='commission',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por'),
+        ),
+        migrations.AddField(
+            model_name='commission',
+            name='ledger',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='commission', to='financial.ledger', verbose_name='Lançamento'),
+        ),
+        migrations.AddField(
+            model_name='commission',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='commissions', to='employees.employee', verbose_name='Vendedor'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commission',
+            unique_together={('seller', 'month')},
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_sales_facts(apps, schema_editor):
+    NegotiationItem = apps.get_model('negotiations', 'NegotiationItem')
+    SalesFact = apps.get_model('negotiations', 'SalesFact')
+
+    # Uma query agrupada por (vendedor, modelo, mês do fechamento) sobre os carros vendidos
+    rows = (
+        NegotiationItem.objects.filter(
+            flow='OUT', negotiation__negotiation_type='SALE', negotiation__status='APPROVED',
+            negotiation__negotiation_date__isnull=False,
+        )
+        .annotate(month=TruncMonth('negotiation__negotiation_date', output_field=DateField()))
+        .values('negotiation__seller_id', 'vehicle__model_id', 'vehicle__model__brand_id', 'month')
+        .annotate(vehicles=Count('id'), revenue=Sum('agreed_value'), cost=Sum('vehicle__acquisition_cost'))
+        .order_by()
+    )
+    SalesFact.objects.bulk_create([
+        SalesFact(
+            seller_id=row['negotiation__seller_id'], model_id=row['vehicle__model_id'],
+            brand_id=row['vehicle__model__brand_id'], month=row['month'],
+            vehicles=row['vehicles'], revenue=row['revenue'], cost=row['cost'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+        ('negotiations', '0002_sales_commissions'),
+        ('vehicles', '0006_vehiclephoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mês')),
+                ('vehicles', models.IntegerField(default=0, verbose_name='Veículos Vendidos')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Receita')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Custo de Aquisição')),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_facts', to='vehicles.brand', verbose_name='Marca')),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_facts', to='vehicles.model', verbose_name='Modelo')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_facts', to='employees.employee', verbose_name='Vendedor')),
+            ],
+            options={
+                'verbose_name': 'Fato de Venda (Mensal)',
+                'verbose_name_plural': 'Fatos de Venda (Mensal)',
+                'indexes': [models.Index(fields=['month', 'brand', 'model'], name='negotiation_month_272684_idx'), models.Index(fields=['month', 'seller'], name='negotiation_month_578a9c_idx')],
+                'unique_together': {('seller', 'model', 'month')},
+            },
+        ),
+        migrations.RunPython(build_sales_facts, migrations.RunPython.noop),
+    ]
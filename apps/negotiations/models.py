@@ -2,7 +2,7 @@ from django.db import models
 from core.models import TenantAwareModel
 from parties.models import Entity
 from employees.models import Employee
-from vehicles.models import Vehicle
+from vehicles.models import Vehicle, Brand, Model
 
 class Negotiation(TenantAwareModel):
     TYPE_CHOICES = [
@@ -33,6 +33,10 @@ class Negotiation(TenantAwareModel):
         verbose_name = "Negociação"
         verbose_name_plural = "Negociações"
         ordering = ['-created_at']
+        indexes = [
+            # Vendas fechadas num período (rodada de comissões, negotiations.commissions)
+            models.Index(fields=['status', 'negotiation_date']),
+        ]
 
     def __str__(self):
         return f"Negociação #{self.id} - {self.customer} ({self.get_status_display()})"
@@ -57,4 +61,61 @@ class NegotiationItem(TenantAwareModel):
 
     def __str__(self):
         seta = "->" if self.flow == 'OUT' else "<-"
-        return f"{seta} {self.vehicle} (R$ {self.agreed_value})"
\ No newline at end of file
+        return f"{seta} {self.vehicle} (R$ {self.agreed_value})"
+
+class Commission(TenantAwareModel):
+    """
+    Comissão de um vendedor num mês, gerada pela rodada de comissões
+    (negotiations.commissions) junto com o Contas a Pagar (Ledger) do valor.
+    Uma por vendedor e mês: rodar de novo o mesmo mês não duplica.
+    """
+    seller = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='commissions', verbose_name="Vendedor")
+    month = models.DateField(verbose_name="Competência") # Sempre o dia 1º
+
+    sales_count = models.PositiveIntegerField(default=0, verbose_name="Vendas")
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Base de Cálculo")
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Comissão (%)")
+    value = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Valor da Comissão")
+
+    ledger = models.OneToOneField(
+        'financial.Ledger', on_delete=models.PROTECT, related_name='commission', verbose_name="Lançamento"
+    )
+
+    class Meta:
+        verbose_name = "Comissão"
+        verbose_name_plural = "Comissões"
+        ordering = ['-month', 'seller']
+        unique_together = ('seller', 'month')
+
+    def __str__(self):
+        return f"Comissão {self.month:%m/%Y} - {self.seller} (R$ {self.value})"
+
+
+class SalesFact(models.Model):
+    """
+    Tabela DERIVADA (cubo) das vendas por vendedor x modelo x mês, lida pelo relatório
+    de vendas. Não edite na mão: é somada na aprovação, refeita (vendedor x mês) no
+    cancelamento (negotiations.analytics) e pode ser reconstruída com 'manage.py rebuild_sales_facts'.
+    """
+    month = models.DateField(verbose_name="Mês")  # Sempre o dia 1 (mês do fechamento)
+    seller = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='sales_facts', verbose_name="Vendedor")
+    # Marca repetida do modelo: recorte por marca sem JOIN
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='sales_facts', verbose_name="Marca")
+    model = models.ForeignKey(Model, on_delete=models.CASCADE, related_name='sales_facts', verbose_name="Modelo")
+
+    vehicles = models.IntegerField(default=0, verbose_name="Veículos Vendidos")
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Receita")
+    cost = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Custo de Aquisição")
+
+    class Meta:
+        verbose_name = "Fato de Venda (Mensal)"
+        verbose_name_plural = "Fatos de Venda (Mensal)"
+        unique_together = ('seller', 'model', 'month')
+        indexes = [
+            # O relatório lê um intervalo de meses agrupando por marca/modelo ou por vendedor
+            models.Index(fields=['month', 'brand', 'model']),
+            models.Index(fields=['month', 'seller']),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%m/%Y} vendedor {self.seller_id} modelo {self.model_id}: {self.vehicles} x R$ {self.revenue}"
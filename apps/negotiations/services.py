@@ -1,20 +1,108 @@
 from django.db import transaction
+from django.db.models import Q, ProtectedError
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 
-from .models import Negotiation
+from .models import Negotiation, NegotiationItem
+from .analytics import record_sale, unrecord_sale
 from vehicles.models import Vehicle
+from parties.models import Entity
+from vehicles.catalog import get_or_create_model_by_name
+from vehicles.search import build_search_document, sync_fts, search_sync_paused
+from vehicles.services import (
+    refresh_vehicle_profitability, change_vehicles_status, record_vehicle_entry,
+)
 from financial.models import Ledger, ChartOfAccounts
+from financial.cashflow import invalidate_cash_flow
+from financial.journal import post_ledger_accrual, reverse_accruals
 
-from parties.models import Entity # Importar Entidade
+# Entidade da Loja Matriz (ID 1 do script de seed); dona dos carros em estoque
+STORE_ENTITY_ID = 1
+
+
+def check_store_entity():
+    """ Uma query: sem a entidade da loja, o FK dos carros só falharia no COMMIT (IntegrityError). """
+    if not Entity.objects.filter(id=STORE_ENTITY_ID).exists():
+        raise ValidationError(f"Entidade 'Loja Matriz' (ID {STORE_ENTITY_ID}) não encontrada. Execute o script de seed.")
+
+def create_sale(customer, seller, sales, trade_ins, user, loja_id=1):
+    """
+    Registra e aprova uma venda com N carros vendidos e N carros na troca, numa transação:
+    1. Cabeçalho da negociação (Rascunho)
+    2. Carros da troca: um bulk_create (já como da loja, direto para a oficina)
+    3. Itens: um bulk_create (saídas e entradas)
+    4. Aprova pelo approve_negotiation (saldo = saídas - entradas, gera o financeiro)
+
+    'sales': lista de (veículo, valor); 'trade_ins': dicts do TradeInForm.
+    """
+    with transaction.atomic():
+        negotiation = Negotiation.objects.create(
+            customer=customer,
+            seller=seller,
+            negotiation_type='SALE',
+            status='DRAFT',
+            loja_id=loja_id,
+            created_by=user,
+        )
+
+        # Marca/Modelo digitados: resolvidos uma vez por par (o catálogo fica em memória)
+        models = {}
+        vehicles_in = []
+        for data in trade_ins:
+            key = (data['brand_name'].strip().upper(), data['model_name'].strip().upper())
+            if key not in models:
+                models[key] = get_or_create_model_by_name(data['brand_name'], data['model_name'], user)
+            vehicle = Vehicle(
+                model=models[key],
+                chassi=data['chassi'],
+                plate=data['plate'],
+                renavam=data['renavam'] or None,
+                year_fab=data['year_fab'],
+                year_model=data['year_model'],
+                color=data['color'],
+                fuel_type=data['fuel_type'],
+                mileage=data['mileage'],
+                status='MAINTENANCE', # Entra direto pra revisão
+                acquisition_cost=data['value'], # O custo dele é quanto pagamos na troca!
+                sale_price=data['value'] * Decimal('1.3'), # Sugestão de preço (+30%)
+                current_owner_id=STORE_ENTITY_ID, # O dono agora é a Loja, pois é uma aquisição
+                loja_id=loja_id,
+                created_by=user,
+            )
+            # bulk_create não dispara signals: montamos o documento de busca aqui
+            vehicle.search_document = build_search_document(vehicle)
+            vehicles_in.append(vehicle)
+
+        if vehicles_in:
+            Vehicle.objects.bulk_create(vehicles_in)
+            record_vehicle_entry(vehicles_in, user, source='TRADE_IN')
+            sync_fts([vehicle.id for vehicle in vehicles_in])
+
+        NegotiationItem.objects.bulk_create(
+            [
+                NegotiationItem(negotiation=negotiation, vehicle=vehicle, flow='OUT', agreed_value=value,
+                                loja_id=loja_id, created_by=user)
+                for vehicle, value in sales
+            ] + [
+                NegotiationItem(negotiation=negotiation, vehicle=vehicle, flow='IN', agreed_value=data['value'],
+                                loja_id=loja_id, created_by=user)
+                for vehicle, data in zip(vehicles_in, trade_ins)
+            ]
+        )
+
+        approve_negotiation(negotiation.id, user)
+
+    return negotiation
 
 def approve_negotiation(negotiation_id, user):
     """
-    Realiza a aprovação atômica da negociação:
-    1. Trava registro
-    2. Calcula Saldo
-    3. Atualiza Veículos
+    Realiza a aprovação atômica da negociação, com nº de queries constante
+    (não cresce com a quantidade de carros):
+    1. Trava a negociação e TODOS os veículos dos itens (select_for_update em ordem de pk:
+       aprovações concorrentes com carros em comum esperam uma pela outra, sem deadlock)
+    2. Valida os carros numa passada e calcula o saldo
+    3. Atualiza Veículos (um bulk_update de status/dono + eventos num bulk_create)
     4. Gera Financeiro
     """
     with transaction.atomic():
@@ -24,151 +112,155 @@ def approve_negotiation(negotiation_id, user):
         if negotiation.status != 'DRAFT':
             raise ValidationError("Apenas negociações em Rascunho podem ser aprovadas.")
 
-        items = negotiation.items.select_related('vehicle').all()
+        items = list(negotiation.items.values_list('vehicle_id', 'flow', 'agreed_value'))
         if not items:
             raise ValidationError("A negociação não possui itens.")
-            
-        # Pega a entidade da Loja (ID 1 do script de seed)
-        try:
-            loja_entity = Entity.objects.get(id=1)
-        except Entity.DoesNotExist:
-             raise ValidationError("Entidade 'Loja Matriz' (ID 1) não encontrada. Execute o script de seed.")
-
-
-        total_out = Decimal('0.00')
-        total_in = Decimal('0.00')
-
-        # 2 e 3. Itera itens e atualiza veículos
-        for item in items:
-            vehicle = item.vehicle
-            
-            if item.flow == 'OUT':
-                if vehicle.status != 'AVAILABLE':
-                    raise ValidationError(f"Veículo {vehicle} não está disponível para venda.")
-                
-                vehicle.status = 'SOLD'
-                vehicle.current_owner = negotiation.customer # O cliente agora é o dono
-
-                total_out += item.agreed_value
-            
-            elif item.flow == 'IN':
-                # ATUALIZAÇÃO: O carro já foi criado na View como dono da loja
-                # Aqui apenas confirmamos o status e o dono (redundância segura)
-                vehicle.status = 'MAINTENANCE' 
-                vehicle.current_owner = loja_entity
-
-                total_in += item.agreed_value
-            
-            vehicle.save()
-
-        # ... (O resto da função continua igual para calcular saldo e gerar Ledger) ...
-        
+        check_store_entity()
+
+        vehicles = {
+            vehicle.id: vehicle
+            for vehicle in Vehicle.objects.select_for_update(of=('self',)).select_related('model__brand').filter(
+                id__in=[vehicle_id for vehicle_id, _, _ in items]
+            ).order_by('pk')
+        }
+
+        # 2. Valida tudo antes de alterar qualquer carro
+        unavailable = [
+            str(vehicles[vehicle_id]) for vehicle_id, flow, _ in items
+            if flow == 'OUT' and vehicles[vehicle_id].status != 'AVAILABLE'
+        ]
+        if unavailable:
+            raise ValidationError(f"Veículo(s) não disponível(is) para venda: {', '.join(unavailable)}.")
+
+        total_out = sum((value for _, flow, value in items if flow == 'OUT'), Decimal('0.00'))
+        total_in = sum((value for _, flow, value in items if flow == 'IN'), Decimal('0.00'))
+
+        # 3. Vendidos passam ao cliente; os da troca (criados na View como da loja) vão para a oficina
+        changes = []
+        for vehicle_id, flow, _ in items:
+            vehicle = vehicles[vehicle_id]
+            if flow == 'OUT':
+                vehicle.current_owner_id = negotiation.customer_id # O cliente agora é o dono
+                changes.append((vehicle, 'SOLD', 'SALE'))
+            elif flow == 'IN':
+                vehicle.current_owner_id = STORE_ENTITY_ID
+                changes.append((vehicle, 'MAINTENANCE', 'TRADE_IN'))
+
+        now = timezone.now()
+        change_vehicles_status(changes, user)
+        for vehicle in vehicles.values():
+            vehicle.updated_at = now # bulk_update não aplica auto_now
+        Vehicle.objects.bulk_update(
+            list(vehicles.values()), ['status', 'status_changed_at', 'current_owner', 'updated_at']
+        )
+
         saldo_final = total_out - total_in
         negotiation.total_value = saldo_final
-        negotiation.negotiation_date = timezone.now()
+        negotiation.negotiation_date = now
         negotiation.status = 'APPROVED'
         negotiation.save()
+        # Cubo de vendas (vendedor x modelo x mês)
+        record_sale(negotiation)
 
-        # 4. Gera Financeiro (Ledger)
-        if saldo_final > 0:
-            # Cliente paga a loja
-            try:
-                categoria = ChartOfAccounts.objects.get(code='1.01') # Exemplo: Receita Venda
-            except ChartOfAccounts.DoesNotExist:
-                raise ValidationError("Plano de contas 'Receita' não configurado.")
-
-            Ledger.objects.create(
-                entity=negotiation.customer,
-                chart_of_accounts=categoria,
-                total_value=saldo_final,
-                transaction_type='RECEIVABLE',
-                due_date=timezone.now().date(), 
-                description=f"Venda Ref. Negociação #{negotiation.id}",
-                negotiation=negotiation,
-                loja_id=negotiation.loja_id,
-                created_by=user
-            )
-        
-        elif saldo_final < 0:
-            # Loja paga ao cliente (Troco)
-            try:
-                categoria = ChartOfAccounts.objects.get(code='2.01') # Exemplo: Custo Aquisição
-            except ChartOfAccounts.DoesNotExist:
-                raise ValidationError("Plano de contas 'Custo Aquisição' não configurado.")
-
-            Ledger.objects.create(
-                entity=negotiation.customer,
-                chart_of_accounts=categoria,
+        # 4. Gera Financeiro (Ledger): um lançamento pelo saldo da negociação
+        if saldo_final:
+            if saldo_final > 0:
+                # Cliente paga a loja
+                code, transaction_type, description = '1.01', 'RECEIVABLE', 'Venda' # Receita Venda
+            else:
+                # Loja paga ao cliente (Troco)
+                code, transaction_type, description = '2.01', 'PAYABLE', 'Troco/Aquisição' # Custo Aquisição
+
+            categoria_id = ChartOfAccounts.objects.filter(code=code).values_list('id', flat=True).first()
+            if categoria_id is None:
+                raise ValidationError(f"Plano de contas '{code}' não configurado.")
+
+            ledger = Ledger.objects.create(
+                entity_id=negotiation.customer_id,
+                chart_of_accounts_id=categoria_id,
                 total_value=abs(saldo_final),
-                transaction_type='PAYABLE',
-                due_date=timezone.now().date(),
-                description=f"Troco/Aquisição Ref. Negociação #{negotiation.id}",
+                transaction_type=transaction_type,
+                due_date=now.date(),
+                description=f"{description} Ref. Negociação #{negotiation.id}",
                 negotiation=negotiation,
                 loja_id=negotiation.loja_id,
                 created_by=user
             )
+            post_ledger_accrual(ledger, user)
+
+        refresh_vehicle_profitability(vehicles.keys())
 
     return negotiation
 
 @transaction.atomic
 def cancel_negotiation(negotiation_id, user):
     """
-    Reverte (Estorna) uma negociação aprovada.
-    CORRIGIDO COM A ORDEM DE EXCLUSÃO CORRETA
+    Reverte (Estorna) uma negociação aprovada, em operações de conjunto
+    (nº de queries constante, não cresce com a quantidade de carros):
+    1. Trava a negociação; UM EXISTS barra se qualquer lançamento já teve pagamento
+    2. Financeiro: um update() cancelando os lançamentos + um estorno no diário
+    3. Carros vendidos voltam para a loja: um update() + eventos de status num bulk_create
+    4. Troca: um delete dos itens e um dos carros (a ordem importa por causa da PROTECT)
     """
     negotiation = Negotiation.objects.select_for_update().get(id=negotiation_id)
 
     if negotiation.status == 'CANCELED':
         raise ValidationError("Esta negociação já está cancelada.")
-        
-    try:
-        loja_entity = Entity.objects.get(id=1)
-    except Entity.DoesNotExist:
-         raise ValidationError("Entidade 'Loja Matriz' (ID 1) não encontrada.")
-
-    # 1. Reverter Financeiro PRIMEIRO
-    # (Se o financeiro já foi PAGO, a trava para a operação aqui)
-    ledgers_to_cancel = negotiation.ledger_set.all()
-    for ledger in ledgers_to_cancel:
-        if ledger.status == 'PAID':
-            raise ValidationError(f"Impossível cancelar: O lançamento (R$ {ledger.total_value}) desta venda já foi pago/recebido. Estorne o pagamento primeiro.")
-            
-        ledger.status = 'CANCELED'
-        ledger.save()
-
-    # 2. Reverter Itens (Estoque)
-    items_to_revert = negotiation.items.all()
-    
-    # Criamos uma lista separada para os carros da troca, pois vamos deletá-los
-    vehicles_from_trade_in = []
-    
-    for item in items_to_revert:
-        if item.flow == 'OUT':
-            # O carro que foi VENDIDO (Hilux)
-            # Volta a ser da loja e fica disponível
-            vehicle = item.vehicle
-            vehicle.status = 'AVAILABLE'
-            vehicle.current_owner = loja_entity
-            vehicle.save()
-            
-        elif item.flow == 'IN':
-            # O carro que entrou na TROCA (Gol)
-            # NÃO podemos deletar o 'vehicle' agora por causa da PROTECT.
-            # Primeiro, guardamos o carro e o item para deletar depois.
-            vehicles_from_trade_in.append((item, item.vehicle))
-
-    # 3. AGORA SIM: Deleta os vínculos e depois os carros da troca
-    # Esta é a correção crucial.
-    for item_to_delete, vehicle_to_delete in vehicles_from_trade_in:
-        # 3.1. Deleta o VÍNCULO (o item do histórico)
-        item_to_delete.delete()
-        
-        # 3.2. Deleta o CARRO (que agora está órfão e desprotegido)
-        # Se o carro tiver OS, ele vai travar aqui (o que é bom!)
-        vehicle_to_delete.delete()
-
-    # 4. Marcar a Venda como Cancelada
+    check_store_entity()
+
+    # 1. Pago ou pago em parte (parcela baixada) trava a operação
+    ledgers = Ledger.objects.filter(negotiation=negotiation).exclude(status='CANCELED')
+    if ledgers.filter(Q(status__in=['PAID', 'PARTIAL']) | Q(parcelas__pay_date__isnull=False)).exists():
+        raise ValidationError(
+            "Impossível cancelar: o financeiro desta venda já foi pago/recebido (total ou parcialmente). "
+            "Estorne o pagamento primeiro."
+        )
+
+    was_approved = negotiation.status == 'APPROVED'
+
+    # 2. Reverter Financeiro
+    ledgers = list(ledgers)
+    now = timezone.now()
+    if ledgers:
+        Ledger.objects.filter(id__in=[ledger.id for ledger in ledgers]).update(status='CANCELED', updated_at=now)
+        # update() não dispara signals de Ledger
+        invalidate_cash_flow()
+        # Diário é só de inclusão: o cancelamento é um estorno do que foi reconhecido
+        reverse_accruals(ledgers, user, description=f"Estorno Ref. Negociação #{negotiation.id}")
+
+    # 3. Carros VENDIDOS voltam a ser da loja e ficam disponíveis
+    items = list(negotiation.items.values_list('vehicle_id', 'flow'))
+    sold_ids = sorted(vehicle_id for vehicle_id, flow in items if flow == 'OUT')
+    if sold_ids:
+        sold = list(Vehicle.objects.select_for_update().filter(id__in=sold_ids).only('id', 'status', 'loja_id').order_by('pk'))
+        change_vehicles_status([(vehicle, 'AVAILABLE', 'SALE_CANCELED') for vehicle in sold], user)
+        Vehicle.objects.filter(id__in=sold_ids).update(
+            status='AVAILABLE', current_owner_id=STORE_ENTITY_ID, status_changed_at=now, updated_at=now,
+        )
+
+    # 4. Carros da TROCA: primeiro os vínculos (PROTECT), depois os carros.
+    # Se algum carro tiver OS ou outra venda, a exclusão trava (o que é bom!)
+    trade_in_ids = [vehicle_id for vehicle_id, flow in items if flow == 'IN']
+    if trade_in_ids:
+        negotiation.items.filter(flow='IN').delete()
+        try:
+            with search_sync_paused():
+                Vehicle.objects.filter(id__in=trade_in_ids).delete()
+        except ProtectedError:
+            raise ValidationError(
+                "Impossível cancelar: um veículo da troca já tem movimentações (OS, venda ou financeiro)."
+            )
+        sync_fts(trade_in_ids, delete=True)
+
+    # 5. Marcar a Venda como Cancelada
     negotiation.status = 'CANCELED'
     negotiation.save()
-    
-    return negotiation
\ No newline at end of file
+
+    # Sai do cubo de vendas (células refeitas sem esta venda)
+    if was_approved:
+        unrecord_sale(negotiation)
+
+    # Carros vendidos voltam ao estoque sem receita (os da troca foram deletados)
+    refresh_vehicle_profitability(sold_ids)
+
+    return negotiation
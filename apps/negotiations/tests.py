@@ -1,3 +1,75 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from parties.models import Entity
+from employees.models import Employee
+from vehicles.models import Brand, Model, Vehicle
+from financial.models import ChartOfAccounts
+from negotiations.models import Negotiation, NegotiationItem
+from negotiations.services import STORE_ENTITY_ID, approve_negotiation, cancel_negotiation
+
+
+class SetBasedNegotiationTests(TestCase):
+    """ Aprovação e cancelamento com nº de queries constante (não cresce com a quantidade de carros). """
+
+    def setUp(self):
+        Entity.objects.create(id=STORE_ENTITY_ID, nome_razao_social="Loja Matriz", documento_principal="00000000000191")
+        self.customer = Entity.objects.create(nome_razao_social="Cliente", documento_principal="11111111111")
+        self.seller = Employee.objects.create(
+            entidade=Entity.objects.create(nome_razao_social="Vendedor", documento_principal="22222222222"),
+            cargo="Vendedor",
+        )
+        ChartOfAccounts.objects.create(name="Venda de Veículos", code="1.01", operation_type='REVENUE')
+        self.model = Model.objects.create(brand=Brand.objects.create(name="Fiat"), name="Uno")
+        self.plates = 0
+
+    def vehicle(self, status='AVAILABLE'):
+        self.plates += 1
+        return Vehicle.objects.create(
+            model=self.model, chassi=f"CHASSI{self.plates:011d}", plate=f"TST{self.plates:04d}",
+            year_fab=2020, year_model=2020, color="Prata", status=status,
+            acquisition_cost=Decimal('10000.00'), sale_price=Decimal('15000.00'), current_owner_id=STORE_ENTITY_ID,
+        )
+
+    def negotiation(self, sold, traded):
+        """ Rascunho com 'sold' carros vendidos e 'traded' carros na troca. """
+        negotiation = Negotiation.objects.create(customer=self.customer, seller=self.seller, negotiation_type='SALE')
+        NegotiationItem.objects.bulk_create(
+            [NegotiationItem(negotiation=negotiation, vehicle=self.vehicle(), flow='OUT', agreed_value=Decimal('15000.00'))
+             for _ in range(sold)]
+            + [NegotiationItem(negotiation=negotiation, vehicle=self.vehicle('MAINTENANCE'), flow='IN', agreed_value=Decimal('5000.00'))
+               for _ in range(traded)]
+        )
+        return negotiation
+
+    def queries(self, operation, negotiation_id):
+        # Mede depois de uma primeira execução: a célula do cubo de vendas já existe e os
+        # caches (Ex: detecção da tabela FTS) já foram preenchidos, como em produção
+        with CaptureQueriesContext(connection) as context:
+            operation(negotiation_id, None)
+        return len(context.captured_queries)
+
+    def test_approve_query_count_is_constant(self):
+        approve_negotiation(self.negotiation(1, 1).id, None)
+        single = self.negotiation(1, 1)
+        fleet = self.negotiation(10, 10)
+        expected = self.queries(approve_negotiation, single.id)
+        with self.assertNumQueries(expected):
+            approve_negotiation(fleet.id, None)
+        self.assertEqual(Vehicle.objects.filter(status='SOLD').count(), 12)
 
-# Create your tests here.
+    def test_cancel_query_count_is_constant(self):
+        # 'kept' continua aprovada: a célula do cubo é refeita com uma linha nos dois cancelamentos
+        negotiations = [self.negotiation(1, 1) for _ in range(3)] + [self.negotiation(10, 10)]
+        for negotiation in negotiations:
+            approve_negotiation(negotiation.id, None)
+        kept, warm_up, single, fleet = negotiations
+        cancel_negotiation(warm_up.id, None)
+        expected = self.queries(cancel_negotiation, single.id)
+        with self.assertNumQueries(expected):
+            cancel_negotiation(fleet.id, None)
+        self.assertEqual(Vehicle.objects.filter(status='SOLD').count(), 1)
+        self.assertEqual(Vehicle.objects.filter(status='MAINTENANCE').count(), 1)
@@ -5,11 +5,22 @@ urlpatterns = [
     # Listagem (Raiz de sales/)
     path('', views.negotiation_list, name='negotiation_list'),
     
+    # Exportação CSV
+    path('export/', views.negotiation_export, name='negotiation_export'),
+
     # Nova Venda
     path('new/', views.negotiation_create, name='negotiation_create'),
+    # Linha nova do editor (HTMX): 'out' = venda, 'in' = troca
+    path('new/line/<str:flow>/', views.negotiation_line, name='negotiation_line'),
     
     # Detalhes (ex: sales/5/)
     path('<int:pk>/', views.negotiation_detail, name='negotiation_detail'),
 
+    # Análise de vendas (cubo vendedor x marca/modelo x mês)
+    path('analytics/', views.sales_analytics, name='sales_analytics'),
+
+    # Comissões dos vendedores (rodada mensal)
+    path('commissions/', views.commission_report, name='commission_report'),
+
     path('<int:pk>/cancel/', views.negotiation_cancel, name='negotiation_cancel'),
 ]
\ No newline at end of file
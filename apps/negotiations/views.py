@@ -1,121 +1,132 @@
-from django.shortcuts import render, redirect
+from django.http import Http404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from core.pagination import paginate_keyset
+from core.exports import stream_csv, money, EXPORT_CHUNK_SIZE
 
-from .forms import SaleForm
-from .models import NegotiationItem
-from .services import approve_negotiation
+from .forms import SaleForm, SaleItemFormSet, TradeInFormSet
 
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Negotiation
-
-from vehicles.models import Vehicle, Brand, Model
+from django.urls import reverse
 from decimal import Decimal
+from .models import Negotiation
 
-from vehicles.models import Vehicle, Brand, Model # Importar modelos de veículos
-from parties.models import Entity # Importar Entidade
-from .services import approve_negotiation, cancel_negotiation
+from .services import create_sale, cancel_negotiation
+from .commissions import BASIS, commission_preview, run_commissions
+from .analytics import DIMENSIONS, sales_cube
+from employees.models import Employee
+from vehicles.models import Brand
+from urllib.parse import urlencode
+from financial.dre import add_months, month_start
+from datetime import date
+from django.utils.dateparse import parse_date
 from django.core.exceptions import ValidationError
 
 
+LINE_FORMSETS = {'out': SaleItemFormSet, 'in': TradeInFormSet}
+
+
+def _sale_formsets(data=None):
+    return SaleItemFormSet(data, prefix='out'), TradeInFormSet(data, prefix='in')
+
+
 @login_required
 def negotiation_create(request):
+    """
+    Editor da negociação: N carros vendidos (saída) e N carros na troca (entrada).
+    Linhas novas chegam pelo HTMX (negotiation_line); tudo é gravado e aprovado
+    numa transação pelo service create_sale.
+    """
     if request.method == 'POST':
         form = SaleForm(request.POST)
-        if form.is_valid():
+        sale_items, trade_ins = _sale_formsets(request.POST)
+        if form.is_valid() and sale_items.is_valid() and trade_ins.is_valid():
             try:
-                with transaction.atomic():
-                    # 1. Cria a Negociação (Cabeçalho)
-                    negotiation = form.save(commit=False)
-                    negotiation.negotiation_type = 'SALE'
-                    negotiation.status = 'DRAFT'
-                    negotiation.created_by = request.user
-                    negotiation.save()
-
-                    # 2. Item 1: O Carro da Loja (SAÍDA)
-                    vehicle_out = form.cleaned_data['vehicle']
-                    price_out = form.cleaned_data['sale_value']
-                    
-                    NegotiationItem.objects.create(
-                        negotiation=negotiation,
-                        vehicle=vehicle_out,
-                        flow='OUT',
-                        agreed_value=price_out,
-                        created_by=request.user
-                    )
-
-                    # 3. Item 2: A Troca (ENTRADA) - Se houver
-                    if form.cleaned_data['has_trade_in']:
-                        # A. Busca Marca/Modelo (Cria se não existir)
-                        brand_name = form.cleaned_data['trade_in_brand_name']
-                        model_name = form.cleaned_data['trade_in_model_name']
-                        
-                        brand_obj, _ = Brand.objects.get_or_create(name=brand_name.upper())
-                        model_obj, _ = Model.objects.get_or_create(brand=brand_obj, name=model_name)
-                        
-                        # B. Pega o valor da troca (Custo de Aquisição)
-                        value_in = form.cleaned_data['trade_in_value']
-
-                        # C. Busca a Entidade da Loja (Dona do carro)
-                        # Assumindo ID 1 para a Loja Matriz (Definido no script de seed)
-                        loja_entity = Entity.objects.get(id=1) 
-                        
-                        # D. Cadastra o Veículo da Troca 100% Completo
-                        vehicle_in = Vehicle.objects.create(
-                            model=model_obj,
-                            chassi=form.cleaned_data['trade_in_chassi'],
-                            plate=form.cleaned_data['trade_in_plate'],
-                            renavam=form.cleaned_data['trade_in_renavam'],
-                            year_fab=form.cleaned_data['trade_in_year_fab'],
-                            year_model=form.cleaned_data['trade_in_year_model'],
-                            color=form.cleaned_data['trade_in_color'],
-                            fuel_type=form.cleaned_data['trade_in_fuel_type'],
-                            mileage=form.cleaned_data['trade_in_mileage'],
-                            
-                            status='MAINTENANCE', # Entra direto pra revisão
-                            acquisition_cost=value_in, # O custo dele é quanto pagamos na troca!
-                            sale_price=value_in * Decimal('1.3'), # Sugestão de preço (+30%)
-                            
-                            # O dono agora é a Loja, pois é uma aquisição.
-                            current_owner=loja_entity, 
-                            
-                            created_by=request.user
-                        )
-                        
-                        # E. Lança o Item na Negociação
-                        NegotiationItem.objects.create(
-                            negotiation=negotiation,
-                            vehicle=vehicle_in,
-                            flow='IN',
-                            agreed_value=value_in,
-                            created_by=request.user
-                        )
-
-                    # 4. Aprova tudo e gera financeiro (Saldo = Saída - Entrada)
-                    # O service 'approve_negotiation' NÃO vai mudar o dono, 
-                    # pois o carro já foi criado como dono da loja.
-                    approve_negotiation(negotiation.id, request.user)
-                    
-                    messages.success(request, f"Venda #{negotiation.id} realizada! Financeiro gerado com sucesso.")
-                    return redirect('negotiation_detail', pk=negotiation.id)
-            
+                negotiation = create_sale(
+                    form.cleaned_data['customer'], form.cleaned_data['seller'],
+                    sale_items.items, trade_ins.items, request.user,
+                )
+                messages.success(request, f"Venda #{negotiation.id} realizada! Financeiro gerado com sucesso.")
+                return redirect('negotiation_detail', pk=negotiation.id)
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
             except Exception as e:
                 messages.error(request, f"Erro ao processar venda: {str(e)}")
     else:
         form = SaleForm()
+        sale_items, trade_ins = _sale_formsets()
+
+    return render(request, 'negotiations/negotiation_form.html', {
+        'form': form,
+        'sale_items': sale_items,
+        'trade_ins': trade_ins,
+    })
+
 
-    return render(request, 'negotiations/negotiation_form.html', {'form': form})
+@login_required
+def negotiation_line(request, flow):
+    """ HTMX: uma linha nova do editor ('out' = venda, 'in' = troca) na posição ?index=. """
+    formset_class = LINE_FORMSETS.get(flow)
+    if formset_class is None:
+        raise Http404
+    try:
+        index = int(request.GET.get('index', 0))
+    except ValueError:
+        index = 0
+
+    formset = formset_class(prefix=flow)
+    return render(request, f'negotiations/partials/{flow}_line.html', {
+        'line': formset.line_form(index),
+        'prefix': flow,
+        'next_index': index + 1,
+    })
 
 
 @login_required
 def negotiation_list(request):
     # Lista ordenando da mais recente para a mais antiga
     sales = Negotiation.objects.filter(negotiation_type='SALE').select_related(
-        'customer', 'seller'
-    ).prefetch_related('items__vehicle').order_by('-created_at')
-    
-    return render(request, 'negotiations/negotiation_list.html', {'sales': sales})
+        'customer', 'seller__entidade'
+    ).prefetch_related('items__vehicle__model__brand')
+
+    page = paginate_keyset(request, sales, ordering=['-created_at', '-id'])
+    context = {'sales': page, 'page': page}
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'negotiations/partials/negotiation_table_rows.html', context)
+
+    return render(request, 'negotiations/negotiation_list.html', context)
+
+@login_required
+def negotiation_export(request):
+    """ Exporta o histórico de vendas em CSV, via streaming. """
+    sales = Negotiation.objects.filter(negotiation_type='SALE').select_related(
+        'customer', 'seller__entidade'
+    ).prefetch_related('items__vehicle__model__brand').order_by('id')
+
+    def vehicles(sale, flow):
+        return ' | '.join(
+            f"{item.vehicle.model} {item.vehicle.plate or 'S/ Placa'} (R$ {money(item.agreed_value)})"
+            for item in sale.items.all() if item.flow == flow
+        )
+
+    def rows():
+        # Com chunk_size o prefetch é feito lote a lote, sem carregar tudo na memória
+        for sale in sales.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                sale.id, sale.created_at.strftime('%d/%m/%Y %H:%M'),
+                sale.negotiation_date.strftime('%d/%m/%Y %H:%M') if sale.negotiation_date else '',
+                sale.customer.nome_razao_social, sale.customer.documento_principal,
+                sale.seller.entidade.nome_razao_social, sale.get_status_display(),
+                vehicles(sale, 'OUT'), vehicles(sale, 'IN'), money(sale.total_value),
+            ]
+
+    header = [
+        'ID', 'Criada em', 'Fechamento', 'Cliente', 'CPF/CNPJ', 'Vendedor', 'Status',
+        'Veículos Vendidos', 'Veículos na Troca', 'Saldo Final',
+    ]
+    return stream_csv('vendas.csv', header, rows())
 
 @login_required
 def negotiation_detail(request, pk):
@@ -147,4 +158,100 @@ def negotiation_cancel(request, pk):
             messages.error(request, f"Erro técnico ao cancelar: {str(e)}")
             
     # Após cancelar (ou dar erro), volta para os detalhes
-    return redirect('negotiation_detail', pk=pk)
\ No newline at end of file
+    return redirect('negotiation_detail', pk=pk)
+
+@login_required
+def commission_report(request):
+    """
+    Comissões do mês por vendedor (prévia) e geração dos Contas a Pagar (POST).
+    Rodar de novo o mesmo mês só gera para quem ainda não tem comissão.
+    """
+    source = request.POST if request.method == 'POST' else request.GET
+    try:
+        month = parse_date(f"{source.get('month', '')}-01")
+    except ValueError:
+        month = None
+    month = month or add_months(month_start(date.today()), -1)
+    basis = source.get('basis') if source.get('basis') in BASIS else 'items'
+
+    if request.method == 'POST':
+        try:
+            created = run_commissions(month, request.user, basis)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+        else:
+            if created:
+                messages.success(request, f"{len(created)} comissão(ões) gerada(s) em Contas a Pagar.")
+            else:
+                messages.info(request, "Nenhuma comissão nova a gerar neste mês.")
+        return redirect(f"{reverse('commission_report')}?month={month:%Y-%m}&basis={basis}")
+
+    rows = commission_preview(month, basis)
+    return render(request, 'negotiations/commission_report.html', {
+        'rows': rows,
+        'month': month,
+        'basis': basis,
+        'basis_choices': BASIS.items(),
+        'totals': {
+            'sales_total': sum((row['sales_total'] for row in rows), Decimal('0.00')),
+            'value': sum((row['value'] for row in rows), Decimal('0.00')),
+        },
+        'pending': any(row['commission'] is None and row['value'] > 0 for row in rows),
+    })
+
+
+def _month_param(request, name, default):
+    """ Lê 'AAAA-MM' (input type=month); valor inválido cai no padrão. """
+    try:
+        return parse_date(f"{request.GET[name]}-01") or default
+    except (KeyError, ValueError):
+        return default
+
+
+def _id_param(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
+
+
+@login_required
+def sales_analytics(request):
+    """
+    Vendas (volume, receita e margem) por vendedor, marca, modelo ou mês, lidas do cubo
+    pré-agregado. Clicar numa linha desce um nível (vendedor -> marca -> modelo).
+    """
+    current = month_start(date.today())
+    start = _month_param(request, 'start', add_months(current, -11))
+    end = _month_param(request, 'end', current)
+    if start > end:
+        start, end = end, start
+    dimension = request.GET.get('dimension') if request.GET.get('dimension') in DIMENSIONS else 'seller'
+    seller_id = _id_param(request, 'seller')
+    brand_id = _id_param(request, 'brand')
+
+    cube = sales_cube(start, end, dimension, seller_id, brand_id)
+
+    # Links do drill-down: mantém período e filtros, o valor clicado vira filtro do próximo nível
+    params = {'start': f"{start:%Y-%m}", 'end': f"{end:%Y-%m}"}
+    if seller_id:
+        params['seller'] = seller_id
+    if brand_id:
+        params['brand'] = brand_id
+    drill = DIMENSIONS[dimension]['drill']
+    for row in cube['rows']:
+        row['drill_url'] = f"?{urlencode({**params, dimension: row['key'], 'dimension': drill})}" if drill else None
+
+    def without(name):
+        return f"?{urlencode({**{k: v for k, v in params.items() if k != name}, 'dimension': dimension})}"
+
+    return render(request, 'negotiations/sales_analytics.html', {
+        **cube,
+        'start': start,
+        'end': end,
+        'dimension': dimension,
+        'dimensions': [(key, spec['label']) for key, spec in DIMENSIONS.items()],
+        'dimension_label': DIMENSIONS[dimension]['label'],
+        'seller': Employee.objects.select_related('entidade').filter(id=seller_id).first() if seller_id else None,
+        'brand': Brand.objects.filter(id=brand_id).first() if brand_id else None,
+        'clear_seller_url': without('seller'),
+        'clear_brand_url': without('brand'),
+    })
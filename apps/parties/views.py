@@ -2,13 +2,14 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
+from core.pagination import paginate_keyset
 from .models import Entity
 from .forms import EntityForm
 
 @login_required
 def entity_list(request):
     query = request.GET.get('q', '')
-    entities = Entity.objects.all().order_by('nome_razao_social')
+    entities = Entity.objects.all()
 
     if query:
         entities = entities.filter(
@@ -16,7 +17,15 @@ def entity_list(request):
             Q(documento_principal__icontains=query)
         )
 
-    return render(request, 'parties/entity_list.html', {'entities': entities})
+    # 'nome_razao_social' já é indexado; 'id' desempata nomes repetidos
+    page = paginate_keyset(request, entities, ordering=['nome_razao_social', 'id'])
+    context = {'entities': page, 'page': page}
+
+    # Scroll infinito: o HTMX pede apenas as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'parties/partials/entity_table_rows.html', context)
+
+    return render(request, 'parties/entity_list.html', context)
 
 @login_required
 def entity_create(request):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Brand, Model, Vehicle
+from .models import Brand, Model, Vehicle, VehicleStatusEvent, VehiclePhoto
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
@@ -18,4 +18,28 @@ class VehicleAdmin(admin.ModelAdmin):
     list_filter = ('status', 'model__brand', 'year_model')
     search_fields = ('chassi', 'plate', 'model__name')
     # Autocomplete para facilitar a busca do dono e do modelo se houverem muitos registros
-    autocomplete_fields = ['model', 'current_owner']
\ No newline at end of file
+    autocomplete_fields = ['model', 'current_owner']
+
+@admin.register(VehicleStatusEvent)
+class VehicleStatusEventAdmin(admin.ModelAdmin):
+    # Histórico somente leitura: é gravado pela API de transição de status
+    list_display = ('vehicle', 'from_status', 'to_status', 'source', 'occurred_at', 'created_by')
+    list_filter = ('to_status', 'source')
+    search_fields = ('vehicle__plate', 'vehicle__chassi')
+    list_select_related = ('vehicle__model__brand', 'created_by')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(VehiclePhoto)
+class VehiclePhotoAdmin(admin.ModelAdmin):
+    list_display = ('vehicle', 'is_cover', 'position', 'status', 'width', 'height', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('vehicle__plate', 'vehicle__chassi', 'content_hash')
+    readonly_fields = ('content_hash', 'status', 'width', 'height', 'error')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VehiclesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vehicles'
+
+    def ready(self):
+        # Mantém o índice de busca sincronizado com os veículos
+        from . import signals  # noqa: F401
@@ -0,0 +1,115 @@
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+
+from .search import normalize
+
+# Token da versão atual do catálogo, compartilhado entre os workers via cache do Django.
+# Usamos um token aleatório (e não um contador) para que a expiração/limpeza do cache
+# nunca "volte" para uma versão antiga que algum worker ainda tenha em memória.
+CATALOG_VERSION_KEY = 'vehicles:catalog:version'
+
+_snapshot = None
+# True quando este processo alterou o catálogo numa transação ainda não concluída
+_dirty = False
+
+
+class CatalogSnapshot:
+    """
+    Foto imutável de Marcas e Modelos, carregada com 2 queries e mantida em memória
+    no processo. O catálogo é pequeno e quase nunca muda.
+    """
+    def __init__(self, version):
+        from .models import Brand, Model
+
+        self.version = version
+        self.brands = list(Brand.objects.order_by('name').values_list('id', 'name'))
+        self.models_by_brand = defaultdict(list)
+        self.model_brand = {}
+
+        self._brand_index = {normalize(name): brand_id for brand_id, name in self.brands}
+        self._model_index = {}
+
+        for model_id, brand_id, name in Model.objects.order_by('name').values_list('id', 'brand_id', 'name'):
+            self.models_by_brand[brand_id].append((model_id, name))
+            self.model_brand[model_id] = brand_id
+            self._model_index[(brand_id, normalize(name))] = model_id
+
+        self._fragments = {}
+
+    def brand_choices(self, empty_label='---------'):
+        return [('', empty_label)] + self.brands
+
+    def model_choices(self, brand_id, empty_label='--- Selecione o Modelo ---'):
+        return [('', empty_label)] + self.models_by_brand.get(brand_id, [])
+
+    def find_brand(self, name):
+        """ Busca por nome ignorando maiúsculas e acentos ('citroen' == 'Citroën'). """
+        return self._brand_index.get(normalize(name))
+
+    def find_model(self, brand_id, name):
+        return self._model_index.get((brand_id, normalize(name)))
+
+    def model_options_html(self, brand_id):
+        """ Fragmento <option> do load_models, renderizado uma vez por versão do catálogo. """
+        if brand_id not in self._fragments:
+            models = [{'id': model_id, 'name': name} for model_id, name in self.models_by_brand.get(brand_id, [])]
+            self._fragments[brand_id] = render_to_string('vehicles/partials/model_options.html', {'models': models})
+        return self._fragments[brand_id]
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def get_catalog():
+    """ Devolve o snapshot em memória, recarregando só se outro processo invalidou. """
+    global _snapshot, _dirty
+    if _dirty:
+        if connection.in_atomic_block:
+            # Ainda dentro da transação que alterou o catálogo: foto descartável,
+            # pois um rollback desfaria as mudanças que ela enxerga.
+            return CatalogSnapshot(None)
+        _dirty = False
+
+    version = catalog_version()
+    if _snapshot is None or _snapshot.version != version:
+        _snapshot = CatalogSnapshot(version)
+    return _snapshot
+
+
+def _bump_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_catalog():
+    """
+    Chamado pelos signals de Brand/Model.
+    - Este processo descarta o snapshot na hora (enxerga a própria transação);
+    - Os demais workers só recarregam após o COMMIT, para não guardarem uma foto sem a mudança.
+    """
+    global _snapshot, _dirty
+    _snapshot = None
+    _dirty = True
+    transaction.on_commit(_bump_version)
+
+
+def get_or_create_model_by_name(brand_name, model_name, user=None):
+    """
+    Resolve Marca/Modelo digitados livremente (Ex: veículo da troca) usando o catálogo
+    em memória; só vai ao banco para criar o que ainda não existe.
+    """
+    from .models import Brand, Model
+
+    catalog = get_catalog()
+    brand_id = catalog.find_brand(brand_name)
+    if brand_id is None:
+        brand_id = Brand.objects.create(name=brand_name.strip().upper(), created_by=user).id
+
+    model_id = catalog.find_model(brand_id, model_name)
+    if model_id is None:
+        return Model.objects.create(brand_id=brand_id, name=model_name.strip(), created_by=user)
+    return Model.objects.select_related('brand').get(id=model_id)
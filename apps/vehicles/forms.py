@@ -1,5 +1,6 @@
 from django import forms
 from .models import Vehicle, Brand, Model
+from .catalog import get_catalog
 
 class VehicleAcquisitionForm(forms.ModelForm):
     # Campos extras para Vendedor
@@ -52,6 +53,12 @@ class VehicleAcquisitionForm(forms.ModelForm):
         self.fields['model'].queryset = Model.objects.none()
         self.fields['model'].widget.attrs.update({'class': 'form-select'})
 
+        # Opções vêm do catálogo em memória (sem query para renderizar os selects).
+        # O queryset continua valendo para a validação do POST.
+        catalog = get_catalog()
+        self.fields['brand'].choices = catalog.brand_choices()
+        self.fields['model'].choices = catalog.model_choices(None)
+
         # Se o formulário foi enviado (POST) ou teve erro de validação
         if 'brand' in self.data:
             try:
@@ -59,6 +66,7 @@ class VehicleAcquisitionForm(forms.ModelForm):
                 # Se o form voltou com erro, preenchemos o queryset de modelo
                 # para que o valor selecionado anteriormente ainda seja válido.
                 self.fields['model'].queryset = Model.objects.filter(brand_id=brand_id).order_by('name')
+                self.fields['model'].choices = catalog.model_choices(brand_id)
             except (ValueError, TypeError):
                 pass # Mantém o queryset vazio se a marca for inválida
 
@@ -114,20 +122,27 @@ class VehicleEditForm(forms.ModelForm):
         
         self.fields['model'].widget.attrs.update({'class': 'form-select'})
 
+        # Opções de Marca/Modelo vêm do catálogo em memória
+        catalog = get_catalog()
+        self.fields['brand'].choices = catalog.brand_choices()
+
         # self.instance é o veículo que estamos editando (GET)
         if self.instance and self.instance.pk:
-            # 1. Pré-seleciona a Marca correta
-            if self.instance.model: # Proteção caso modelo seja nulo
-                self.fields['brand'].initial = self.instance.model.brand_id
+            # 1. Pré-seleciona a Marca correta (sem buscar o Modelo no banco)
+            brand_id = catalog.model_brand.get(self.instance.model_id)
+            if brand_id: # Proteção caso modelo seja nulo
+                self.fields['brand'].initial = brand_id
             
                 # 2. Pré-popula o queryset de Modelos
-                self.fields['model'].queryset = Model.objects.filter(brand_id=self.instance.model.brand_id).order_by('name')
+                self.fields['model'].queryset = Model.objects.filter(brand_id=brand_id).order_by('name')
+                self.fields['model'].choices = catalog.model_choices(brand_id)
         
         # Lógica para quando o form volta com erro (POST)
         elif 'brand' in self.data:
             try:
                 brand_id = int(self.data.get('brand'))
                 self.fields['model'].queryset = Model.objects.filter(brand_id=brand_id).order_by('name')
+                self.fields['model'].choices = catalog.model_choices(brand_id)
             except (ValueError, TypeError):
                 self.fields['model'].queryset = Model.objects.none()
         else:
@@ -164,4 +179,30 @@ class ModelForm(forms.ModelForm):
         }
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: Corolla'})
-        }
\ No newline at end of file
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Lista de marcas do catálogo em memória
+        self.fields['brand'].choices = get_catalog().brand_choices()
+
+
+class MultipleImageInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    """ Vários arquivos no mesmo campo; cada um é validado como imagem. """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleImageInput(attrs={'class': 'form-control', 'accept': 'image/*'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_clean(d, initial) for d in data]
+        return [single_clean(data, initial)]
+
+
+class VehiclePhotoUploadForm(forms.Form):
+    photos = MultipleImageField(label="Fotos")
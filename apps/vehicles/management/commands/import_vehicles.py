@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+
+from vehicles.services import import_vehicles, iter_import_rows
+
+
+class Command(BaseCommand):
+    help = 'Importa veículos em lote (CSV ou JSONL) gerando o Contas a Pagar de cada aquisição.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo .csv ou .jsonl')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Padrão: pela extensão do arquivo')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--user', help='Username registrado como "Criado por"')
+        parser.add_argument('--loja-id', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário '{options['user']}' não encontrado.")
+
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                result = import_vehicles(
+                    iter_import_rows(stream, fmt),
+                    user=user,
+                    loja_id=options['loja_id'],
+                    batch_size=options['batch_size'],
+                )
+        except OSError as e:
+            raise CommandError(f"Não foi possível ler o arquivo: {e}")
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"Linha {line_no}: {message}")
+
+        style = self.style.SUCCESS if not result.errors else self.style.WARNING
+        self.stdout.write(style(f"{result.created} veículos importados, {len(result.errors)} linhas com erro."))
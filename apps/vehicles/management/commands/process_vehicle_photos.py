@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vehicles.photos import process_pending_photos, requeue_photos
+
+
+class Command(BaseCommand):
+    help = 'Worker das fotos de veículos: gera as miniaturas (WebP/JPEG) das fotos pendentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Fica rodando e consultando a fila.')
+        parser.add_argument('--interval', type=float, default=5, help='Segundos entre consultas quando a fila está vazia.')
+        parser.add_argument('--limit', type=int, default=50, help='Fotos por rodada.')
+        parser.add_argument('--retry-failed', action='store_true', help='Recoloca na fila as fotos que falharam.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_photos(include_failed=options['retry_failed'])
+        if requeued:
+            self.stdout.write(f"{requeued} fotos recolocadas na fila.")
+
+        while True:
+            processed = process_pending_photos(limit=options['limit'])
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"{processed} fotos processadas."))
+
+            if not options['loop']:
+                break
+            if processed < options['limit']:
+                time.sleep(options['interval'])
+                requeue_photos()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from vehicles.services import rebuild_vehicle_profitability
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela de lucratividade por veículo (ROI) a partir de OS, lançamentos e vendas.'
+
+    def handle(self, *args, **options):
+        total = rebuild_vehicle_profitability()
+        self.stdout.write(self.style.SUCCESS(f"Lucratividade recalculada para {total} veículos."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vehicles.models import Vehicle
+from vehicles.search import reindex_vehicles
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o índice de busca de veículos (documento + FTS5/pg_trgm).'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        total = reindex_vehicles(Vehicle.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Índice de busca reconstruído para {total} veículos."))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:42
+
+import unicodedata
+
+from django.db import migrations, models
+
+# Cópias de vehicles.search no momento desta migration (mudanças no app não a alteram)
+FTS_TABLE = 'vehicles_vehicle_fts'
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def create_search_index(apps, schema_editor):
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    connection = schema_editor.connection
+
+    # 1. Preenche o documento de busca dos veículos existentes
+    vehicles = list(Vehicle.objects.select_related('model__brand'))
+    for v in vehicles:
+        parts = [v.model.brand.name, v.model.name, v.plate, v.chassi, v.renavam, v.color]
+        v.search_document = normalize(' '.join(p for p in parts if p))
+    Vehicle.objects.bulk_update(vehicles, ['search_document'], batch_size=500)
+
+    # 2. Índice específico de cada banco
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(document, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, document) SELECT id, search_document FROM vehicles_vehicle"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS vehicles_vehicle_search_trgm "
+            "ON vehicles_vehicle USING gin (search_document gin_trgm_ops)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS vehicles_vehicle_search_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_alter_vehicle_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
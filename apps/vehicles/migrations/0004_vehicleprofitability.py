@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:43
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_profitability(apps, schema_editor):
+    # Carga inicial (única) da tabela. Depois ela é mantida pelos serviços.
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    VehicleProfitability = apps.get_model('vehicles', 'VehicleProfitability')
+    ServiceOrder = apps.get_model('maintenance', 'ServiceOrder')
+    Ledger = apps.get_model('financial', 'Ledger')
+    NegotiationItem = apps.get_model('negotiations', 'NegotiationItem')
+    zero = Decimal('0.00')
+
+    rows = []
+    for v in Vehicle.objects.all():
+        is_sold = v.status == 'SOLD'
+        maintenance = ServiceOrder.objects.filter(vehicle=v).exclude(status='CANCELED').aggregate(s=Sum('total_cost'))['s'] or zero
+        other = zero
+        for ledger in Ledger.objects.filter(vehicle=v).exclude(status='CANCELED').exclude(chart_of_accounts__code__in=['2.01', '3.01']):
+            other += ledger.total_value if ledger.transaction_type == 'PAYABLE' else -ledger.total_value
+        revenue = NegotiationItem.objects.filter(
+            vehicle=v, flow='OUT', negotiation__status='APPROVED'
+        ).aggregate(s=Sum('agreed_value'))['s'] or (v.sale_price if is_sold else zero)
+        rows.append(VehicleProfitability(
+            vehicle=v, is_sold=is_sold, revenue=revenue,
+            acquisition_cost=v.acquisition_cost, maintenance_cost=maintenance, other_costs=other,
+            profit=revenue - v.acquisition_cost - maintenance - other,
+        ))
+    VehicleProfitability.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0003_vehicle_search_document'),
+        ('financial', '0002_ledger_negotiation'),
+        ('maintenance', '0001_initial'),
+        ('negotiations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleProfitability',
+            fields=[
+                ('vehicle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profitability', serialize=False, to='vehicles.vehicle', verbose_name='Veículo')),
+                ('is_sold', models.BooleanField(default=False, verbose_name='Vendido')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Receita da Venda')),
+                ('acquisition_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Custo de Aquisição')),
+                ('maintenance_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Custo Oficina')),
+                ('other_costs', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Outros Custos')),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Lucro Real')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Lucratividade do Veículo',
+                'verbose_name_plural': 'Lucratividade dos Veículos',
+                'indexes': [models.Index(fields=['is_sold', '-vehicle'], name='vehicles_ve_is_sold_5fae50_idx')],
+            },
+        ),
+        migrations.RunPython(populate_profitability, migrations.RunPython.noop),
+    ]
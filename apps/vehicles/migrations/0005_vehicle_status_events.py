@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_status_history(apps, schema_editor):
+    """
+    Sem histórico anterior: usamos o cadastro como entrada no estoque e a última
+    alteração como início do status atual. Cada carro ganha um evento inicial.
+    """
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    VehicleStatusEvent = apps.get_model('vehicles', 'VehicleStatusEvent')
+
+    Vehicle.objects.update(stock_entry_at=models.F('created_at'), status_changed_at=models.F('updated_at'))
+    VehicleStatusEvent.objects.bulk_create([
+        VehicleStatusEvent(
+            vehicle_id=v['id'], from_status=None, to_status=v['status'], source='MANUAL',
+            occurred_at=v['created_at'], loja_id=v['loja_id'], created_by_id=v['created_by_id'],
+        )
+        for v in Vehicle.objects.values('id', 'status', 'created_at', 'loja_id', 'created_by_id').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parties', '0001_initial'),
+        ('vehicles', '0004_vehicleprofitability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('AVAILABLE', 'Disponível'), ('MAINTENANCE', 'Em Manutenção'), ('RESERVED', 'Reservado'), ('SOLD', 'Vendido'), ('WRITE_OFF', 'Baixado / Perda Total')], max_length=20, null=True, verbose_name='De')),
+                ('to_status', models.CharField(choices=[('AVAILABLE', 'Disponível'), ('MAINTENANCE', 'Em Manutenção'), ('RESERVED', 'Reservado'), ('SOLD', 'Vendido'), ('WRITE_OFF', 'Baixado / Perda Total')], max_length=20, verbose_name='Para')),
+                ('source', models.CharField(choices=[('ACQUISITION', 'Compra'), ('TRADE_IN', 'Entrada na Troca'), ('IMPORT', 'Importação'), ('MAINTENANCE', 'Ordem de Serviço'), ('SALE', 'Venda'), ('SALE_CANCELED', 'Cancelamento de Venda'), ('MANUAL', 'Edição Manual')], max_length=20, verbose_name='Origem')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data/Hora')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+            ],
+            options={
+                'verbose_name': 'Evento de Status do Veículo',
+                'verbose_name_plural': 'Eventos de Status dos Veículos',
+                'ordering': ['occurred_at', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Status Desde'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='stock_entry_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Entrada no Estoque'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['status', 'stock_entry_at'], name='vehicles_ve_status_ef479f_idx'),
+        ),
+        migrations.AddField(
+            model_name='vehiclestatusevent',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vehiclestatusevent_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por'),
+        ),
+        migrations.AddField(
+            model_name='vehiclestatusevent',
+            name='vehicle',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='vehicles.vehicle', verbose_name='Veículo'),
+        ),
+        migrations.AddIndex(
+            model_name='vehiclestatusevent',
+            index=models.Index(fields=['vehicle', 'occurred_at'], name='vehicles_ve_vehicle_fe2478_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehiclestatusevent',
+            index=models.Index(fields=['to_status', 'occurred_at'], name='vehicles_ve_to_stat_0f4c80_idx'),
+        ),
+        migrations.RunPython(backfill_status_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:54
+
+import django.db.models.deletion
+import vehicles.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0005_vehicle_status_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehiclePhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loja_id', models.IntegerField(default=1, verbose_name='ID da Loja')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('image', models.ImageField(max_length=255, upload_to=vehicles.models.vehicle_photo_path, verbose_name='Arquivo Original')),
+                ('content_hash', models.CharField(db_index=True, editable=False, max_length=64, verbose_name='Hash do Conteúdo')),
+                ('is_cover', models.BooleanField(default=False, verbose_name='Capa')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Ordem')),
+                ('status', models.CharField(choices=[('PENDING', 'Aguardando Miniaturas'), ('PROCESSING', 'Processando'), ('READY', 'Pronta'), ('FAILED', 'Falhou')], db_index=True, default='PENDING', max_length=20)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='vehicles.vehicle', verbose_name='Veículo')),
+            ],
+            options={
+                'verbose_name': 'Foto do Veículo',
+                'verbose_name_plural': 'Fotos dos Veículos',
+                'ordering': ['-is_cover', 'position', 'id'],
+                'indexes': [models.Index(fields=['vehicle', 'status', '-is_cover', 'position'], name='vehicles_ve_vehicle_5983cb_idx')],
+            },
+        ),
+    ]
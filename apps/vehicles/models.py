@@ -1,4 +1,6 @@
 from django.db import models
+from django.conf import settings
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from core.models import TenantAwareModel
 from parties.models import Entity
@@ -65,6 +67,11 @@ class Vehicle(TenantAwareModel):
 
     # --- Negócio & Financeiro ---
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='AVAILABLE', db_index=True)
+
+    # Mantidos pela API de transição (vehicles.services.change_vehicle_status),
+    # junto com o histórico em VehicleStatusEvent. Servem o relatório de idade do estoque.
+    stock_entry_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Entrada no Estoque")
+    status_changed_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Status Desde")
     
     # Decimais: Sempre use DecimalField para dinheiro. Float gera erros de arredondamento.
     acquisition_cost = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Custo de Aquisição")
@@ -82,11 +89,17 @@ class Vehicle(TenantAwareModel):
     
     notes = models.TextField(null=True, blank=True, verbose_name="Observações")
 
+    # --- Busca ---
+    # Documento normalizado (marca, modelo, placa, chassi, renavam, cor) mantido pelos signals.
+    # Indexado via FTS5 (SQLite) ou pg_trgm (PostgreSQL). Ver vehicles/search.py
+    search_document = models.TextField(default='', blank=True, editable=False)
+
     class Meta:
         verbose_name = "Veículo"
         verbose_name_plural = "Veículos"
         indexes = [
             models.Index(fields=['status', 'model']), # Índice composto para filtros comuns
+            models.Index(fields=['status', 'stock_entry_at']), # Idade do estoque por status
         ]
 
     def __str__(self):
@@ -99,4 +112,133 @@ class Vehicle(TenantAwareModel):
         if self.chassi:
             self.chassi = self.chassi.upper().strip()
         if self.plate:
-            self.plate = self.plate.upper().strip()
\ No newline at end of file
+            self.plate = self.plate.upper().strip()
+
+def vehicle_photo_path(instance, filename):
+    # Original guardado pelo hash do conteúdo: o mesmo arquivo enviado duas vezes ocupa um só lugar
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'jpg'
+    return f"vehicle_photos/originals/{instance.content_hash[:2]}/{instance.content_hash}.{ext}"
+
+
+class VehiclePhoto(TenantAwareModel):
+    """
+    Foto da galeria do veículo. As miniaturas (WebP + JPEG em vários tamanhos) são
+    geradas fora da requisição pelo comando 'process_vehicle_photos' e gravadas
+    com nomes derivados de 'content_hash' (ver vehicles/photos.py).
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Aguardando Miniaturas'),
+        ('PROCESSING', 'Processando'),
+        ('READY', 'Pronta'),
+        ('FAILED', 'Falhou'),
+    ]
+
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='photos', verbose_name="Veículo")
+    image = models.ImageField(upload_to=vehicle_photo_path, max_length=255, verbose_name="Arquivo Original")
+    content_hash = models.CharField(max_length=64, db_index=True, editable=False, verbose_name="Hash do Conteúdo")
+    is_cover = models.BooleanField(default=False, verbose_name="Capa")
+    position = models.PositiveIntegerField(default=0, verbose_name="Ordem")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', db_index=True)
+    # Dimensões já com a rotação do EXIF aplicada
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        verbose_name = "Foto do Veículo"
+        verbose_name_plural = "Fotos dos Veículos"
+        ordering = ['-is_cover', 'position', 'id']
+        indexes = [
+            # Capa de cada carro na listagem do estoque
+            models.Index(fields=['vehicle', 'status', '-is_cover', 'position']),
+        ]
+
+    def __str__(self):
+        return f"Foto {self.id} - Veículo {self.vehicle_id}"
+
+
+class VehicleStatusEvent(models.Model):
+    """
+    Histórico (somente inserção) das mudanças de status de um veículo.
+    Gravado apenas por vehicles.services.record_vehicle_entry() / change_vehicle_status().
+    """
+    SOURCE_CHOICES = [
+        ('ACQUISITION', 'Compra'),
+        ('TRADE_IN', 'Entrada na Troca'),
+        ('IMPORT', 'Importação'),
+        ('MAINTENANCE', 'Ordem de Serviço'),
+        ('SALE', 'Venda'),
+        ('SALE_CANCELED', 'Cancelamento de Venda'),
+        ('MANUAL', 'Edição Manual'),
+    ]
+
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='status_events', verbose_name="Veículo")
+    # Nulo no primeiro evento (entrada do veículo no sistema)
+    from_status = models.CharField(max_length=20, choices=Vehicle.STATUS_CHOICES, null=True, blank=True, verbose_name="De")
+    to_status = models.CharField(max_length=20, choices=Vehicle.STATUS_CHOICES, verbose_name="Para")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name="Origem")
+    occurred_at = models.DateTimeField(default=timezone.now, verbose_name="Data/Hora")
+
+    loja_id = models.IntegerField(default=1, verbose_name="ID da Loja")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='vehiclestatusevent_created_by',
+        verbose_name="Criado por"
+    )
+
+    class Meta:
+        verbose_name = "Evento de Status do Veículo"
+        verbose_name_plural = "Eventos de Status dos Veículos"
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            models.Index(fields=['vehicle', 'occurred_at']), # Linha do tempo de um carro
+            models.Index(fields=['to_status', 'occurred_at']), # Ex: vendas/entradas no período
+        ]
+
+    def __str__(self):
+        return f"{self.vehicle_id}: {self.from_status or '-'} -> {self.to_status}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValidationError("Eventos de status não podem ser alterados.")
+        super().save(*args, **kwargs)
+
+
+class VehicleProfitability(models.Model):
+    """
+    Tabela DERIVADA (cache) do resultado de cada veículo, lida pelo Relatório de ROI.
+    Não edite na mão: é mantida por vehicles.services.refresh_vehicle_profitability()
+    e pode ser reconstruída com 'manage.py rebuild_vehicle_profitability'.
+    """
+    vehicle = models.OneToOneField(
+        Vehicle,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='profitability',
+        verbose_name="Veículo"
+    )
+    is_sold = models.BooleanField(default=False, verbose_name="Vendido")
+
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Receita da Venda")
+    acquisition_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Custo de Aquisição")
+    maintenance_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Custo Oficina")
+    # Demais lançamentos com o carro como centro de custo (despachante, frete, bônus...)
+    other_costs = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Outros Custos")
+    profit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Lucro Real")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    class Meta:
+        verbose_name = "Lucratividade do Veículo"
+        verbose_name_plural = "Lucratividade dos Veículos"
+        indexes = [
+            # Serve o relatório: WHERE is_sold ORDER BY vehicle_id DESC
+            models.Index(fields=['is_sold', '-vehicle']),
+        ]
+
+    def __str__(self):
+        return f"ROI {self.vehicle_id}: R$ {self.profit}"
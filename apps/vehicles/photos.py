@@ -0,0 +1,151 @@
+import hashlib
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Variantes geradas para cada foto: tamanho (maior lado, em px)
+THUMBNAIL_SIZES = {'sm': 160, 'md': 480, 'lg': 1280}
+
+# WebP para navegadores modernos e JPEG como alternativa (<picture>)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+THUMBNAIL_DIR = 'vehicle_photos/thumbs'
+
+EXIF_ORIENTATION = 0x0112
+
+
+def hash_file(file):
+    """ SHA-256 do arquivo enviado, lido em blocos (não carrega tudo na memória). """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def thumbnail_name(content_hash, size, ext):
+    """
+    Nome da variante derivado do conteúdo do original: se a foto muda, o nome muda.
+    Por isso os arquivos podem ser servidos com cache "imutável" no navegador.
+    """
+    return f"{THUMBNAIL_DIR}/{content_hash[:2]}/{content_hash}-{THUMBNAIL_SIZES[size]}.{ext}"
+
+
+def thumbnail_url(content_hash, size, ext):
+    return default_storage.url(thumbnail_name(content_hash, size, ext))
+
+
+def _to_rgb(img):
+    # JPEG não tem transparência: PNG/WebP com alpha ganham fundo branco
+    if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def generate_thumbnails(photo):
+    """
+    Gera as variantes que ainda não existem no storage.
+    Roda no worker (comando 'process_vehicle_photos'), nunca na requisição.
+    Retorna (largura, altura) do original já considerando a rotação do EXIF.
+    """
+    names = [
+        thumbnail_name(photo.content_hash, size, ext)
+        for size in THUMBNAIL_SIZES for ext in THUMBNAIL_FORMATS
+    ]
+    largest = max(THUMBNAIL_SIZES.values())
+
+    with default_storage.open(photo.image.name, 'rb') as f:
+        img = Image.open(f)
+        width, height = img.size
+        if img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+            width, height = height, width
+
+        # Mesmo conteúdo já processado (foto repetida em outro carro)
+        if all(default_storage.exists(name) for name in names):
+            return width, height
+
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8) quando o original é muito maior
+        img.draft('RGB', (largest, largest))
+        img = _to_rgb(ImageOps.exif_transpose(img))
+        img.load()
+
+    # Do maior para o menor: cada variante é reduzida a partir da anterior
+    for size, px in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        img.thumbnail((px, px), Image.Resampling.LANCZOS)
+        for ext, (fmt, options) in THUMBNAIL_FORMATS.items():
+            name = thumbnail_name(photo.content_hash, size, ext)
+            if default_storage.exists(name):
+                continue
+            buffer = BytesIO()
+            img.save(buffer, fmt, **options)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    return width, height
+
+
+def process_pending_photos(limit=50):
+    """
+    Consome a fila de fotos PENDING. Cada foto é "reservada" com um UPDATE condicional,
+    então vários workers podem rodar ao mesmo tempo sem processar a mesma foto.
+    """
+    from .models import VehiclePhoto
+
+    processed = 0
+    pending = VehiclePhoto.objects.filter(status='PENDING').order_by('id').values_list('id', flat=True)[:limit]
+    for photo_id in list(pending):
+        claimed = VehiclePhoto.objects.filter(id=photo_id, status='PENDING').update(
+            status='PROCESSING', updated_at=timezone.now()
+        )
+        if not claimed:
+            continue
+
+        photo = VehiclePhoto.objects.get(id=photo_id)
+        try:
+            width, height = generate_thumbnails(photo)
+        except Exception as e:
+            # Arquivo corrompido/ausente não pode derrubar o worker
+            VehiclePhoto.objects.filter(id=photo_id).update(status='FAILED', error=str(e), updated_at=timezone.now())
+        else:
+            VehiclePhoto.objects.filter(id=photo_id).update(
+                status='READY', width=width, height=height, error='', updated_at=timezone.now()
+            )
+        processed += 1
+    return processed
+
+
+def requeue_photos(stale_minutes=15, include_failed=False):
+    """ Devolve para a fila fotos presas em PROCESSING (worker interrompido) e, opcionalmente, as FAILED. """
+    from .models import VehiclePhoto
+
+    stale = VehiclePhoto.objects.filter(
+        status='PROCESSING', updated_at__lt=timezone.now() - timedelta(minutes=stale_minutes)
+    )
+    count = stale.update(status='PENDING')
+    if include_failed:
+        count += VehiclePhoto.objects.filter(status='FAILED').update(status='PENDING', error='')
+    return count
+
+
+def delete_photo_files(content_hash, image_name):
+    """ Remove original e variantes, desde que nenhuma outra foto use o mesmo conteúdo. """
+    from .models import VehiclePhoto
+
+    if VehiclePhoto.objects.filter(content_hash=content_hash).exists():
+        return
+    names = [image_name] + [
+        thumbnail_name(content_hash, size, ext)
+        for size in THUMBNAIL_SIZES for ext in THUMBNAIL_FORMATS
+    ]
+    for name in names:
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
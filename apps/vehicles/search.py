@@ -0,0 +1,135 @@
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Tabela virtual FTS5 (apenas SQLite). No PostgreSQL a busca usa o índice
+# GIN (pg_trgm) criado direto na coluna Vehicle.search_document.
+FTS_TABLE = 'vehicles_vehicle_fts'
+
+# O tokenizer 'trigram' só indexa sequências de 3+ caracteres.
+TRIGRAM_MIN_LENGTH = 3
+
+
+def normalize(text):
+    """ Minúsculas e sem acentos: 'Citroën C4' -> 'citroen c4' """
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def build_search_document(vehicle):
+    """ Texto único indexado: marca, modelo, placa, chassi, renavam e cor. """
+    model = vehicle.model
+    parts = [
+        model.brand.name, model.name,
+        vehicle.plate, vehicle.chassi, vehicle.renavam, vehicle.color,
+    ]
+    return normalize(' '.join(p for p in parts if p))
+
+
+# Aliases de banco em que a tabela FTS já foi encontrada (listar as tabelas a cada
+# save/busca custa caro). Só o "sim" fica guardado: enquanto a migration não rodou,
+# a tabela continua sendo procurada.
+_fts_aliases = set()
+
+
+def fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_aliases:
+        if FTS_TABLE not in connection.introspection.table_names():
+            return False
+        _fts_aliases.add(connection.alias)
+    return True
+
+
+_local = threading.local()
+
+
+@contextmanager
+def search_sync_paused():
+    """
+    Dentro do bloco os signals de Vehicle não mexem na tabela FTS (um comando por carro);
+    quem chamou sincroniza os carros todos de uma vez com sync_fts. Vale só para a thread atual.
+    """
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = False
+
+
+def search_sync_is_paused():
+    return getattr(_local, 'paused', False)
+
+
+def sync_fts(vehicle_ids, delete=False):
+    """
+    Atualiza a tabela FTS5 para os veículos informados.
+    Sem efeito fora do SQLite (o índice pg_trgm é mantido pelo próprio banco).
+    """
+    if not vehicle_ids or not fts_available():
+        return
+    from .models import Vehicle
+
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(vehicle_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(vehicle_ids))
+        if delete:
+            return
+        rows = Vehicle.objects.filter(id__in=vehicle_ids).values_list('id', 'search_document')
+        cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, document) VALUES (%s, %s)", list(rows))
+
+
+def reindex_vehicles(queryset):
+    """
+    Recalcula o documento de busca de vários veículos de uma vez.
+    Usado quando Marca/Modelo são renomeados e por caminhos que não disparam signals
+    (bulk_create, update(), etc.).
+    """
+    from .models import Vehicle
+
+    vehicles = list(queryset.select_related('model__brand'))
+    for vehicle in vehicles:
+        vehicle.search_document = build_search_document(vehicle)
+    Vehicle.objects.bulk_update(vehicles, ['search_document'], batch_size=500)
+    sync_fts([v.id for v in vehicles])
+    return len(vehicles)
+
+
+def search_vehicles(queryset, query):
+    """
+    Filtra o queryset pelo termo digitado na busca do estoque.
+
+    1. Placa ou chassi exatos vão direto para os índices únicos (sem LIKE).
+    2. Caso contrário, cada palavra precisa aparecer no documento de busca:
+       - SQLite: MATCH na tabela FTS5 (tokenizer trigram, busca por trecho);
+       - PostgreSQL: LIKE no documento, servido pelo índice GIN pg_trgm.
+    """
+    term = query.strip()
+    if not term:
+        return queryset
+
+    # 1. Atalho pelos índices únicos (placa/chassi são salvos em maiúsculas)
+    exact = queryset.filter(Q(plate=term.upper()) | Q(chassi=term.upper()))
+    if exact.exists():
+        return exact
+
+    # 2. Busca por palavras no documento normalizado
+    words = normalize(term).split()
+    indexed = [w for w in words if len(w) >= TRIGRAM_MIN_LENGTH]
+
+    if indexed and fts_available():
+        # Cada palavra vira uma frase entre aspas ("..." AND "...")
+        match = ' AND '.join('"{}"'.format(w.replace('"', '""')) for w in indexed)
+        queryset = queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+        ))
+        words = [w for w in words if len(w) < TRIGRAM_MIN_LENGTH]
+
+    for word in words:
+        queryset = queryset.filter(search_document__contains=word)
+    return queryset
@@ -1,9 +1,94 @@
-from django.db import transaction
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Sum, Max, F, Case, When, Value, DecimalField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Vehicle
+from .models import Vehicle, VehicleProfitability, VehicleStatusEvent, VehiclePhoto, Model
+from .catalog import get_catalog
+from .search import build_search_document, sync_fts
+from .photos import hash_file
 from parties.models import Entity
 from financial.models import Ledger, ChartOfAccounts
+from financial.cashflow import invalidate_cash_flow
+from financial.journal import post_ledger_accrual, post_accruals
+
+# Lançamentos que o próprio sistema gera com o carro como centro de custo.
+# Já estão representados em Vehicle.acquisition_cost e ServiceOrder.total_cost,
+# então ficam fora de 'other_costs' para não contar duas vezes.
+VEHICLE_GENERATED_ACCOUNTS = ['2.01', '3.01']
+
+# Status em que o carro está no pátio (entram no relatório de idade do estoque)
+IN_STOCK_STATUSES = ['AVAILABLE', 'MAINTENANCE', 'RESERVED']
+
+
+def record_vehicle_entry(vehicles, user, source):
+    """
+    Grava o evento inicial (entrada no sistema) de veículos recém-criados.
+    Aceita vários carros de uma vez (Ex: importação em lote).
+    """
+    VehicleStatusEvent.objects.bulk_create([
+        VehicleStatusEvent(
+            vehicle=vehicle,
+            from_status=None,
+            to_status=vehicle.status,
+            source=source,
+            occurred_at=vehicle.status_changed_at,
+            loja_id=vehicle.loja_id,
+            created_by=user,
+        )
+        for vehicle in vehicles
+    ])
+
+
+def change_vehicle_status(vehicle, new_status, user, source, commit=True):
+    """
+    ÚNICO ponto do sistema que muda o status de um veículo existente
+    (a versão em lote, change_vehicles_status, segue as mesmas regras).
+    Registra o evento no histórico e atualiza 'status_changed_at'.
+
+    Com commit=False apenas prepara a instância (quem chamou salva junto com
+    outras alterações, Ex: troca de dono na venda). Deve rodar dentro de uma transação.
+    """
+    changed = change_vehicles_status([(vehicle, new_status, source)], user)
+    if commit and changed:
+        vehicle.save(update_fields=['status', 'status_changed_at', 'updated_at'])
+    return vehicle
+
+
+def change_vehicles_status(changes, user):
+    """
+    Muda o status de vários veículos: 'changes' é uma lista de (veículo, novo status, origem).
+    Prepara as instâncias (sem salvar: quem chamou grava com um bulk_update) e registra
+    todos os eventos do histórico num único bulk_create. Retorna os veículos alterados.
+    """
+    now = timezone.now()
+    changed, events = [], []
+    for vehicle, new_status, source in changes:
+        if new_status not in dict(Vehicle.STATUS_CHOICES):
+            raise ValidationError(f"Status de veículo inválido: {new_status}.")
+        if vehicle.status == new_status:
+            continue
+
+        events.append(VehicleStatusEvent(
+            vehicle=vehicle,
+            from_status=vehicle.status,
+            to_status=new_status,
+            source=source,
+            occurred_at=now,
+            loja_id=vehicle.loja_id,
+            created_by=user,
+        ))
+        vehicle.status = new_status
+        vehicle.status_changed_at = now
+        changed.append(vehicle)
+
+    VehicleStatusEvent.objects.bulk_create(events)
+    return changed
+
 
 def register_vehicle_acquisition(vehicle_data, seller_data, user, loja_id=1):
     """
@@ -53,6 +138,7 @@ def register_vehicle_acquisition(vehicle_data, seller_data, user, loja_id=1):
             loja_id=loja_id,
             created_by=user
         )
+        record_vehicle_entry([vehicle], user, source='ACQUISITION')
 
         # 4. Gerar Financeiro (Obrigação de Pagar a Compra)
         # Só gera se houver custo de aquisição > 0
@@ -62,7 +148,7 @@ def register_vehicle_acquisition(vehicle_data, seller_data, user, loja_id=1):
             except ChartOfAccounts.DoesNotExist:
                 raise ValidationError("Erro Crítico: Categoria contábil '2.01' não encontrada.")
 
-            Ledger.objects.create(
+            ledger = Ledger.objects.create(
                 entity=seller, # Devemos ao Vendedor
                 chart_of_accounts=categoria_aquisicao,
                 vehicle=vehicle, # Centro de custo
@@ -74,5 +160,386 @@ def register_vehicle_acquisition(vehicle_data, seller_data, user, loja_id=1):
                 loja_id=loja_id,
                 created_by=user
             )
+            post_ledger_accrual(ledger, user)
+
+        refresh_vehicle_profitability([vehicle.id])
+
+    return vehicle
+
+
+def _sum_subquery(queryset, expression):
+    """ Soma agrupada por veículo, para usar como coluna (evita JOINs multiplicando linhas). """
+    money = DecimalField(max_digits=12, decimal_places=2)
+    total = queryset.values('vehicle').annotate(total=Sum(expression, output_field=money)).values('total')
+    return Coalesce(Subquery(total, output_field=money), Value(Decimal('0.00')), output_field=money)
+
+
+def _profitability_rows(vehicles):
+    """ Calcula (sem salvar) as linhas de VehicleProfitability com uma única query. """
+    from maintenance.models import ServiceOrder
+    from negotiations.models import NegotiationItem
+
+    vehicles = vehicles.annotate(
+        calc_maintenance=_sum_subquery(
+            ServiceOrder.objects.filter(vehicle=OuterRef('pk')).exclude(status='CANCELED'),
+            F('total_cost')
+        ),
+        calc_other=_sum_subquery(
+            Ledger.objects.filter(vehicle=OuterRef('pk'))
+            .exclude(status='CANCELED')
+            .exclude(chart_of_accounts__code__in=VEHICLE_GENERATED_ACCOUNTS),
+            # A Pagar é custo; A Receber (Ex: bônus de fábrica) abate o custo
+            Case(When(transaction_type='PAYABLE', then=F('total_value')), default=-F('total_value'))
+        ),
+        calc_revenue=_sum_subquery(
+            NegotiationItem.objects.filter(vehicle=OuterRef('pk'), flow='OUT', negotiation__status='APPROVED'),
+            F('agreed_value')
+        ),
+    ).values('id', 'status', 'acquisition_cost', 'sale_price', 'calc_maintenance', 'calc_other', 'calc_revenue')
+
+    for v in vehicles.iterator(chunk_size=1000):
+        is_sold = v['status'] == 'SOLD'
+        # Receita real = valor acordado na venda; se o carro foi baixado como vendido
+        # fora de uma negociação, usamos o preço de venda cadastrado.
+        revenue = v['calc_revenue'] or (v['sale_price'] if is_sold else Decimal('0.00'))
+        yield VehicleProfitability(
+            vehicle_id=v['id'],
+            is_sold=is_sold,
+            revenue=revenue,
+            acquisition_cost=v['acquisition_cost'],
+            maintenance_cost=v['calc_maintenance'],
+            other_costs=v['calc_other'],
+            profit=revenue - v['acquisition_cost'] - v['calc_maintenance'] - v['calc_other'],
+        )
+
+
+def refresh_vehicle_profitability(vehicle_ids):
+    """
+    Recalcula o ROI apenas dos veículos afetados por uma operação
+    (aquisição, OS, venda, estorno, lançamento manual).
+    """
+    vehicle_ids = {vid for vid in vehicle_ids if vid}
+    if not vehicle_ids:
+        return
+
+    rows = list(_profitability_rows(Vehicle.objects.filter(id__in=vehicle_ids)))
+    VehicleProfitability.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['vehicle'],
+        update_fields=['is_sold', 'revenue', 'acquisition_cost', 'maintenance_cost', 'other_costs', 'profit', 'updated_at'],
+    )
+
+
+def rebuild_vehicle_profitability(batch_size=1000):
+    """ Reconstrói a tabela inteira (correção de divergências). Retorna o nº de veículos. """
+    total = 0
+    with transaction.atomic():
+        VehicleProfitability.objects.all().delete()
+        batch = []
+        for row in _profitability_rows(Vehicle.objects.all()):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                VehicleProfitability.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        VehicleProfitability.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+# --- IMPORTAÇÃO EM LOTE (LEILÕES) ---
+
+IMPORT_REQUIRED_FIELDS = [
+    'brand', 'model', 'chassi', 'year_fab', 'year_model', 'color',
+    'acquisition_cost', 'sale_price', 'seller_name', 'seller_document',
+]
+
+
+def iter_import_rows(stream, fmt='csv'):
+    """
+    Lê o arquivo linha a linha (sem carregar tudo na memória).
+    Gera tuplas (nº da linha, dict). Linhas JSONL inválidas viram dict vazio
+    e serão reportadas como erro pela validação.
+    """
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = {}
+            yield line_no, data if isinstance(data, dict) else {}
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # line_num = linha física do arquivo (o cabeçalho é a linha 1)
+            yield reader.line_num, row
+
+
+class VehicleImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # [(linha, mensagem)]
+
+    def add_error(self, line_no, message):
+        self.errors.append((line_no, message))
+
+
+def _clean_import_row(data, resolve_model):
+    """ Valida e converte uma linha. Retorna (dados, None) ou (None, erro). """
+    data = {k: (str(v).strip() if v is not None else '') for k, v in data.items()}
+
+    missing = [f for f in IMPORT_REQUIRED_FIELDS if not data.get(f)]
+    if missing:
+        return None, f"Campos obrigatórios ausentes: {', '.join(missing)}"
+
+    model = resolve_model(data['brand'], data['model'])
+    if model is None:
+        return None, f"Modelo '{data['brand']} {data['model']}' não cadastrado."
+
+    try:
+        cleaned = {
+            'model': model,
+            'chassi': data['chassi'].upper(),
+            'plate': data.get('plate', '').upper() or None,
+            'renavam': data.get('renavam') or None,
+            'year_fab': int(data['year_fab']),
+            'year_model': int(data['year_model']),
+            'color': data['color'],
+            'fuel_type': data.get('fuel_type') or 'FLEX',
+            'mileage': int(data.get('mileage') or 0),
+            'acquisition_cost': Decimal(data['acquisition_cost'].replace(',', '.')),
+            'sale_price': Decimal(data['sale_price'].replace(',', '.')),
+            'notes': data.get('notes', ''),
+        }
+    except (ValueError, InvalidOperation):
+        return None, "Ano, quilometragem ou valores em formato inválido."
+
+    if cleaned['fuel_type'] not in dict(Vehicle.FUEL_CHOICES):
+        return None, f"Combustível '{cleaned['fuel_type']}' inválido."
+    if cleaned['mileage'] < 0 or cleaned['acquisition_cost'] < 0:
+        return None, "Quilometragem e custo não podem ser negativos."
+
+    seller = {
+        'name': data['seller_name'],
+        'document': ''.join(filter(str.isdigit, data['seller_document'])),
+    }
+    if not seller['document']:
+        return None, "Documento do vendedor inválido."
+    return (cleaned, seller), None
+
+
+def _resolve_sellers(sellers, user, loja_id):
+    """ Busca os vendedores do lote em 1 query e cria os que faltam com bulk_create. """
+    documents = {s['document']: s for s in sellers}
+    found = {e.documento_principal: e for e in Entity.objects.filter(documento_principal__in=documents)}
+
+    missing = [
+        Entity(
+            documento_principal=doc,
+            nome_razao_social=data['name'],
+            tipo_entidade='FISICA' if len(doc) <= 11 else 'JURIDICA',
+            loja_id=loja_id,
+            created_by=user,
+        )
+        for doc, data in documents.items() if doc not in found
+    ]
+    if missing:
+        # ignore_conflicts: outro processo pode ter criado o mesmo documento no meio tempo
+        Entity.objects.bulk_create(missing, ignore_conflicts=True)
+        found.update({
+            e.documento_principal: e
+            for e in Entity.objects.filter(documento_principal__in=[m.documento_principal for m in missing])
+        })
+    return found
+
+
+def _insert_import_batch(batch, user, loja_id, loja_entity, categoria_aquisicao, result):
+    """
+    Grava um lote em uma única transação: bulk_create dos veículos e dos Contas a Pagar.
+    Se o lote inteiro falhar por integridade (Ex: chassi inserido por outro usuário
+    durante a importação), refaz linha a linha para isolar apenas as linhas com erro.
+    """
+    if not batch:
+        return
+
+    try:
+        with transaction.atomic():
+            sellers = _resolve_sellers([seller for _, (_, seller) in batch], user, loja_id)
+            vehicles = []
+            for _, (data, seller) in batch:
+                vehicle = Vehicle(
+                    **data,
+                    status='AVAILABLE',
+                    current_owner=loja_entity or sellers[seller['document']],
+                    loja_id=loja_id,
+                    created_by=user,
+                )
+                # bulk_create não dispara signals: montamos o documento de busca aqui
+                vehicle.search_document = build_search_document(vehicle)
+                vehicles.append(vehicle)
+            Vehicle.objects.bulk_create(vehicles)
+            record_vehicle_entry(vehicles, user, source='IMPORT')
+
+            today = timezone.now().date()
+            ledgers = Ledger.objects.bulk_create([
+                Ledger(
+                    entity=sellers[seller['document']],
+                    chart_of_accounts=categoria_aquisicao,
+                    vehicle=vehicle,
+                    total_value=vehicle.acquisition_cost,
+                    transaction_type='PAYABLE',
+                    status='OPEN',
+                    due_date=today,
+                    description=f"Aquisição Veículo {vehicle.model} Placa {vehicle.plate}",
+                    loja_id=loja_id,
+                    created_by=user,
+                )
+                for vehicle, (_, (_, seller)) in zip(vehicles, batch)
+                if vehicle.acquisition_cost > 0
+            ])
+            invalidate_cash_flow()
+            if ledgers:
+                post_accruals(ledgers, user, description=f"Importação de {len(ledgers)} veículos")
+
+            vehicle_ids = [v.id for v in vehicles]
+            sync_fts(vehicle_ids)
+            refresh_vehicle_profitability(vehicle_ids)
+        result.created += len(vehicles)
+    except IntegrityError:
+        if len(batch) == 1:
+            line_no = batch[0][0]
+            result.add_error(line_no, "Chassi ou placa já cadastrados.")
+            return
+        for item in batch:
+            _insert_import_batch([item], user, loja_id, loja_entity, categoria_aquisicao, result)
+
+
+def import_vehicles(rows, user, loja_id=1, batch_size=500):
+    """
+    Importa veículos em lote (Ex: lotes de leilão) a partir de um iterável de
+    (nº da linha, dict), como o gerado por iter_import_rows().
+
+    - Marca/Modelo, Loja e Categoria '2.01' são resolvidos UMA vez por arquivo.
+    - Vendedores são resolvidos/criados por lote.
+    - Veículos e Ledgers entram com bulk_create, um lote por transação.
+    - Linhas inválidas são reportadas no resultado sem abortar o arquivo.
+    """
+    result = VehicleImportResult()
+
+    try:
+        categoria_aquisicao = ChartOfAccounts.objects.get(code='2.01') # Custo Aquisição
+    except ChartOfAccounts.DoesNotExist:
+        raise ValidationError("Erro Crítico: Categoria contábil '2.01' não encontrada.")
+
+    # Mesmo fallback do cadastro unitário: sem a Loja, o dono é o próprio vendedor
+    loja_entity = Entity.objects.filter(id=loja_id).first()
+
+    # Marca/Modelo resolvidos pelo catálogo em memória; só os modelos realmente
+    # usados no arquivo são carregados (com a marca, para o documento de busca)
+    catalog = get_catalog()
+    models_by_id = {}
+
+    def resolve_model(brand_name, model_name):
+        model_id = catalog.find_model(catalog.find_brand(brand_name), model_name)
+        if model_id is None:
+            return None
+        if model_id not in models_by_id:
+            models_by_id[model_id] = Model.objects.select_related('brand').get(id=model_id)
+        return models_by_id[model_id]
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        seen_chassi = set()
+        seen_plate = set()
+        for line_no, data in chunk:
+            cleaned, error = _clean_import_row(data, resolve_model)
+            if error:
+                result.add_error(line_no, error)
+                continue
+            vehicle_data = cleaned[0]
+            if vehicle_data['chassi'] in seen_chassi or (vehicle_data['plate'] and vehicle_data['plate'] in seen_plate):
+                result.add_error(line_no, "Chassi ou placa repetidos no arquivo.")
+                continue
+            seen_chassi.add(vehicle_data['chassi'])
+            if vehicle_data['plate']:
+                seen_plate.add(vehicle_data['plate'])
+            batch.append((line_no, cleaned))
+
+        # Duplicados já existentes no banco: 1 query por lote (índices únicos)
+        existing = Vehicle.objects.filter(
+            Q(chassi__in=seen_chassi) | Q(plate__in=seen_plate)
+        ).values_list('chassi', 'plate')
+        taken_chassi = {chassi for chassi, _ in existing}
+        taken_plate = {plate for _, plate in existing if plate}
+        valid = []
+        for line_no, cleaned in batch:
+            vehicle_data = cleaned[0]
+            if vehicle_data['chassi'] in taken_chassi or vehicle_data['plate'] in taken_plate:
+                result.add_error(line_no, "Chassi ou placa já cadastrados.")
+            else:
+                valid.append((line_no, cleaned))
+
+        _insert_import_batch(valid, user, loja_id, loja_entity, categoria_aquisicao, result)
+
+    return result
+
+
+# --- FOTOS ---
+
+def add_vehicle_photos(vehicle, files, user):
+    """
+    Grava os originais e enfileira as fotos para o worker gerar as miniaturas.
+    Conteúdo repetido (mesmo hash) reaproveita o arquivo e as miniaturas já existentes.
+    """
+    with transaction.atomic():
+        last_position = vehicle.photos.aggregate(last=Max('position'))['last'] or 0
+        has_cover = vehicle.photos.filter(is_cover=True).exists()
+
+        photos = []
+        for i, file in enumerate(files, start=1):
+            photo = VehiclePhoto(
+                vehicle=vehicle,
+                content_hash=hash_file(file),
+                position=last_position + i,
+                is_cover=not has_cover and i == 1,
+                loja_id=vehicle.loja_id,
+                created_by=user,
+            )
+            same_content = VehiclePhoto.objects.filter(content_hash=photo.content_hash)
+            existing = same_content.filter(status='READY').first() or same_content.first()
+            if existing:
+                photo.image.name = existing.image.name
+                if existing.status == 'READY':
+                    photo.status, photo.width, photo.height = 'READY', existing.width, existing.height
+            else:
+                photo.image.save(file.name, file, save=False)
+            photo.save()
+            photos.append(photo)
+    return photos
+
+
+def set_vehicle_cover(photo):
+    with transaction.atomic():
+        VehiclePhoto.objects.filter(vehicle_id=photo.vehicle_id, is_cover=True).update(is_cover=False)
+        VehiclePhoto.objects.filter(id=photo.id).update(is_cover=True)
+
+
+def delete_vehicle_photo(photo):
+    """ Remove a foto; se era a capa, a próxima da galeria assume. """
+    with transaction.atomic():
+        was_cover = photo.is_cover
+        vehicle_id = photo.vehicle_id
+        photo.delete() # Arquivos são apagados após o COMMIT (signal post_delete)
 
-    return vehicle
\ No newline at end of file
+        if was_cover:
+            next_photo = VehiclePhoto.objects.filter(vehicle_id=vehicle_id).order_by('position', 'id').first()
+            if next_photo:
+                set_vehicle_cover(next_photo)
@@ -0,0 +1,54 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import Brand, Model, Vehicle, VehiclePhoto
+from .search import build_search_document, sync_fts, reindex_vehicles, search_sync_is_paused
+from .catalog import invalidate_catalog
+from .photos import delete_photo_files
+
+
+@receiver(pre_save, sender=Vehicle)
+def vehicle_build_search_document(sender, instance, **kwargs):
+    instance.search_document = build_search_document(instance)
+
+
+@receiver(post_save, sender=Vehicle)
+def vehicle_sync_search_index(sender, instance, **kwargs):
+    if not search_sync_is_paused():
+        sync_fts([instance.id])
+
+
+@receiver(post_delete, sender=Vehicle)
+def vehicle_remove_search_index(sender, instance, **kwargs):
+    if not search_sync_is_paused():
+        sync_fts([instance.id], delete=True)
+
+
+# Renomear Marca/Modelo muda o documento de todos os veículos vinculados
+@receiver(post_save, sender=Model)
+def model_reindex_vehicles(sender, instance, created, **kwargs):
+    if not created:
+        reindex_vehicles(Vehicle.objects.filter(model=instance))
+
+
+@receiver(post_save, sender=Brand)
+def brand_reindex_vehicles(sender, instance, created, **kwargs):
+    if not created:
+        reindex_vehicles(Vehicle.objects.filter(model__brand=instance))
+
+
+# Qualquer mudança em Marca/Modelo invalida o catálogo em memória de todos os workers
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Model)
+@receiver(post_delete, sender=Model)
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+# Arquivos da foto só saem do disco depois do COMMIT (um rollback manteria o registro)
+@receiver(post_delete, sender=VehiclePhoto)
+def vehicle_photo_delete_files(sender, instance, **kwargs):
+    content_hash, image_name = instance.content_hash, instance.image.name
+    transaction.on_commit(lambda: delete_photo_files(content_hash, image_name))
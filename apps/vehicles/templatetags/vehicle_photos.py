@@ -0,0 +1,19 @@
+from django import template
+
+from vehicles.photos import THUMBNAIL_SIZES, thumbnail_url
+
+register = template.Library()
+
+
+@register.inclusion_tag('vehicles/partials/photo_picture.html')
+def vehicle_thumb(content_hash, size='sm', alt='', css_class='', width=None):
+    """
+    <picture> com a variante WebP e o JPEG de reserva de uma foto já processada.
+    Só monta URLs a partir do hash: nenhum arquivo é aberto na requisição.
+    Uso: {% vehicle_thumb v.cover_hash 'sm' alt=v.model width=64 %}
+    """
+    context = {'alt': alt, 'css_class': css_class, 'width': width or THUMBNAIL_SIZES[size]}
+    if content_hash:
+        context['webp'] = thumbnail_url(content_hash, size, 'webp')
+        context['jpg'] = thumbnail_url(content_hash, size, 'jpg')
+    return context
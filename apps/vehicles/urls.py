@@ -4,9 +4,14 @@ from . import views
 urlpatterns = [
     path('', views.vehicle_list, name='vehicle_list'),
     path('add/', views.vehicle_create, name='vehicle_create'), # Nova rota
+    path('export/', views.vehicle_export, name='vehicle_export'),
     path('<int:pk>/edit/', views.vehicle_update, name='vehicle_update'),
     path('<int:pk>/delete/', views.vehicle_delete, name='vehicle_delete'),
+    path('<int:pk>/photos/', views.vehicle_photo_upload, name='vehicle_photo_upload'),
+    path('photos/<int:pk>/cover/', views.vehicle_photo_cover, name='vehicle_photo_cover'),
+    path('photos/<int:pk>/delete/', views.vehicle_photo_delete, name='vehicle_photo_delete'),
     path('reports/roi/', views.vehicle_roi_report, name='vehicle_roi_report'),
+    path('reports/aging/', views.vehicle_aging_report, name='vehicle_aging_report'),
 
     path('ajax/load-models/', views.load_models, name='load_models'),
 
@@ -1,17 +1,27 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from .forms import VehicleAcquisitionForm
-from .services import register_vehicle_acquisition
+from .services import register_vehicle_acquisition, refresh_vehicle_profitability, change_vehicle_status, IN_STOCK_STATUSES
+from .services import add_vehicle_photos, set_vehicle_cover, delete_vehicle_photo
+from .search import search_vehicles
 from django.contrib.auth.decorators import login_required
+from core.pagination import paginate_keyset
+from core.exports import stream_csv, money, EXPORT_CHUNK_SIZE
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+from .catalog import get_catalog, catalog_version
 
 from django.shortcuts import render, redirect, get_object_or_404 
-from .forms import VehicleAcquisitionForm, VehicleEditForm
+from .forms import VehicleAcquisitionForm, VehicleEditForm, VehiclePhotoUploadForm
 from django.db.models import Q, ProtectedError # <--- VERIFIQUE ESTE IMPORT
 
-from django.db.models import Sum, F, DecimalField, Value
-from django.db.models.functions import Coalesce
-from .models import Vehicle, Brand, Model
+from datetime import timedelta
+from django.utils import timezone
+from django.db.models import Sum, Count, Avg, F, ExpressionWrapper, DurationField, OuterRef, Subquery
+from django.db.models.functions import Now
+from .models import Vehicle, Brand, Model, VehicleProfitability, VehicleStatusEvent, VehiclePhoto
 from .models import Brand # Importe o modelo Brand
 from .forms import BrandForm # Importe o novo formulário
 
@@ -19,31 +29,41 @@ from .forms import BrandForm # Importe o novo formulário
 from .forms import ModelForm # Importe o novo formulário
 
 
-# --- VIEW 1: Listagem (Passo 7 - HTMX) ---
-@login_required
-def vehicle_list(request):
+def _filter_vehicles(request, vehicles):
+    """ Filtros da tela de estoque (?q= e ?status=), compartilhados com a exportação. """
     query = request.GET.get('q', '')
     status_filter = request.GET.get('status', '')
 
-    # Otimização: select_related para evitar N+1 queries
-    vehicles = Vehicle.objects.all().select_related('model', 'model__brand', 'current_owner')
-
     if query:
-        vehicles = vehicles.filter(
-            Q(model__name__icontains=query) | 
-            Q(plate__icontains=query) |
-            Q(chassi__icontains=query)
-        )
+        # Índice de busca (FTS5/pg_trgm) em vez de LIKE com JOIN em Modelo
+        vehicles = search_vehicles(vehicles, query)
     
     if status_filter:
         vehicles = vehicles.filter(status=status_filter)
+    return vehicles
+
+
+# --- VIEW 1: Listagem (Passo 7 - HTMX) ---
+@login_required
+def vehicle_list(request):
+    # Otimização: select_related para evitar N+1 queries
+    vehicles = Vehicle.objects.all().select_related('model', 'model__brand', 'current_owner')
+    vehicles = _filter_vehicles(request, vehicles)
+
+    # Hash da foto de capa já processada: a miniatura é montada só com ele
+    cover = VehiclePhoto.objects.filter(vehicle=OuterRef('pk'), status='READY').order_by('-is_cover', 'position', 'id')
+    vehicles = vehicles.annotate(cover_hash=Subquery(cover.values('content_hash')[:1]))
+
+    # Paginação por cursor: mais recentes primeiro, 'id' garante o desempate
+    page = paginate_keyset(request, vehicles, ordering=['-id'])
 
     context = {
-        'vehicles': vehicles,
+        'vehicles': page,
+        'page': page,
         'status_choices': Vehicle.STATUS_CHOICES,
     }
 
-    # SE for HTMX (o usuário digitou algo na busca), retorna só as linhas da tabela
+    # SE for HTMX (busca ou scroll infinito), retorna só as linhas da tabela
     if request.headers.get('HX-Request'):
         return render(request, 'vehicles/partials/vehicle_table_rows.html', context)
     
@@ -51,6 +71,34 @@ def vehicle_list(request):
     return render(request, 'vehicles/vehicle_list.html', context)
 
 
+@login_required
+def vehicle_export(request):
+    """ Exporta o estoque (com os mesmos filtros da tela) em CSV, via streaming. """
+    vehicles = _filter_vehicles(request, Vehicle.objects.all()).order_by('id')
+    status_labels = dict(Vehicle.STATUS_CHOICES)
+    fuel_labels = dict(Vehicle.FUEL_CHOICES)
+
+    def rows():
+        # values() + iterator(): sem instanciar modelos e sem cache do queryset
+        for v in vehicles.values(
+            'model__brand__name', 'model__name', 'plate', 'chassi', 'renavam', 'year_fab', 'year_model',
+            'color', 'fuel_type', 'mileage', 'status', 'acquisition_cost', 'sale_price',
+            'current_owner__nome_razao_social',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                v['model__brand__name'], v['model__name'], v['plate'] or '', v['chassi'], v['renavam'] or '',
+                v['year_fab'], v['year_model'], v['color'], fuel_labels.get(v['fuel_type'], v['fuel_type']),
+                v['mileage'], status_labels.get(v['status'], v['status']),
+                money(v['acquisition_cost']), money(v['sale_price']), v['current_owner__nome_razao_social'],
+            ]
+
+    header = [
+        'Marca', 'Modelo', 'Placa', 'Chassi', 'Renavam', 'Ano Fab.', 'Ano Mod.', 'Cor',
+        'Combustível', 'KM', 'Status', 'Custo Aquisição', 'Preço Venda', 'Proprietário',
+    ]
+    return stream_csv('estoque.csv', header, rows())
+
+
 # --- VIEW 2: Cadastro de Aquisição (Passo 8) ---
 @login_required
 def vehicle_create(request):
@@ -90,9 +138,18 @@ def vehicle_update(request, pk):
     vehicle = get_object_or_404(Vehicle, pk=pk)
 
     if request.method == 'POST':
+        old_status = vehicle.status # O form altera a instância durante a validação
         form = VehicleEditForm(request.POST, instance=vehicle)
         if form.is_valid():
-            form.save() # Aqui podemos usar save direto pois não tem lógica financeira complexa na edição
+            vehicle = form.save(commit=False)
+            new_status = vehicle.status
+            vehicle.status = old_status
+            with transaction.atomic():
+                # Mudança de status passa pela API de transição (fica no histórico)
+                change_vehicle_status(vehicle, new_status, request.user, source='MANUAL', commit=False)
+                vehicle.save()
+            # Status/preço podem mudar o ROI (Ex: baixa manual como vendido)
+            refresh_vehicle_profitability([vehicle.id])
             messages.success(request, f"Veículo {vehicle.plate or vehicle.model} atualizado com sucesso!")
             return redirect('vehicle_list')
     else:
@@ -101,10 +158,49 @@ def vehicle_update(request, pk):
 
     return render(request, 'vehicles/vehicle_edit.html', {
         'form': form,
-        'vehicle': vehicle
+        'vehicle': vehicle,
+        'status_events': vehicle.status_events.select_related('created_by').order_by('-occurred_at', '-id')[:50],
+        'photos': vehicle.photos.all(),
+        'photo_form': VehiclePhotoUploadForm(),
     })
 
 
+# --- FOTOS ---
+
+@login_required
+def vehicle_photo_upload(request, pk):
+    vehicle = get_object_or_404(Vehicle, pk=pk)
+
+    if request.method == 'POST':
+        form = VehiclePhotoUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            photos = add_vehicle_photos(vehicle, form.cleaned_data['photos'], request.user)
+            messages.success(request, f"{len(photos)} foto(s) enviada(s). As miniaturas ficam prontas em instantes.")
+        else:
+            for error in form.errors.get('photos', []):
+                messages.error(request, error)
+
+    return redirect('vehicle_update', pk=vehicle.pk)
+
+
+@login_required
+def vehicle_photo_cover(request, pk):
+    photo = get_object_or_404(VehiclePhoto, pk=pk)
+    if request.method == 'POST':
+        set_vehicle_cover(photo)
+        messages.success(request, "Foto de capa atualizada.")
+    return redirect('vehicle_update', pk=photo.vehicle_id)
+
+
+@login_required
+def vehicle_photo_delete(request, pk):
+    photo = get_object_or_404(VehiclePhoto, pk=pk)
+    if request.method == 'POST':
+        delete_vehicle_photo(photo)
+        messages.success(request, "Foto excluída.")
+    return redirect('vehicle_update', pk=photo.vehicle_id)
+
+
 @login_required
 def vehicle_delete(request, pk):
     vehicle = get_object_or_404(Vehicle, pk=pk)
@@ -127,42 +223,115 @@ def vehicle_delete(request, pk):
 
 @login_required
 def vehicle_roi_report(request):
-    # 1. Busca apenas veículos vendidos
-    # 2. Annotate: Cria uma coluna virtual 'total_maintenance' somando as OS do carro
-    # 3. Coalesce: Se não tiver manutenção, considera 0.00 em vez de None (para não quebrar a conta)
-    sold_vehicles = Vehicle.objects.filter(status='SOLD').annotate(
-        total_maintenance=Coalesce(Sum('service_orders__total_cost'), Value(0, output_field=DecimalField()))
-    ).annotate(
-        # Agora podemos fazer a conta matemática direto no banco
-        real_profit=F('sale_price') - F('acquisition_cost') - F('total_maintenance')
-    ).order_by('-id')
-
-    # Cálculo dos Totais Gerais para o Cabeçalho do Relatório
-    totals = sold_vehicles.aggregate(
-        sum_revenue=Sum('sale_price'),
+    # Lê a tabela materializada (VehicleProfitability) em vez de somar OS e
+    # lançamentos de todos os carros vendidos a cada acesso.
+    # Ela já inclui os demais lançamentos com o carro como centro de custo.
+    sold = VehicleProfitability.objects.filter(is_sold=True)
+
+    rows = sold.select_related('vehicle__model__brand').order_by('-vehicle_id')
+
+    # Totais Gerais para o Cabeçalho do Relatório
+    totals = sold.aggregate(
+        sum_revenue=Sum('revenue'),
         sum_acquisition=Sum('acquisition_cost'),
-        sum_maintenance=Sum('total_maintenance'),
-        sum_profit=Sum('real_profit')
+        sum_maintenance=Sum('maintenance_cost'),
+        sum_other=Sum('other_costs'),
+        sum_profit=Sum('profit')
     )
 
     return render(request, 'vehicles/roi_report.html', {
-        'vehicles': sold_vehicles,
+        'rows': rows,
         'totals': totals
     })
 
+# Faixas de idade do estoque: (rótulo, dias mínimos, dias máximos)
+AGING_BUCKETS = [
+    ('0 a 30 dias', 0, 30),
+    ('31 a 60 dias', 31, 60),
+    ('61 a 90 dias', 61, 90),
+    ('Mais de 90 dias', 91, None),
+]
+
+@login_required
+def vehicle_aging_report(request):
+    """
+    Idade do estoque: quantidade e capital parado por faixa de dias desde a entrada,
+    agrupados por status. As faixas viram COUNT/SUM com FILTER num único GROUP BY
+    (índice status + stock_entry_at); nada é calculado linha a linha em Python.
+    """
+    now = timezone.now()
+    in_stock = Vehicle.objects.filter(status__in=IN_STOCK_STATUSES)
+
+    annotations = {}
+    for i, (_, min_days, max_days) in enumerate(AGING_BUCKETS):
+        bucket = Q(stock_entry_at__lte=now - timedelta(days=min_days))
+        if max_days is not None:
+            bucket &= Q(stock_entry_at__gt=now - timedelta(days=max_days + 1))
+        annotations[f'qty_{i}'] = Count('id', filter=bucket)
+        annotations[f'cost_{i}'] = Sum('acquisition_cost', filter=bucket)
+
+    status_labels = dict(Vehicle.STATUS_CHOICES)
+    rows = []
+    for r in in_stock.values('status').annotate(**annotations).order_by('status'):
+        rows.append({
+            'status': status_labels.get(r['status'], r['status']),
+            'buckets': [(r[f'qty_{i}'], r[f'cost_{i}'] or 0) for i in range(len(AGING_BUCKETS))],
+        })
+    totals = [
+        (sum(r['buckets'][i][0] for r in rows), sum(r['buckets'][i][1] for r in rows))
+        for i in range(len(AGING_BUCKETS))
+    ]
+
+    days = lambda expression: ExpressionWrapper(expression, output_field=DurationField())
+    summary = in_stock.aggregate(
+        avg_in_stock=Avg(days(Now() - F('stock_entry_at'))),
+        avg_in_workshop=Avg(days(Now() - F('status_changed_at')), filter=Q(status='MAINTENANCE')),
+    )
+    # Tempo médio até a venda (vendas dos últimos 90 dias), a partir do histórico
+    summary.update(VehicleStatusEvent.objects.filter(
+        to_status='SOLD', occurred_at__gte=now - timedelta(days=90)
+    ).aggregate(
+        avg_to_sell=Avg(days(F('occurred_at') - F('vehicle__stock_entry_at'))),
+    ))
+
+    oldest = list(in_stock.select_related('model__brand').order_by('stock_entry_at', 'id')[:20])
+    for v in oldest:
+        v.days_in_stock = (now - v.stock_entry_at).days
+        v.days_in_status = (now - v.status_changed_at).days
+
+    return render(request, 'vehicles/aging_report.html', {
+        'bucket_labels': [label for label, _, _ in AGING_BUCKETS],
+        'rows': rows,
+        'totals': totals,
+        'summary': {k: v.days if v is not None else None for k, v in summary.items()},
+        'oldest': oldest,
+    })
+
+def _brand_param(request):
+    try:
+        return int(request.GET.get('brand'))
+    except (TypeError, ValueError):
+        return None
+
+def _load_models_etag(request):
+    # Muda sempre que Marca/Modelo são alterados (versão do catálogo)
+    return f"{catalog_version()}-{_brand_param(request)}"
+
 @login_required
+@condition(etag_func=_load_models_etag)
 def load_models(request):
     """
     View que o HTMX chama para carregar os modelos de uma marca.
+    Servida do catálogo em memória (sem query) e com ETag: se o navegador
+    já tem a lista dessa versão, responde 304 sem corpo.
     """
     # Pega o ID da marca que o HTMX enviou via GET
-    brand_id = request.GET.get('brand') 
-    
-    # Filtra os modelos daquela marca
-    models = Model.objects.filter(brand_id=brand_id).order_by('name')
-    
-    # Renderiza APENAS o HTML dos <option>
-    return render(request, 'vehicles/partials/model_options.html', {'models': models})
+    brand_id = _brand_param(request)
+
+    # Renderiza APENAS o HTML dos <option> (fragmento já pronto no snapshot)
+    response = HttpResponse(get_catalog().model_options_html(brand_id))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 # ... (Mantenha todas as views anteriores: vehicle_list, load_models, etc.) ...
 
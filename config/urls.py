@@ -16,10 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 # 1. Adicione 'include' aqui na importação
-from django.urls import path, include 
+from django.urls import path, re_path, include 
 
 # 2. Importe a view do Dashboard que criamos no Passo 7
-from core.views import dashboard 
+from core.views import dashboard, serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -46,4 +46,7 @@ urlpatterns = [
     path('parties/', include('parties.urls')),
 
     path('employees/', include('employees.urls')),
+
+    # Fotos enviadas (miniaturas com cache longo, ver core.views.serve_media)
+    re_path(r'^media/(?P<path>.*)$', serve_media, name='media'),
 ]